@@ -0,0 +1,86 @@
+"""
+Прогулы: рабочие дни периода, в которые у работника нет ни одной смены.
+
+Матрица присутствия работник x день берется из битовых карт присутствия
+(bitmaps.presence): несколько строк по 46 байт на работника за год вместо
+чтения смен или итогов. Карты включают и дни открытых смен. Прогулы -
+разность матриц "ожидался" (рабочие дни с дня приема) и "был", самый
+долгий прогул подряд - серии в той же матрице, без цикла по работникам
+и дням в Python.
+
+Рабочие дни - дни периода, кроме дней недели ATTENDANCE_DAYS_OFF,
+по вчерашний день включительно: сегодняшний день еще не закончился.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .bitmaps import longest_runs, presence, workdays
+from .models import User
+from .summary import day_start
+
+
+def _period_end(end):
+    """Последний день периода, по которому уже можно считать прогулы"""
+    return min(end, timezone.localdate() - timedelta(days=1))
+
+
+def presence_matrix(start, end, user_id=None):
+    """
+    Присутствие активных работников за период с start по end (но не позже
+    вчерашнего дня): (id работников по возрастанию, дни периода,
+    матрица bool "был", матрица bool "ожидался") размером работники x дни
+    """
+    end = _period_end(end)
+    days = [start + timedelta(days=offset) for offset in range(max((end - start).days + 1, 0))]
+    workers = User.objects.filter(role='worker', is_active=True).order_by('id')
+    if user_id:
+        workers = workers.filter(id=user_id)
+    workers = list(workers.values_list('id', 'date_joined')) if days else []
+    user_ids = np.array([worker_id for worker_id, _ in workers], dtype=np.int64)
+    present = np.zeros((user_ids.size, len(days)), dtype=bool)
+    if not workers:
+        return user_ids, days, present, present.copy()
+
+    # Ожидается: рабочий день недели, закончившийся после приема на работу
+    day_ends = np.array([day_start(day + timedelta(days=1)).timestamp() for day in days])
+    first_day = np.searchsorted(day_ends, [joined.timestamp() for _, joined in workers], side='right')
+    expected = workdays(start, len(days)) & (np.arange(len(days)) >= first_day[:, None])
+
+    ids, matrix = presence(start, end, None if user_id is None else [user_id])
+    # Карты администраторов и уволенных работников в матрицу не входят
+    rows = np.searchsorted(user_ids, ids)
+    known = (rows < user_ids.size) & (user_ids[np.minimum(rows, user_ids.size - 1)] == ids)
+    present[rows[known]] = matrix[known]
+    return user_ids, days, present, expected
+
+
+def absences(start, end, user_id=None):
+    """
+    Прогулы за период: строка на работника с прогулами (число, даты
+    и самый долгий прогул подряд в рабочих днях), по ФИО
+    """
+    user_ids, days, present, expected = presence_matrix(start, end, user_id)
+    absent = expected & ~present
+    counts = absent.sum(axis=1)
+    rows_with_absences = np.flatnonzero(counts)
+    users = {user['id']: user for user in User.objects.filter(
+        id__in=user_ids[rows_with_absences].tolist()
+    ).values('id', 'full_name', 'position')}
+
+    # Выходные прогул не прерывают: серии ищутся только по рабочим дням
+    workday = workdays(start, len(days))
+    workday_dates = [day for day, is_workday in zip(days, workday.tolist()) if is_workday]
+    longest, first = longest_runs(absent[rows_with_absences][:, workday])
+    rows = [
+        {
+            'user': users[int(user_ids[row])],
+            'absent_days': int(counts[row]),
+            'dates': [days[index] for index in np.flatnonzero(absent[row]).tolist()],
+            'longest_absence': int(longest[index]),
+            'longest_absence_start': workday_dates[first[index]],
+        }
+        for index, row in enumerate(rows_with_absences.tolist())
+    ]
+    return sorted(rows, key=lambda row: (row['user']['full_name'], row['user']['id']))
@@ -1,6 +1,15 @@
+import contextlib
+
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Attendance
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection, transaction
+from django.utils.functional import cached_property
+from .models import ArchivedAttendance, User, Attendance
+from .roster import refresh_roster
+from .summary import rebuild_days, work_date
 
 
 @admin.register(User)
@@ -12,24 +21,184 @@ class CustomUserAdmin(UserAdmin):
 
     fieldsets = UserAdmin.fieldsets + (
         ('Дополнительная информация', {
-            'fields': ('role', 'full_name', 'position')
+            'fields': ('role', 'full_name', 'position', 'badge')
         }),
     )
 
     add_fieldsets = UserAdmin.add_fieldsets + (
         ('Дополнительная информация', {
-            'fields': ('role', 'full_name', 'position')
+            'fields': ('role', 'full_name', 'position', 'badge')
         }),
     )
 
+    # ФИО и должности показываются на главной странице и в отчетах,
+    # пропуска работников - в индексе терминалов (kiosk)
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_roster()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_roster()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        refresh_roster()
+
+
+# До стольких строк список в админке считает записи точно
+EXACT_COUNT_LIMIT = 10000
+
+
+def estimated_row_count(model):
+    """
+    Оценка числа строк таблицы без COUNT(*): по статистике БД (ANALYZE),
+    а без нее - по разбросу первичных ключей
+    """
+    table = model._meta.db_table
+    estimate = None
+    # Внутри транзакции - точка сохранения: в PostgreSQL ошибка запроса
+    # прерывает транзакцию. Вне транзакции чтение ее не открывает
+    savepoint = transaction.atomic() if connection.in_atomic_block else contextlib.nullcontext()
+    try:
+        with savepoint, connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                estimate = cursor.fetchone()[0]
+            elif connection.vendor == 'sqlite':
+                # Первое число stat - строк в индексе; частичные индексы меньше таблицы
+                cursor.execute('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', [table])
+                estimate = cursor.fetchone()[0]
+    except DatabaseError:
+        # Статистика еще не собиралась
+        pass
+    if estimate and estimate > 0:
+        return estimate
+    pks = model._default_manager.values_list('pk', flat=True)
+    first, last = pks.order_by('pk').first(), pks.order_by('-pk').first()
+    return last - first + 1 if first is not None else 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор больших таблиц: точный COUNT(*) только до EXACT_COUNT_LIMIT
+    строк. Дальше без фильтров берется оценка размера таблицы, а с фильтрами -
+    граница, и страницы дальше нее не показываются: нужно уточнить фильтр.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        bounded = queryset.order_by()[:EXACT_COUNT_LIMIT + 1].count()
+        if bounded <= EXACT_COUNT_LIMIT or queryset.query.where:
+            return bounded
+        return max(estimated_row_count(queryset.model), bounded)
+
+
+class UserAutocompleteFilter(admin.SimpleListFilter):
+    """Фильтр по работнику через поле автодополнения вместо ссылки на каждого работника"""
+    title = 'работнику'
+    # Тот же параметр, что у стандартного фильтра по внешнему ключу
+    parameter_name = 'user__id__exact'
+    template = 'admin/attendance/user_autocomplete_filter.html'
+
+    def lookups(self, request, model_admin):
+        value = self.value()
+        self.selected = User.objects.filter(pk=value).first() if value and value.isdigit() else None
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'Все',
+        }
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value is None:
+            return queryset
+        if not value.isdigit():
+            raise IncorrectLookupParameters
+        return queryset.filter(user_id=value)
+
 
 @admin.register(Attendance)
 class AttendanceAdmin(admin.ModelAdmin):
+    """
+    Список посещаемости рассчитан на миллионы строк: работник выбирается
+    автодополнением, даты - иерархией по индексу check_in, работники
+    читаются одним JOIN, а точный COUNT(*) заменен оценкой
+    """
     list_display = ('user', 'check_in', 'check_out', 'get_work_duration', 'status')
-    list_filter = ('check_in', 'is_present', 'user')
+    list_filter = ('is_present', UserAutocompleteFilter)
+    list_select_related = ('user',)
+    date_hierarchy = 'check_in'
+    autocomplete_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ('user__full_name', 'user__username')
+    ordering = ('-check_in',)
+    change_list_template = 'admin/attendance/attendance/change_list.html'
+
+    @property
+    def media(self):
+        # Поле автодополнения в фильтре списка
+        return super().media + AutocompleteSelect(Attendance._meta.get_field('user'), self.admin_site).media
+
+    def get_work_duration(self, obj):
+        return obj.get_work_duration()
+    get_work_duration.short_description = 'Часы работы'
+    get_work_duration.admin_order_field = 'worked_seconds'
+
+    # Правки записей пересчитывают ежедневные итоги затронутых дней
+    # и обновляют кэш главной страницы
+    def save_model(self, request, obj, form, change):
+        user_days = [(obj.user_id, work_date(obj.check_in))]
+        if change:
+            old = Attendance.objects.filter(pk=obj.pk).values('user_id', 'check_in').first()
+            if old:
+                user_days.append((old['user_id'], work_date(old['check_in'])))
+        super().save_model(request, obj, form, change)
+        rebuild_days(user_days)
+        refresh_roster({user_id for user_id, _ in user_days})
+
+    def delete_model(self, request, obj):
+        user_days = [(obj.user_id, work_date(obj.check_in))]
+        super().delete_model(request, obj)
+        rebuild_days(user_days)
+        refresh_roster({user_id for user_id, _ in user_days})
+
+    def delete_queryset(self, request, queryset):
+        user_days = [
+            (user_id, work_date(check_in))
+            for user_id, check_in in queryset.values_list('user_id', 'check_in')
+        ]
+        super().delete_queryset(request, queryset)
+        rebuild_days(user_days)
+        refresh_roster({user_id for user_id, _ in user_days})
+
+
+@admin.register(ArchivedAttendance)
+class ArchivedAttendanceAdmin(admin.ModelAdmin):
+    """Архив только для просмотра: правка разошлась бы с ежедневными итогами"""
+    list_display = ('user', 'check_in', 'check_out', 'get_work_duration')
     search_fields = ('user__full_name', 'user__username')
     ordering = ('-check_in',)
 
     def get_work_duration(self, obj):
         return obj.get_work_duration()
     get_work_duration.short_description = 'Часы работы'
+    get_work_duration.admin_order_field = 'worked_seconds'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
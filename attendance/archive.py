@@ -0,0 +1,48 @@
+"""
+Архив закрытых смен (ArchivedAttendance).
+
+Команда archive_attendance пачками переносит закрытые смены, пришедшие
+раньше archive_cutoff(), из рабочей таблицы в архив с теми же id.
+Граница зависит только от настройки ATTENDANCE_ARCHIVE_AFTER_DAYS,
+поэтому чтение знает, где могут лежать смены, без обращения к БД:
+архив запрашивается, только если период запроса начинается раньше
+границы. Ежедневные итоги при переносе не меняются.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedAttendance, Attendance
+
+ARCHIVE_BATCH_SIZE = 1000
+_ROW_FIELDS = ('id', 'user_id', 'check_in', 'check_out', 'worked_seconds')
+
+
+def archive_cutoff():
+    """Начало самого старого дня, смены которого не архивируются"""
+    day = timezone.localdate() - timedelta(days=settings.ATTENDANCE_ARCHIVE_AFTER_DAYS)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def reaches_archive(since=None):
+    """Нужен ли архив для чтения смен, пришедших не раньше since (None - за все время)"""
+    return since is None or since < archive_cutoff()
+
+
+def archive_batch(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Переносит в архив одну пачку закрытых смен старше cutoff; возвращает их число"""
+    with transaction.atomic():
+        rows = list(
+            Attendance.objects.filter(is_present=False, check_in__lt=cutoff)
+            .order_by('check_in', 'id')
+            .values_list(*_ROW_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        ArchivedAttendance.objects.bulk_create([
+            ArchivedAttendance(**dict(zip(_ROW_FIELDS, row)), is_present=False) for row in rows
+        ])
+        Attendance.objects.filter(id__in=[row[0] for row in rows]).delete()
+    return len(rows)
@@ -0,0 +1,138 @@
+"""
+Замеры представлений на синтетических данных разного объема.
+
+Для каждого представления считаются задержка (p50/p95), число SQL-запросов
+и пиковая память Python на один запрос. Запросы выполняются через тестовый
+клиент Django, то есть с middleware, сессией и шаблонами, как в работе.
+Используется командой bench_views.
+"""
+import math
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import User
+from .summary import day_start, rebuild_summary
+from .synthetic import bulk_insert, create_workers, generate_shifts
+
+
+def seed(workers_count, days, seed=1):
+    """Заполняет базу: администратор, работники и их смены за days дней; возвращает (админ, id работников)"""
+    admin = User.objects.create_superuser(
+        username='bench_admin', password='admin123', full_name='Администратор', role='admin',
+    )
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    user_ids = create_workers(workers_count, prefix='bench', joined=day_start(start))
+    bulk_insert(generate_shifts(user_ids, start, end, seed=seed))
+    rebuild_summary(start, end)
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    return admin, user_ids
+
+
+def view_requests(admin, user_ids):
+    """
+    Замеряемые запросы: (название, id пользователей, метод, адрес, данные).
+
+    Запрос i выполняется от пользователя i по кругу. Отметки идут последними
+    и каждый раз от другого работника, чтобы не влиять на замеры чтения.
+    """
+    worker_id = user_ids[len(user_ids) // 2]
+    today = timezone.localdate()
+    month = f'?start_date={today.replace(day=1).isoformat()}&end_date={today.isoformat()}'
+    quarter = f'?start_date={(today - timedelta(days=90)).isoformat()}&end_date={today.isoformat()}'
+    year = f'?start_date={(today - timedelta(days=365)).isoformat()}&end_date={today.isoformat()}'
+    return [
+        ('dashboard_admin', [admin.id], 'get', '/', None),
+        ('dashboard_worker', [worker_id], 'get', '/', None),
+        ('user_detail', [admin.id], 'get', f'/user/{worker_id}/', None),
+        ('user_detail_months', [admin.id], 'get', f'/user/{worker_id}/?months=1', None),
+        ('reports', [admin.id], 'get', '/reports/', None),
+        ('reports_month', [admin.id], 'get', '/reports/' + month, None),
+        ('timesheet_quarter', [admin.id], 'get', '/reports/timesheet/' + quarter, None),
+        ('absences_year', [admin.id], 'get', '/reports/absences/' + year, None),
+        ('admin_attendance_changelist', [admin.id], 'get', '/admin/attendance/attendance/', None),
+        ('admin_user_changelist', [admin.id], 'get', '/admin/attendance/user/', None),
+        ('check_in_out', user_ids, 'post', '/check-in-out/', {'action': 'check_in'}),
+    ]
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+def measure(user_ids, method, url, data=None, repeat=20):
+    """Выполняет запрос repeat раз после прогрева и возвращает метрики"""
+    clients = {}
+
+    def request(index):
+        response = getattr(clients[user_ids[index % len(user_ids)]], method)(url, data)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method.upper()} {url}: ответ {response.status_code}')
+
+    # Вход выполняется заранее, чтобы не попасть в замеры
+    for index in range(repeat + 2):
+        user_id = user_ids[index % len(user_ids)]
+        if user_id not in clients:
+            clients[user_id] = Client()
+            clients[user_id].force_login(User.objects.get(id=user_id))
+
+    # Первый запрос прогревает кэши и не учитывается
+    request(0)
+    durations, queries = [], []
+    for index in range(1, repeat + 1):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            request(index)
+            durations.append((time.perf_counter() - started) * 1000)
+        queries.append(len(captured.captured_queries))
+
+    # Память меряется отдельным запросом: tracemalloc замедляет выполнение
+    tracemalloc.start()
+    try:
+        request(repeat + 1)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(durations, 0.5), 2),
+        'p95_ms': round(percentile(durations, 0.95), 2),
+        'queries': max(queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run(admin, user_ids, repeat=20):
+    """Замеряет все представления; возвращает {название: метрики}"""
+    cache.clear()
+    return {
+        name: measure(users, method, url, data, repeat)
+        for name, users, method, url, data in view_requests(admin, user_ids)
+    }
+
+
+def query_growth(sizes):
+    """
+    Представления, у которых число запросов растет вместе с объемом данных
+    (признак N+1): [(название, запросов на меньшем объеме, на большем)].
+
+    sizes - результаты замеров по возрастанию объема: [{'views': {...}}, ...].
+    """
+    grown = []
+    for smaller, larger in zip(sizes, sizes[1:]):
+        for name, metrics in larger['views'].items():
+            before = smaller['views'].get(name)
+            if before and metrics['queries'] > before['queries']:
+                grown.append((name, before['queries'], metrics['queries']))
+    return grown
@@ -0,0 +1,251 @@
+"""
+Битовые карты присутствия (PresenceBitmap): бит на работника на день.
+
+Строка - работник и год, 46 байт: бит i (младшие биты байта первыми)
+означает, что у работника есть смена, начатая в i-й день года. Присутствие
+за период (presence) - несколько строк по 46 байт на работника вместо
+прохода по сменам; по нему считаются прогулы (absences) и отвечают
+на вопросы "сколько дней был за период" (days_present), "самый долгий
+прогул" (longest_absence) и "кто был на работе во все эти дни"
+(present_on_all).
+
+Карты ведутся вместе со сменами:
+- приход (punches.check_in, загрузка отметок) ставит бит дня - mark();
+- пересчет ежедневных итогов (правка в админке, загрузка завершенных
+  смен, rebuild_attendance_summary) пересчитывает биты своих дней
+  по итогам и открытым сменам - rebuild();
+- для заполнения после обновления есть команда rebuild_presence_bitmaps.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Attendance, DailyAttendanceSummary, PresenceBitmap
+
+# Дней в году не больше 366: 46 байт на строку
+YEAR_DAYS = 366
+YEAR_BYTES = (YEAR_DAYS + 7) // 8
+
+# Дни со сменами по ежедневным итогам: строка на работника - id, число
+# дней, номера дней от начала периода (параметры: начало, начало, конец).
+# В SQLite "+" у даты отключает индекс по дате: уникальный индекс
+# (работник, дата) покрывает запрос и уже упорядочен по работнику,
+# поэтому GROUP BY обходится без сортировки
+SUMMARY_DAYS_SQL = {
+    'sqlite': (
+        "SELECT {user}, COUNT(*), GROUP_CONCAT(CAST(julianday({date}) - julianday(%s) AS INTEGER)) "
+        "FROM {table} WHERE +{date} >= %s AND +{date} <= %s"
+    ),
+    'postgresql': (
+        "SELECT {user}, COUNT(*), STRING_AGG(({date} - %s::date)::text, ',') "
+        "FROM {table} WHERE {date} >= %s AND {date} <= %s"
+    ),
+}
+
+
+def summary_days(start, end, user_ids=None):
+    """
+    Дни с закрытыми сменами с start по end одним запросом по итогам:
+    (id работников, номера дней от start) - массивы по паре на день работника
+    """
+    opts = DailyAttendanceSummary._meta
+    user = connection.ops.quote_name(opts.get_field('user').column)
+    sql = SUMMARY_DAYS_SQL[connection.vendor].format(
+        user=user,
+        date=connection.ops.quote_name(opts.get_field('work_date').column),
+        table=connection.ops.quote_name(opts.db_table),
+    )
+    first = connection.ops.adapt_datefield_value(start)
+    params = [first, first, connection.ops.adapt_datefield_value(end)]
+    if user_ids is not None:
+        sql += f" AND {user} IN ({', '.join(['%s'] * len(user_ids))})" if user_ids else ' AND 1 = 0'
+        params += list(user_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(sql + f' GROUP BY {user}', params)
+        rows = [row for row in cursor.fetchall() if row[1]]
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    ids = np.repeat(np.array([row[0] for row in rows], dtype=np.int64), [row[1] for row in rows])
+    return ids, np.fromstring(','.join(row[2] for row in rows), dtype=np.int64, sep=',')
+
+
+def open_shift_days(user_ids=None):
+    """Дни открытых смен: пары (id работника, дата). Открытых смен не больше, чем работников"""
+    # Без сортировки по check_in: так базу читает частичный индекс по is_present
+    shifts = Attendance.objects.filter(is_present=True).order_by().values_list('user_id', 'check_in')
+    user_ids = None if user_ids is None else set(user_ids)
+    return [
+        (user_id, timezone.localdate(check_in)) for user_id, check_in in shifts
+        if user_ids is None or user_id in user_ids
+    ]
+
+
+def _unpack(rows):
+    """Строки карт (bytes) -> матрица bool строки x YEAR_DAYS"""
+    data = np.frombuffer(b''.join(bytes(row) for row in rows), dtype=np.uint8).reshape(len(rows), YEAR_BYTES)
+    return np.unpackbits(data, axis=1, count=YEAR_DAYS, bitorder='little').astype(bool)
+
+
+def _pack(bits):
+    """Матрица bool строки x YEAR_DAYS -> список bytes"""
+    return [row.tobytes() for row in np.packbits(bits, axis=1, bitorder='little')]
+
+
+def mark(user_days):
+    """Ставит биты дней присутствия: пары (user_id, дата)"""
+    days_of = {}
+    for user_id, day in user_days:
+        days_of.setdefault((user_id, day.year), set()).add(day.timetuple().tm_yday - 1)
+    if not days_of:
+        return
+    with transaction.atomic():
+        rows = {
+            (row.user_id, row.year): row
+            for row in PresenceBitmap.objects.select_for_update().filter(
+                user_id__in={user_id for user_id, _ in days_of}, year__in={year for _, year in days_of},
+            )
+        }
+        changed, created = [], []
+        for (user_id, year), indexes in days_of.items():
+            row = rows.get((user_id, year))
+            bits = bytearray(row.days) if row else bytearray(YEAR_BYTES)
+            for index in indexes:
+                bits[index // 8] |= 1 << (index % 8)
+            if row is None:
+                created.append(PresenceBitmap(user_id=user_id, year=year, days=bytes(bits)))
+            elif bits != bytes(row.days):
+                row.days = bytes(bits)
+                changed.append(row)
+        PresenceBitmap.objects.bulk_update(changed, ['days'], batch_size=1000)
+        PresenceBitmap.objects.bulk_create(created, batch_size=1000)
+
+
+def rebuild(start, end, user_ids=None):
+    """
+    Пересчитывает биты дней с start по end по ежедневным итогам и открытым
+    сменам для работников user_ids (None - всех); возвращает число строк карт
+    """
+    total = 0
+    with transaction.atomic():
+        for year in range(start.year, end.year + 1):
+            total += _rebuild_year(year, max(start, date(year, 1, 1)), min(end, date(year, 12, 31)), user_ids)
+    return total
+
+
+def _rebuild_year(year, start, end, user_ids):
+    offset = (start - date(year, 1, 1)).days
+    length = (end - start).days + 1
+    ids, day_index = summary_days(start, end, user_ids)
+    open_days = [(user_id, day) for user_id, day in open_shift_days(user_ids) if start <= day <= end]
+
+    rows = PresenceBitmap.objects.select_for_update().filter(year=year)
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    rows = {row.user_id: row for row in rows}
+    users = np.array(sorted(set(rows) | set(ids.tolist()) | {user_id for user_id, _ in open_days}), dtype=np.int64)
+    if not users.size:
+        return 0
+
+    bits = np.zeros((users.size, YEAR_DAYS), dtype=bool)
+    known = np.searchsorted(users, list(rows))
+    if rows:
+        bits[known] = _unpack([row.days for row in rows.values()])
+    bits[:, offset:offset + length] = False
+    bits[np.searchsorted(users, ids), offset + day_index] = True
+    for user_id, day in open_days:
+        bits[np.searchsorted(users, user_id), offset + (day - start).days] = True
+
+    changed, created = [], []
+    for user_id, days in zip(users.tolist(), _pack(bits)):
+        row = rows.get(user_id)
+        if row is None:
+            created.append(PresenceBitmap(user_id=user_id, year=year, days=days))
+        elif bytes(row.days) != days:
+            row.days = days
+            changed.append(row)
+    PresenceBitmap.objects.bulk_update(changed, ['days'], batch_size=1000)
+    PresenceBitmap.objects.bulk_create(created, batch_size=1000)
+    return len(changed) + len(created)
+
+
+def presence(start, end, user_ids=None):
+    """
+    Присутствие по картам с start по end: (id работников по возрастанию,
+    матрица bool работники x дни периода)
+    """
+    length = (end - start).days + 1
+    rows = PresenceBitmap.objects.filter(year__gte=start.year, year__lte=end.year)
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    rows = list(rows.values_list('user_id', 'year', 'days'))
+    users = np.unique(np.array([row[0] for row in rows], dtype=np.int64))
+    matrix = np.zeros((users.size, max(length, 0)), dtype=bool)
+    for year in range(start.year, end.year + 1):
+        year_rows = [row for row in rows if row[1] == year]
+        if not year_rows:
+            continue
+        # Дни года, попавшие в период, и их место в матрице
+        first = max(start, date(year, 1, 1))
+        last = min(end, date(year, 12, 31))
+        offset = (first - date(year, 1, 1)).days
+        column = (first - start).days
+        count = (last - first).days + 1
+        bits = _unpack([row[2] for row in year_rows])
+        matrix[np.searchsorted(users, [row[0] for row in year_rows]), column:column + count] = (
+            bits[:, offset:offset + count]
+        )
+    return users, matrix
+
+
+def workdays(start, count):
+    """Маска рабочих дней (не ATTENDANCE_DAYS_OFF) для count дней с start"""
+    weekdays = (start.weekday() + np.arange(count)) % 7
+    return ~np.isin(weekdays, settings.ATTENDANCE_DAYS_OFF)
+
+
+def longest_runs(matrix):
+    """Самая длинная серия True в каждой строке: (длины, индексы первых элементов)"""
+    if not matrix.size:
+        return np.zeros(len(matrix), dtype=np.int64), np.zeros(len(matrix), dtype=np.int64)
+    columns = np.arange(matrix.shape[1])
+    # Для каждой клетки - последний столбец False левее или в ней самой
+    last_break = np.maximum.accumulate(np.where(matrix, -1, columns), axis=1)
+    runs = np.where(matrix, columns - last_break, 0)
+    ends = runs.argmax(axis=1)
+    lengths = runs[np.arange(len(runs)), ends]
+    return lengths, ends - lengths + 1
+
+
+def days_present(user_id, start, end):
+    """Сколько дней с start по end у работника была смена"""
+    _, matrix = presence(start, end, [user_id])
+    return int(matrix.sum())
+
+
+def longest_absence(user_id, start, end):
+    """
+    Самый долгий прогул с start по end: (число рабочих дней подряд без смен,
+    первый день) или (0, None). Выходные дни ATTENDANCE_DAYS_OFF прогул
+    не прерывают и в него не входят.
+    """
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    _, matrix = presence(start, end, [user_id])
+    present = matrix[0] if matrix.size else np.zeros(len(days), dtype=bool)
+    workday = workdays(start, len(days))
+    lengths, first = longest_runs(~present[workday][None, :])
+    if not lengths[0]:
+        return 0, None
+    return int(lengths[0]), [day for day, is_workday in zip(days, workday.tolist()) if is_workday][first[0]]
+
+
+def present_on_all(days, user_ids=None):
+    """Id работников, у которых была смена в каждый из дней days"""
+    days = sorted(set(days))
+    if not days:
+        return []
+    users, matrix = presence(days[0], days[-1], user_ids)
+    columns = [(day - days[0]).days for day in days]
+    return users[matrix[:, columns].all(axis=1)].tolist()
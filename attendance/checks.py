@@ -0,0 +1,31 @@
+"""
+Проверки настроек (manage.py check).
+
+Кэш главной страницы, отрисованных таблиц и отчетов хранится в Django
+cache framework. Версии данных общие (таблица DataVersion), поэтому
+ответы остаются верными при любом кэше. Но кэш в памяти процесса
+(LocMemCache) у каждого процесса сервера свой: после изменения в одном
+процессе остальные заново читают состав и пересчитывают отчеты, а память
+под кэш тратит каждый процесс.
+"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """Кэш в памяти процесса при нескольких процессах сервера"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if settings.ATTENDANCE_SERVER_PROCESSES <= 1 or backend != LOCMEM_BACKEND:
+        return []
+    return [Warning(
+        'Кэш главной страницы и отчетов хранится в памяти процесса (LocMemCache), '
+        f'а процессов сервера {settings.ATTENDANCE_SERVER_PROCESSES}',
+        hint=(
+            'Каждый процесс перечитывает состав и пересчитывает отчеты после изменений в других '
+            'процессах. Подключите общий кэш (Redis, Memcached) в CACHES.'
+        ),
+        id='attendance.W001',
+    )]
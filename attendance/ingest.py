@@ -0,0 +1,143 @@
+"""
+Пакетная загрузка отметок от турникетов.
+
+Пакет событий (работник, время, направление) проверяется целиком,
+приходы и уходы сопоставляются с открытыми сменами в памяти, а запись
+выполняется одной транзакцией через bulk_create / bulk_update.
+"""
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import bitmaps
+from .locking import write_transaction
+from .models import Attendance, User
+from .roster import refresh_roster
+from .summary import rebuild_summary, work_date
+
+DIRECTIONS = ('in', 'out')
+
+
+class IngestError(Exception):
+    """Пакет целиком не может быть принят"""
+
+
+def _parse_event(event):
+    """Проверяет одно событие; возвращает (user_id, время, направление) или текст ошибки"""
+    if not isinstance(event, dict):
+        return 'событие должно быть объектом'
+
+    user_id = event.get('user_id')
+    if isinstance(user_id, bool) or not isinstance(user_id, int):
+        return 'user_id должен быть целым числом'
+
+    direction = event.get('direction')
+    if direction not in DIRECTIONS:
+        return 'direction должен быть "in" или "out"'
+
+    try:
+        timestamp = parse_datetime(event.get('timestamp') or '')
+    except (TypeError, ValueError):
+        timestamp = None
+    if timestamp is None:
+        return 'timestamp должен быть датой и временем в формате ISO 8601'
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+
+    return user_id, timestamp, direction
+
+
+def ingest_events(events):
+    """
+    Записывает пакет событий и возвращает результат по каждому событию
+    в порядке пакета: {'index', 'status', ...}.
+
+    Статусы: created - открыта смена, closed - смена закрыта,
+    duplicate - приход при уже открытой смене, no_open_shift - уход без
+    открытой смены, error - событие не прошло проверку.
+    """
+    if not isinstance(events, list):
+        raise IngestError('events должен быть списком')
+
+    results = [{'index': index} for index in range(len(events))]
+    parsed = []
+    for index, event in enumerate(events):
+        value = _parse_event(event)
+        if isinstance(value, str):
+            results[index].update(status='error', error=value)
+        else:
+            parsed.append((index, *value))
+
+    for index, result in apply_events(parsed).items():
+        results[index].update(result)
+    return results
+
+
+def apply_events(events):
+    """
+    Применяет проверенные события (ключ, user_id, время, направление)
+    к сменам одной транзакцией и возвращает {ключ: результат}.
+    """
+    results = {key: {} for key, _, _, _ in events}
+    user_ids = {user_id for _, user_id, _, _ in events}
+    workers = set(User.objects.filter(
+        id__in=user_ids, role='worker', is_active=True
+    ).values_list('id', flat=True))
+
+    with write_transaction():
+        open_shifts = {
+            attendance.user_id: attendance
+            for attendance in Attendance.objects.filter(user_id__in=workers, is_present=True)
+        }
+        created, closed = [], []
+        event_shifts = {}
+
+        # События применяются по времени, а не по порядку в пакете
+        for key, user_id, timestamp, direction in sorted(events, key=lambda item: (item[2], item[0])):
+            result = results[key]
+            if user_id not in workers:
+                result.update(status='error', error='работник не найден')
+                continue
+
+            shift = open_shifts.get(user_id)
+            if direction == 'in':
+                if shift:
+                    result['status'] = 'duplicate'
+                    event_shifts[key] = shift
+                    continue
+                shift = Attendance(user_id=user_id, check_in=timestamp, is_present=True)
+                created.append(shift)
+                open_shifts[user_id] = shift
+                result['status'] = 'created'
+            else:
+                if not shift:
+                    result['status'] = 'no_open_shift'
+                    continue
+                if timestamp < shift.check_in:
+                    result.update(status='error', error='уход раньше прихода')
+                    continue
+                shift.check_out = timestamp
+                shift.is_present = False
+                shift.worked_seconds = Attendance.compute_worked_seconds(shift.check_in, timestamp)
+                if shift.pk:
+                    closed.append(shift)
+                del open_shifts[user_id]
+                result['status'] = 'closed'
+            event_shifts[key] = shift
+
+        # Сначала закрываются смены из БД: иначе новая открытая смена того же
+        # работника нарушит ограничение attendance_one_open_shift
+        Attendance.objects.bulk_update(closed, ['check_out', 'is_present', 'worked_seconds'], batch_size=1000)
+        Attendance.objects.bulk_create(created, batch_size=1000)
+
+        # Дни завершенных смен пересчитывает rebuild_summary, открытых - отмечаются здесь
+        bitmaps.mark((shift.user_id, work_date(shift.check_in)) for shift in created if shift.is_present)
+        finished = [shift for shift in created + closed if not shift.is_present]
+        if finished:
+            days = [work_date(shift.check_in) for shift in finished]
+            rebuild_summary(min(days), max(days), user_ids={shift.user_id for shift in finished})
+        if created or closed:
+            refresh_roster({shift.user_id for shift in created + closed}, shifts=created + closed)
+
+    for key, shift in event_shifts.items():
+        results[key]['attendance_id'] = shift.pk
+    return results
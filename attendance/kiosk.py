@@ -0,0 +1,61 @@
+"""
+Терминал отметок (киоск): отметка по пропуску или PIN без входа работника.
+
+Устройство активируется один раз токеном из ATTENDANCE_KIOSK_TOKENS и
+хранит его в подписанной cookie, поэтому отметка не требует ни проверки
+пароля, ни сессии работника. Пропуска активных работников хранятся
+в памяти процесса (BadgeIndex): отметка - поиск в словаре и одна запись.
+
+Индекс перечитывается при смене эпохи версий (правки пользователей
+в админке, генерация данных) и при неизвестном пропуске - не чаще раза
+в BADGE_RELOAD_INTERVAL секунд, чтобы перебор пропусков не нагружал БД.
+"""
+import threading
+import time
+
+from . import versions
+from .models import User
+
+# Не чаще раза в столько секунд неизвестный пропуск перечитывает индекс
+BADGE_RELOAD_INTERVAL = 5
+
+
+class BadgeIndex:
+    """Пропуск -> работник (id и ФИО) для активных работников"""
+
+    def __init__(self):
+        self._badges = None
+        self._epoch = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _reload(self, epoch):
+        with self._lock:
+            rows = User.objects.filter(
+                is_active=True, role='worker', badge__isnull=False
+            ).values_list('badge', 'id', 'full_name')
+            self._badges = {badge: {'id': user_id, 'full_name': full_name} for badge, user_id, full_name in rows}
+            self._epoch = epoch
+            self._loaded_at = time.monotonic()
+            return self._badges
+
+    def lookup(self, badge):
+        """Работник по пропуску или None"""
+        if not badge:
+            return None
+        epoch = versions.epoch()
+        badges = self._badges
+        if badges is None or self._epoch != epoch:
+            badges = self._reload(epoch)
+        worker = badges.get(badge)
+        # Пропуск мог быть выдан после загрузки индекса
+        if worker is None and time.monotonic() - self._loaded_at >= BADGE_RELOAD_INTERVAL:
+            worker = self._reload(epoch).get(badge)
+        return worker
+
+    def clear(self):
+        """Сбрасывает индекс; он загрузится при следующем поиске"""
+        self._badges = None
+
+
+badges = BadgeIndex()
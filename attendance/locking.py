@@ -0,0 +1,73 @@
+"""
+Повтор записи при занятой базе SQLite.
+
+SQLite допускает одного пишущего. Соединение ждет блокировку до таймаута
+(OPTIONS['timeout'] в настройках БД), а если не дождалось, отметка
+повторяется с нарастающей паузой, чтобы при пересменке работник не
+получил "database is locked".
+
+Транзакции путей записи (отметки, загрузка и свертка отметок) открывает
+write_transaction(): в SQLite - BEGIN IMMEDIATE, блокировка записи
+берется сразу. Иначе транзакция, начавшая с чтения, при первой записи
+повышает блокировку, и если кто-то успел записать раньше, падает сразу,
+не дожидаясь таймаута. Остальные транзакции и чтение блокировку записи
+не берут.
+"""
+import contextlib
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+
+def is_lock_error(exc):
+    """Ошибка занятой базы, а не ошибка в запросе"""
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def retry_on_lock(func):
+    """
+    Повторяет func при занятой базе до ATTENDANCE_LOCK_RETRIES раз.
+
+    Внутри внешней транзакции не повторяет: откатилась бы вся она,
+    а не только эта запись.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if (
+                    connection.in_atomic_block
+                    or not is_lock_error(exc)
+                    or attempt >= settings.ATTENDANCE_LOCK_RETRIES
+                ):
+                    raise
+            delay = settings.ATTENDANCE_LOCK_RETRY_DELAY * 2 ** attempt
+            time.sleep(random.uniform(delay / 2, delay))
+            attempt += 1
+    return wrapper
+
+
+@contextlib.contextmanager
+def write_transaction():
+    """transaction.atomic() пути записи: в SQLite внешняя транзакция - BEGIN IMMEDIATE"""
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic():
+            yield
+        return
+    # Режим BEGIN соединение читает из настроек при подключении
+    connection.ensure_connection()
+    mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic():
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
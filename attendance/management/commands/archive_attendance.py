@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.archive import ARCHIVE_BATCH_SIZE, archive_batch, archive_cutoff
+from attendance.roster import refresh_roster
+
+
+class Command(BaseCommand):
+    help = 'Переносит закрытые смены старше ATTENDANCE_ARCHIVE_AFTER_DAYS дней в архив'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Смен за одну транзакцию')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        cutoff = archive_cutoff()
+        total = 0
+        while True:
+            count = archive_batch(cutoff, options['batch_size'])
+            if not count:
+                break
+            total += count
+        if total:
+            refresh_roster()
+        self.stdout.write(self.style.SUCCESS(f'Перенесено в архив смен до {cutoff:%Y-%m-%d}: {total}'))
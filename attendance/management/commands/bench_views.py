@@ -0,0 +1,75 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from attendance import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Замеряет представления на синтетических данных нескольких объемов и печатает отчет в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000', help='Число работников через запятую')
+        parser.add_argument('--days', type=int, default=365, help='За сколько дней генерировать смены')
+        parser.add_argument('--repeat', type=int, default=20, help='Сколько раз выполнять каждый запрос')
+        parser.add_argument('--seed', type=int, default=1, help='Начальное значение генератора данных')
+        parser.add_argument('--output', help='Файл для отчета; по умолчанию отчет печатается')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',')})
+        except ValueError:
+            raise CommandError('--sizes: ожидаются числа через запятую')
+        if sizes[0] < 1 or options['days'] < 1 or options['repeat'] < 1:
+            raise CommandError('--sizes, --days и --repeat должны быть положительными')
+
+        report = {'days': options['days'], 'repeat': options['repeat'], 'sizes': []}
+        setup_test_environment()
+        try:
+            for workers_count in sizes:
+                report['sizes'].append(self._bench(workers_count, options))
+        finally:
+            teardown_test_environment()
+
+        grown = benchmark.query_growth(report['sizes'])
+        report['query_growth'] = [
+            {'view': name, 'queries_before': before, 'queries_after': after} for name, before, after in grown
+        ]
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+        if grown:
+            raise CommandError('Число запросов растет с объемом данных: ' + ', '.join(name for name, _, _ in grown))
+
+    def _bench(self, workers_count, options):
+        """Замеры на отдельной временной базе с workers_count работниками"""
+        # Файловая база, как в работе; удаляется после замеров
+        db_dir = tempfile.mkdtemp()
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(db_dir, 'bench.sqlite3')
+        connection.creation.create_test_db(verbosity=0, serialize=False)
+        try:
+            self.stderr.write(f'{workers_count} работников: заполнение базы...')
+            started = time.perf_counter()
+            admin, user_ids = benchmark.seed(workers_count, options['days'], seed=options['seed'])
+            seed_seconds = time.perf_counter() - started
+
+            self.stderr.write(f'{workers_count} работников: замеры...')
+            return {
+                'workers': workers_count,
+                'seed_seconds': round(seed_seconds, 1),
+                'views': benchmark.run(admin, user_ids, repeat=options['repeat']),
+            }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(db_dir, ignore_errors=True)
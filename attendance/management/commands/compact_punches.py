@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.punch_log import COMPACT_BATCH_SIZE, compact
+
+
+class Command(BaseCommand):
+    help = 'Переносит события из журнала отметок в смены посещаемости'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=COMPACT_BATCH_SIZE, help='Событий за одну транзакцию')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно, проверяя журнал с интервалом')
+        parser.add_argument('--interval', type=float, default=1.0, help='Пауза между проверками в режиме --loop (секунды)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        while True:
+            total = 0
+            while True:
+                count = compact(options['batch_size'])
+                if not count:
+                    break
+                total += count
+            if total or not options['loop']:
+                self.stdout.write(f'Свернуто событий: {total}')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
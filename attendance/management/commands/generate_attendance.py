@@ -0,0 +1,59 @@
+import time
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from attendance.models import Attendance, User
+from attendance.roster import refresh_roster
+from attendance.summary import day_start
+from attendance.synthetic import bulk_insert, create_workers, generate_shifts
+
+
+class Command(BaseCommand):
+    help = 'Генерирует синтетическую посещаемость: N работников за D последних дней'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=0, help='Сколько новых работников создать')
+        parser.add_argument('--days', type=int, default=30, help='За сколько последних дней (включая сегодня)')
+        parser.add_argument('--seed', type=int, default=1, help='Начальное значение генератора случайных чисел')
+        parser.add_argument('--existing', action='store_true', help='Генерировать смены и для уже существующих работников')
+        parser.add_argument('--replace', action='store_true', help='Удалить прежние смены выбранных работников за период и их открытые смены')
+        parser.add_argument('--prefix', default='gen', help='Префикс логинов новых работников')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пачки вставки')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 0 or options['days'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers, --days и --batch-size должны быть положительными')
+
+        started = time.perf_counter()
+        end = timezone.localdate()
+        start = end - timedelta(days=options['days'] - 1)
+        user_ids = []
+        if options['existing']:
+            user_ids = list(User.objects.filter(role='worker', is_active=True).order_by('id').values_list('id', flat=True))
+        if options['workers']:
+            # Новые работники приняты к началу периода, иначе дни до приема не были бы рабочими
+            user_ids += create_workers(
+                options['workers'], prefix=options['prefix'], batch_size=options['batch_size'], joined=day_start(start),
+            )
+        if not user_ids:
+            raise CommandError('Нет работников: укажите --workers или --existing')
+
+        existing = Attendance.objects.filter(user_id__in=user_ids)
+        if options['replace']:
+            existing.filter(Q(check_in__gte=day_start(start)) | Q(is_present=True)).delete()
+        # Второй открытой смены у работника быть не может
+        busy = set(existing.filter(is_present=True).values_list('user_id', flat=True))
+
+        shifts = generate_shifts(user_ids, start, end, seed=options['seed'], skip_open=busy)
+        total = bulk_insert(shifts, options['batch_size'])
+        call_command('rebuild_attendance_summary', start=start.isoformat(), end=end.isoformat(), stdout=self.stdout)
+        refresh_roster()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано смен: {total} для {len(user_ids)} работников за {options["days"]} дн. '
+            f'({time.perf_counter() - started:.1f} с)'
+        ))
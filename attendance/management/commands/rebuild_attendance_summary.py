@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils.dateparse import parse_date
+
+from attendance.models import ArchivedAttendance, Attendance
+from attendance.summary import rebuild_summary, work_date
+
+
+class Command(BaseCommand):
+    help = 'Заполняет или пересчитывает ежедневные итоги посещаемости за период'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Первый день периода (YYYY-MM-DD), по умолчанию самая ранняя смена')
+        parser.add_argument('--end', help='Последний день периода (YYYY-MM-DD), по умолчанию самая поздняя смена')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='id работника (можно несколько)')
+        parser.add_argument('--chunk-days', type=int, default=31, help='Сколько дней пересчитывать за одну транзакцию')
+
+    def handle(self, *args, **options):
+        start = self._parse(options['start'], '--start')
+        end = self._parse(options['end'], '--end')
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days должен быть положительным')
+
+        if start is None or end is None:
+            bounds = [
+                model.objects.aggregate(first=Min('check_in'), last=Max('check_in'))
+                for model in (Attendance, ArchivedAttendance)
+            ]
+            bounds = [bound for bound in bounds if bound['first'] is not None]
+            if not bounds:
+                self.stdout.write('Нет записей посещаемости')
+                return
+            start = start or work_date(min(bound['first'] for bound in bounds))
+            end = end or work_date(max(bound['last'] for bound in bounds))
+        if start > end:
+            raise CommandError('--start позже --end')
+
+        total = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=options['chunk_days'] - 1), end)
+            total += rebuild_summary(chunk_start, chunk_end, user_ids=options['user_ids'])
+            chunk_start = chunk_end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано итогов за {start} - {end}: {total}'))
+
+    def _parse(self, value, option):
+        if value is None:
+            return None
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise CommandError(f'{option}: ожидается дата в формате YYYY-MM-DD')
+        return day
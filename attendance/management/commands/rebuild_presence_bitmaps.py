@@ -0,0 +1,49 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from attendance.bitmaps import rebuild
+from attendance.models import Attendance, DailyAttendanceSummary
+
+
+class Command(BaseCommand):
+    help = 'Заполняет или пересчитывает битовые карты присутствия по ежедневным итогам и открытым сменам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Первый день периода (YYYY-MM-DD), по умолчанию самый ранний день итогов и открытых смен')
+        parser.add_argument('--end', help='Последний день периода (YYYY-MM-DD), по умолчанию сегодня')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='id работника (можно несколько)')
+
+    def handle(self, *args, **options):
+        start = self._parse(options['start'], '--start')
+        end = self._parse(options['end'], '--end') or timezone.localdate()
+        if start is None:
+            # Явно заданный --end не трогаем: по данным определяется только начало
+            first_day = DailyAttendanceSummary.objects.aggregate(first=Min('work_date'))['first']
+            first_open = Attendance.objects.filter(is_present=True).order_by().aggregate(first=Min('check_in'))['first']
+            start = min(
+                day for day in (first_day, first_open and timezone.localdate(first_open), end) if day is not None
+            )
+        if start > end:
+            raise CommandError('--start позже --end')
+
+        # Год за транзакцию: карты хранятся по годам
+        total = 0
+        for year in range(start.year, end.year + 1):
+            total += rebuild(max(start, date(year, 1, 1)), min(end, date(year, 12, 31)), options['user_ids'])
+
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано карт присутствия за {start} - {end}: {total}'))
+
+    def _parse(self, value, option):
+        if value is None:
+            return None
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise CommandError(f'{option}: ожидается дата в формате YYYY-MM-DD')
+        return day
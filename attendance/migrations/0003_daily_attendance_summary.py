@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0002_attendance_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('work_date', models.DateField(verbose_name='Дата')),
+                ('shifts', models.PositiveIntegerField(default=0, verbose_name='Смен')),
+                ('worked_seconds', models.PositiveIntegerField(default=0, verbose_name='Отработано секунд')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Работник')),
+            ],
+            options={
+                'verbose_name': 'Итоги за день',
+                'verbose_name_plural': 'Итоги за день',
+                'ordering': ['-work_date'],
+                'indexes': [models.Index(fields=['work_date'], name='daily_summary_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'work_date'), name='daily_summary_user_date')],
+            },
+        ),
+    ]
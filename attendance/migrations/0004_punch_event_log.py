@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_log_state(apps, schema_editor):
+    apps.get_model('attendance', 'PunchLogState').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0003_daily_attendance_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PunchLogState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('compacted_id', models.BigIntegerField(default=0, verbose_name='Последнее свернутое событие')),
+            ],
+            options={
+                'verbose_name': 'Состояние журнала отметок',
+                'verbose_name_plural': 'Состояние журнала отметок',
+            },
+        ),
+        migrations.CreateModel(
+            name='PunchEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(verbose_name='Время отметки')),
+                ('direction', models.CharField(choices=[('in', 'Приход'), ('out', 'Уход')], max_length=3, verbose_name='Направление')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Работник')),
+            ],
+            options={
+                'verbose_name': 'Отметка',
+                'verbose_name_plural': 'Журнал отметок',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(create_log_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:42
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 2000
+
+
+def backfill_worked_seconds(apps, schema_editor):
+    Attendance = apps.get_model('attendance', 'Attendance')
+    closed = Attendance.objects.filter(check_out__isnull=False).order_by('id')
+    last_id = 0
+    while True:
+        rows = list(closed.filter(id__gt=last_id).values_list('id', 'check_in', 'check_out')[:BATCH_SIZE])
+        if not rows:
+            break
+        Attendance.objects.bulk_update([
+            Attendance(id=pk, worked_seconds=max(round((check_out - check_in).total_seconds()), 0))
+            for pk, check_in, check_out in rows
+        ], ['worked_seconds'])
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0004_punch_event_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='worked_seconds',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Отработано секунд'),
+        ),
+        migrations.RunPython(backfill_worked_seconds, migrations.RunPython.noop),
+    ]
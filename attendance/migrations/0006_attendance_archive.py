@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0005_attendance_worked_seconds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAttendance',
+            fields=[
+                ('check_in', models.DateTimeField(verbose_name='Время прихода')),
+                ('check_out', models.DateTimeField(blank=True, null=True, verbose_name='Время ухода')),
+                ('is_present', models.BooleanField(default=True, verbose_name='На работе')),
+                ('worked_seconds', models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Отработано секунд')),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Работник')),
+            ],
+            options={
+                'verbose_name': 'Архив посещаемости',
+                'verbose_name_plural': 'Архив посещаемости',
+                'ordering': ['-check_in'],
+                'indexes': [models.Index(fields=['user', '-check_in'], name='archive_user_checkin_idx'), models.Index(fields=['check_in'], name='archive_checkin_idx')],
+            },
+        ),
+    ]
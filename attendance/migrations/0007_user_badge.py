@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0006_attendance_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='badge',
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True, verbose_name='Пропуск / PIN'),
+        ),
+    ]
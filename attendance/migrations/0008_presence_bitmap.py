@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0007_user_badge'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PresenceBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('days', models.BinaryField(max_length=46, verbose_name='Дни')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Работник')),
+            ],
+            options={
+                'verbose_name': 'Присутствие за год',
+                'verbose_name_plural': 'Присутствие за год',
+                'indexes': [models.Index(fields=['year'], name='presence_bitmap_year_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'year'), name='presence_bitmap_user_year')],
+            },
+        ),
+    ]
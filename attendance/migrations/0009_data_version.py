@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:17
+
+import time
+
+from django.db import migrations, models
+
+
+def create_epoch(apps, schema_editor):
+    # Эпоха входит во все версии: страницы, отданные до обновления, устаревают
+    apps.get_model('attendance', 'DataVersion').objects.get_or_create(
+        key='attendance:version:epoch', defaults={'value': time.time_ns()},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0008_presence_bitmap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Ключ')),
+                ('value', models.BigIntegerField(verbose_name='Время изменения, нс')),
+            ],
+            options={
+                'verbose_name': 'Версия данных',
+                'verbose_name_plural': 'Версии данных',
+            },
+        ),
+        migrations.RunPython(create_epoch, migrations.RunPython.noop),
+    ]
@@ -16,6 +16,8 @@ class User(AbstractUser):
     )
     full_name = models.CharField(max_length=100, verbose_name='ФИО')
     position = models.CharField(max_length=100, verbose_name='Должность')
+    # Номер пропуска или PIN для отметок на терминале (kiosk)
+    badge = models.CharField(max_length=32, unique=True, null=True, blank=True, verbose_name='Пропуск / PIN')
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -25,22 +27,31 @@ class User(AbstractUser):
         return f"{self.full_name} ({self.username})"
 
 
-class Attendance(models.Model):
+class BaseAttendance(models.Model):
+    """Поля и методы смены, общие для рабочей таблицы и архива"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Работник')
     check_in = models.DateTimeField(verbose_name='Время прихода')
     check_out = models.DateTimeField(null=True, blank=True, verbose_name='Время ухода')
     is_present = models.BooleanField(default=True, verbose_name='На работе')
+    worked_seconds = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Отработано секунд')
 
     class Meta:
-        verbose_name = 'Посещаемость'
-        verbose_name_plural = 'Посещаемость'
-        ordering = ['-check_in']
+        abstract = True
 
     def __str__(self):
         return f"{self.user.full_name} - {self.check_in.date()}"
 
+    @staticmethod
+    def compute_worked_seconds(check_in, check_out):
+        """Отработанные секунды смены (None, пока смена не закрыта)"""
+        if not check_out:
+            return None
+        return max(round((check_out - check_in).total_seconds()), 0)
+
     def get_work_duration(self):
         """Возвращает продолжительность работы в часах"""
+        if self.worked_seconds is not None:
+            return round(self.worked_seconds / 3600, 2)
         if self.check_out:
             duration = self.check_out - self.check_in
             return round(duration.total_seconds() / 3600, 2)
@@ -52,3 +63,133 @@ class Attendance(models.Model):
         if self.is_present:
             return "На работе"
         return "Ушел"
+
+
+class Attendance(BaseAttendance):
+    class Meta:
+        verbose_name = 'Посещаемость'
+        verbose_name_plural = 'Посещаемость'
+        ordering = ['-check_in']
+        indexes = [
+            # История работника: фильтр по user с сортировкой по -check_in
+            models.Index(fields=['user', '-check_in'], name='attendance_user_checkin_idx'),
+            # Отчеты по периодам и общая лента последних записей
+            models.Index(fields=['check_in'], name='attendance_checkin_idx'),
+        ]
+        constraints = [
+            # Не более одной открытой смены на работника; частичный индекс
+            # заодно обслуживает выборки по is_present=True
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(is_present=True),
+                name='attendance_one_open_shift',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.worked_seconds = self.compute_worked_seconds(self.check_in, self.check_out)
+        if kwargs.get('update_fields') is not None and 'check_out' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'worked_seconds'}
+        super().save(*args, **kwargs)
+
+
+class ArchivedAttendance(BaseAttendance):
+    """
+    Закрытая смена старше ATTENDANCE_ARCHIVE_AFTER_DAYS, перенесенная
+    командой archive_attendance; id совпадает с id в Attendance.
+    """
+    id = models.BigIntegerField(primary_key=True)
+
+    class Meta:
+        verbose_name = 'Архив посещаемости'
+        verbose_name_plural = 'Архив посещаемости'
+        ordering = ['-check_in']
+        indexes = [
+            models.Index(fields=['user', '-check_in'], name='archive_user_checkin_idx'),
+            models.Index(fields=['check_in'], name='archive_checkin_idx'),
+        ]
+
+
+class DailyAttendanceSummary(models.Model):
+    """Итоги закрытых смен работника за день (по дате прихода)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Работник')
+    work_date = models.DateField(verbose_name='Дата')
+    shifts = models.PositiveIntegerField(default=0, verbose_name='Смен')
+    worked_seconds = models.PositiveIntegerField(default=0, verbose_name='Отработано секунд')
+
+    class Meta:
+        verbose_name = 'Итоги за день'
+        verbose_name_plural = 'Итоги за день'
+        ordering = ['-work_date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'work_date'], name='daily_summary_user_date'),
+        ]
+        indexes = [
+            models.Index(fields=['work_date'], name='daily_summary_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.full_name} - {self.work_date}"
+
+    @property
+    def worked_hours(self):
+        """Отработано часов за день"""
+        return round(self.worked_seconds / 3600, 2)
+
+
+class PresenceBitmap(models.Model):
+    """Присутствие работника за год: бит на день года (1 - была смена), см. bitmaps"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Работник')
+    year = models.PositiveSmallIntegerField(verbose_name='Год')
+    days = models.BinaryField(max_length=46, verbose_name='Дни')
+
+    class Meta:
+        verbose_name = 'Присутствие за год'
+        verbose_name_plural = 'Присутствие за год'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'year'], name='presence_bitmap_user_year'),
+        ]
+        indexes = [
+            models.Index(fields=['year'], name='presence_bitmap_year_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.year}"
+
+
+class PunchEvent(models.Model):
+    """Отметка прихода/ухода в журнале; в смены ее переносит свертка (compact_punches)"""
+    DIRECTION_CHOICES = [
+        ('in', 'Приход'),
+        ('out', 'Уход'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Работник')
+    timestamp = models.DateTimeField(verbose_name='Время отметки')
+    direction = models.CharField(max_length=3, choices=DIRECTION_CHOICES, verbose_name='Направление')
+
+    class Meta:
+        verbose_name = 'Отметка'
+        verbose_name_plural = 'Журнал отметок'
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.user_id} {self.direction} {self.timestamp}"
+
+
+class PunchLogState(models.Model):
+    """Граница свертки журнала: события с id больше compacted_id еще не перенесены в смены"""
+    compacted_id = models.BigIntegerField(default=0, verbose_name='Последнее свернутое событие')
+
+    class Meta:
+        verbose_name = 'Состояние журнала отметок'
+        verbose_name_plural = 'Состояние журнала отметок'
+
+
+class DataVersion(models.Model):
+    """Версия данных посещаемости для условных запросов и кэша отчетов (versions)"""
+    key = models.CharField(max_length=100, primary_key=True, verbose_name='Ключ')
+    value = models.BigIntegerField(verbose_name='Время изменения, нс')
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
@@ -0,0 +1,126 @@
+"""
+Живое табло "Сейчас на работе" через Server-Sent Events.
+
+Табло (представление presence_stream под ASGI) подписывается на broker
+и при подключении получает снимок из кэша get_roster(), а затем - только
+изменения: кто пришел и кто ушел. Изменения вычисляет refresh_roster,
+сравнивая прежний и новый состав кэша, поэтому на каждую отметку или
+правку приходится одно событие на процесс, а подключенные табло
+не обращаются к БД вовсе.
+
+Подписчик - очередь asyncio в цикле событий ASGI-сервера, а отметки
+фиксируются в потоках синхронных представлений, поэтому события
+передаются в цикл через call_soon_threadsafe. Если табло не успевает
+читать события, его очередь сбрасывается, и оно получает новый снимок.
+
+Broker живет в памяти процесса и сразу доставляет отметки, сделанные
+в том же процессе ASGI-сервера. Изменения других процессов (свертка
+журнала, другие процессы сервера) табло замечает на пинге по общей
+версии данных и получает новый снимок. Событие в очереди - пара
+(версия данных, сообщение).
+"""
+import asyncio
+import json
+import threading
+
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.formats import date_format
+
+# Событий в очереди одного табло до сброса на снимок
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Событие в очереди, по которому табло заново получает снимок
+RESYNC = None
+
+
+def board_row(row):
+    """Строка табло из строки кэша get_roster(): уже отформатированные поля"""
+    return {
+        'id': row['id'],
+        'user_id': row['user']['id'],
+        'full_name': row['user']['full_name'],
+        'position': row['user']['position'],
+        'check_in': date_format(timezone.localtime(row['check_in']), 'd.m.Y H:i'),
+        'url': reverse('user_detail', args=[row['user']['id']]),
+    }
+
+
+def presence_changes(previous, present):
+    """Кто пришел и кто ушел: {'arrived': [строки табло], 'left': [id смен]}"""
+    previous_ids = {row['id'] for row in previous}
+    present_ids = {row['id'] for row in present}
+    return {
+        'arrived': [board_row(row) for row in present if row['id'] not in previous_ids],
+        'left': [row['id'] for row in previous if row['id'] not in present_ids],
+    }
+
+
+def format_event(event, data, event_id=None):
+    """Сообщение в формате text/event-stream"""
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class PresenceBroker:
+    """Рассылка изменений табло подписчикам процесса"""
+
+    def __init__(self):
+        self._subscribers = set()  # (цикл событий, очередь)
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Очередь событий для текущего цикла событий"""
+        queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers = {item for item in self._subscribers if item[1] is not queue}
+
+    def subscriber_count(self):
+        """Число подписчиков; подписки закрытых циклов событий отбрасываются"""
+        with self._lock:
+            self._subscribers = {item for item in self._subscribers if not item[0].is_closed()}
+            return len(self._subscribers)
+
+    def publish(self, message):
+        """Передает сообщение всем подписчикам; можно вызывать из любого потока"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, message)
+            except RuntimeError:
+                # Цикл событий уже закрыт
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _put(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+
+
+broker = PresenceBroker()
+
+
+def publish_roster(previous, roster):
+    """Рассылает изменения состава после обновления кэша табло"""
+    if not broker.subscriber_count():
+        return
+    if previous is None:
+        # Прежний состав неизвестен (кэш был пуст) - табло берут снимок
+        broker.publish(RESYNC)
+        return
+    changes = presence_changes(previous['present'], roster['present'])
+    if changes['arrived'] or changes['left']:
+        broker.publish((roster['version'], format_event('presence', changes, roster['version'])))
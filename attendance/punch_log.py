@@ -0,0 +1,148 @@
+"""
+Журнал отметок (PunchEvent) и его свертка в смены.
+
+Отметка в check_in_out - одна вставка в журнал без изменения таблицы
+посещаемости. Перед вставкой состояние работника проверяется по его
+открытой смене и несвернутым событиям: повторный приход и уход без
+открытой смены не записываются, и работник получает ошибку, как при
+прямой записи. Свертка (команда compact_punches --loop, а при
+подключенных живых табло - сама отметка) переносит накопившиеся события
+в смены пачками через ingest.apply_events и сдвигает границу
+PunchLogState.compacted_id. Ошибка свертки в запросе отметки
+(try_compact_pending) пишется в лог, а события остаются в журнале.
+
+Чтение страниц журнал не сворачивает: свертка - транзакция записи,
+и чтение ждало бы отметок. Главная страница работника добавляет
+его несвернутые события к строкам смен в памяти (fold_pending);
+остальные страницы видят отметки после свертки.
+
+Границу можно сдвигать по id, потому что SQLite выполняет записи
+последовательно и события фиксируются в порядке возрастания id.
+"""
+import logging
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F, Subquery
+from django.utils import timezone
+
+from . import versions
+from .ingest import apply_events
+from .locking import retry_on_lock, write_transaction
+from .models import Attendance, PunchEvent, PunchLogState, User
+
+COMPACT_BATCH_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def _pending(user_id=None):
+    """Несвернутые события журнала"""
+    compacted_id = PunchLogState.objects.filter(pk=1).values('compacted_id')[:1]
+    events = PunchEvent.objects.filter(id__gt=Subquery(compacted_id))
+    if user_id is not None:
+        events = events.filter(user_id=user_id)
+    return events
+
+
+def shift_open(user_id):
+    """Открыта ли смена работника с учетом несвернутых событий журнала"""
+    last = _pending(user_id).order_by('-id').values_list('direction', flat=True).first()
+    if last is not None:
+        return last == 'in'
+    # Без сортировки по check_in: так базу читает частичный индекс открытых смен
+    return Attendance.objects.filter(user_id=user_id, is_present=True).order_by().exists()
+
+
+@retry_on_lock
+def record_punch(user_id, direction, at=None):
+    """
+    Записывает отметку в журнал; повторный приход и уход без открытой
+    смены не записываются - возвращает None
+    """
+    with write_transaction():
+        if connection.features.has_select_for_update:
+            # Две отметки работника не проверяются по одному состоянию;
+            # в SQLite то же дает единственная транзакция записи
+            list(User.objects.select_for_update().filter(pk=user_id).values_list('pk'))
+        if shift_open(user_id) == (direction == 'in'):
+            return None
+        event = PunchEvent.objects.create(user_id=user_id, direction=direction, timestamp=at or timezone.now())
+        # Главная работника показывает несвернутые события - ее версия меняется сразу
+        transaction.on_commit(lambda: versions.bump_users([user_id]))
+    return event
+
+
+def has_pending():
+    """Есть ли в журнале события, еще не перенесенные в смены"""
+    return _pending().exists()
+
+
+def fold_pending(rows, user):
+    """
+    Строки смен работника (attendance_row, новые первыми) с его
+    несвернутыми событиями: приход добавляет открытую смену, уход
+    закрывает ее. Строки без id - еще не записанные смены.
+    """
+    rows = [dict(row) for row in rows]
+    for timestamp, direction in _pending(user.id).order_by('id').values_list('timestamp', 'direction'):
+        shift = next((row for row in rows if row['is_present']), None)
+        if direction == 'in' and shift is None:
+            rows.insert(0, {
+                'id': None,
+                'user': {'id': user.id, 'full_name': user.full_name, 'position': user.position},
+                'check_in': timestamp, 'check_out': None,
+                'is_present': True, 'status': 'На работе', 'work_duration': None,
+            })
+        elif direction == 'out' and shift is not None:
+            worked_seconds = Attendance.compute_worked_seconds(shift['check_in'], timestamp)
+            shift.update(
+                check_out=timestamp, is_present=False, status='Ушел', work_duration=round(worked_seconds / 3600, 2),
+            )
+    return rows
+
+
+@retry_on_lock
+def compact(batch_size=COMPACT_BATCH_SIZE):
+    """Сворачивает одну пачку событий; возвращает число обработанных событий"""
+    with write_transaction():
+        # Блокировку записи в SQLite уже взял BEGIN IMMEDIATE, в других БД
+        # пустое обновление блокирует строку состояния, поэтому параллельные
+        # процессы свертки ждут друг друга, а не забирают одну и ту же пачку
+        if not PunchLogState.objects.filter(pk=1).update(compacted_id=F('compacted_id')):
+            PunchLogState.objects.create(pk=1)
+        compacted_id = PunchLogState.objects.values_list('compacted_id', flat=True).get(pk=1)
+
+        events = list(
+            PunchEvent.objects.filter(id__gt=compacted_id)
+            .order_by('id')
+            .values_list('id', 'user_id', 'timestamp', 'direction')[:batch_size]
+        )
+        if not events:
+            return 0
+        PunchLogState.objects.filter(pk=1).update(compacted_id=events[-1][0])
+        apply_events(events)
+    return len(events)
+
+
+def compact_pending(batch_size=COMPACT_BATCH_SIZE):
+    """Сворачивает все накопившиеся события; возвращает их число"""
+    if not has_pending():
+        return 0
+    total = 0
+    while True:
+        count = compact(batch_size)
+        if not count:
+            return total
+        total += count
+
+
+def try_compact_pending(batch_size=COMPACT_BATCH_SIZE):
+    """
+    compact_pending для запросов отметок: ошибка свертки не ломает
+    отметку, а пишется в лог; пачка откатывается и остается в журнале
+    """
+    try:
+        return compact_pending(batch_size)
+    except DatabaseError:
+        logger.exception('Свертка журнала отметок не удалась, события остаются в журнале')
+        return 0
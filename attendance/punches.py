@@ -0,0 +1,104 @@
+"""
+Отметки прихода и ухода.
+
+Каждая отметка - одна условная запись в таблицу посещаемости без
+предварительного чтения. Двойной приход отсекает частичный уникальный
+индекс attendance_one_open_shift, двойной уход - условие is_present
+в UPDATE, поэтому параллельные запросы и повторные нажатия не создают
+лишних открытых смен.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from . import bitmaps
+from .locking import retry_on_lock, write_transaction
+from .models import Attendance
+from .roster import refresh_roster
+from .summary import add_closed_shift
+
+
+@retry_on_lock
+def check_in(user_id, at=None):
+    """Открывает смену; если смена уже открыта, возвращает None"""
+    with write_transaction():
+        try:
+            # Точка сохранения только вокруг вставки: IntegrityError здесь -
+            # уже открытая смена, а ошибки записи карт присутствия не маскируются
+            with transaction.atomic():
+                attendance = Attendance.objects.create(
+                    user_id=user_id,
+                    check_in=at or timezone.now(),
+                    is_present=True
+                )
+        except IntegrityError:
+            return None
+        bitmaps.mark([(user_id, timezone.localdate(attendance.check_in))])
+    refresh_roster([user_id], shifts=[attendance])
+    return attendance
+
+
+def _column(name):
+    return connection.ops.quote_name(Attendance._meta.get_field(name).column)
+
+
+# Отработанные секунды от check_in до времени ухода (параметр %s),
+# округленные как в Attendance.compute_worked_seconds
+WORKED_SECONDS_SQL = {
+    'sqlite': 'MAX(CAST(ROUND((julianday(%s) - julianday({check_in})) * 86400) AS INTEGER), 0)',
+    'postgresql': 'GREATEST(ROUND(EXTRACT(EPOCH FROM (%s - {check_in})))::integer, 0)',
+}
+
+
+def _close_returning_sql(user_id, at):
+    """UPDATE ... RETURNING, закрывающий открытую смену работника"""
+    table = connection.ops.quote_name(Attendance._meta.db_table)
+    worked_seconds = WORKED_SECONDS_SQL[connection.vendor].format(check_in=_column('check_in'))
+    # Условие "AND is_present" записано так же, как в частичном индексе
+    # attendance_one_open_shift, чтобы UPDATE искал смену по нему
+    sql = (
+        f"UPDATE {table} SET {_column('check_out')} = %s, {_column('is_present')} = %s, "
+        f"{_column('worked_seconds')} = {worked_seconds} "
+        f"WHERE {_column('user')} = %s AND {_column('is_present')} "
+        f"RETURNING *"
+    )
+    at = connection.ops.adapt_datetimefield_value(at)
+    return sql, [at, False, at, user_id]
+
+
+def _close_returning(user_id, at):
+    """Закрывает смену и читает ее за один запрос"""
+    closed = list(Attendance.objects.raw(*_close_returning_sql(user_id, at)))
+    return closed[0] if closed else None
+
+
+def _close_select_update(user_id, at):
+    """Для баз без RETURNING: чтение открытой смены и условный UPDATE по ней"""
+    attendance = Attendance.objects.filter(user_id=user_id, is_present=True).first()
+    if attendance is None:
+        return None
+    worked_seconds = Attendance.compute_worked_seconds(attendance.check_in, at)
+    if not Attendance.objects.filter(pk=attendance.pk, is_present=True).update(
+        check_out=at, is_present=False, worked_seconds=worked_seconds
+    ):
+        return None
+    attendance.check_out = at
+    attendance.is_present = False
+    attendance.worked_seconds = worked_seconds
+    return attendance
+
+
+@retry_on_lock
+def check_out(user_id, at=None):
+    """Закрывает открытую смену; если открытой смены нет, возвращает None"""
+    at = at or timezone.now()
+    with write_transaction():
+        # Поддержка RETURNING в INSERT и UPDATE появилась в SQLite одновременно (3.35)
+        if connection.vendor in WORKED_SECONDS_SQL and connection.features.can_return_columns_from_insert:
+            attendance = _close_returning(user_id, at)
+        else:
+            attendance = _close_select_update(user_id, at)
+        if attendance is None:
+            return None
+        add_closed_shift(attendance)
+        refresh_roster([user_id], shifts=[attendance])
+    return attendance
@@ -0,0 +1,35 @@
+"""
+Кэш итогов отчетов за прошедшие дни.
+
+Итоги закрытых смен за дни до сегодняшнего меняются только при правках
+(в админке, при загрузке запоздавших отметок, при закрытии ночной смены
+на следующий день), и каждая такая запись сдвигает версии этих дней
+по месяцам (versions). Поэтому итоги прошедших дней хранятся в кэше
+бессрочно по ключу фильтров отчета (начало, конец, работник) вместе
+с версиями, при которых они посчитаны; запись с устаревшими версиями
+просто считается заново. Сегодняшний день и открытые смены отчет
+считает каждый раз.
+"""
+from django.core.cache import cache
+
+from . import versions
+
+REPORT_KEY = 'attendance:report:{}:{}:{}'
+
+
+def past_rows(start, end, user_id, compute):
+    """
+    Строки итогов за прошедшие дни с start (None - с первого дня) по end.
+
+    compute() считает строки по БД; результат должен быть списком.
+    """
+    key = REPORT_KEY.format(start or '', end, user_id or '')
+    # Версии читаются до расчета: если итоги изменятся во время расчета,
+    # запись сохранится со старыми версиями и при следующем чтении не подойдет
+    current = versions.past_versions(start, end, user_id)
+    cached = cache.get(key)
+    if cached is not None and cached['versions'] == current:
+        return cached['rows']
+    rows = compute()
+    cache.set(key, {'versions': current, 'rows': rows}, None)
+    return rows
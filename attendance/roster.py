@@ -0,0 +1,129 @@
+"""
+Кэш данных главной страницы администратора: кто сейчас на работе
+и последние записи посещаемости.
+
+Кэш хранится в Django cache framework и обновляется сквозной записью
+после каждой отметки прихода/ухода и правки в админке, поэтому в обычном
+режиме главная страница не обращается к таблице посещаемости. Отметка
+меняет в кэше только строки своих смен; правки в админке, архивирование
+и генерация данных перечитывают кэш целиком. Отрисованные
+таблицы кэшируются в шаблоне по версии данных (version), а изменения
+состава рассылаются живым табло (presence).
+
+Кэш помечен общей версией данных (versions), при которой он собран.
+Если версия в БД другая (данные изменил другой процесс сервера, а кэш
+у процессов свой), кэш перечитывается.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import presence, versions
+from .models import Attendance, User
+
+ROSTER_CACHE_KEY = 'attendance:roster'
+RECENT_ATTENDANCES_LIMIT = 10
+
+ROW_FIELDS = (
+    'id', 'user_id', 'user__full_name', 'user__position', 'check_in', 'check_out', 'is_present', 'worked_seconds',
+)
+
+
+def attendance_row(values):
+    """Простая строка для шаблона из values() записи посещаемости"""
+    worked_seconds = values['worked_seconds']
+    return {
+        'id': values['id'],
+        'user': {
+            'id': values['user_id'],
+            'full_name': values['user__full_name'],
+            'position': values['user__position'],
+        },
+        'check_in': values['check_in'],
+        'check_out': values['check_out'],
+        'is_present': values['is_present'],
+        'status': 'На работе' if values['is_present'] else 'Ушел',
+        'work_duration': round(worked_seconds / 3600, 2) if worked_seconds is not None else None,
+    }
+
+
+def _load_roster(version):
+    present = Attendance.objects.filter(is_present=True).order_by('-check_in').values(*ROW_FIELDS)
+    recent = Attendance.objects.order_by('-check_in').values(*ROW_FIELDS)[:RECENT_ATTENDANCES_LIMIT]
+    return {
+        'present': [attendance_row(values) for values in present],
+        'recent': [attendance_row(values) for values in recent],
+        # Версия данных: ключ кэша отрисованных таблиц главной страницы
+        'version': version,
+    }
+
+
+def _shift_values(shifts):
+    """values() записей посещаемости по объектам смен: одним запросом ФИО и должностей"""
+    users = {
+        user['id']: user
+        for user in User.objects.filter(id__in={shift.user_id for shift in shifts}).values('id', 'full_name', 'position')
+    }
+    return [
+        {
+            'id': shift.pk,
+            'user_id': shift.user_id,
+            'user__full_name': users[shift.user_id]['full_name'],
+            'user__position': users[shift.user_id]['position'],
+            'check_in': shift.check_in,
+            'check_out': shift.check_out,
+            'is_present': shift.is_present,
+            'worked_seconds': shift.worked_seconds,
+        }
+        for shift in shifts
+    ]
+
+
+def _apply_shifts(roster, rows, version):
+    """
+    Состав кэша с замененными или добавленными строками смен rows.
+    Закрытая смена старше последней из списка последних записей
+    после сортировки в него не попадает, как и при чтении из БД.
+    """
+    changed = {row['id'] for row in rows}
+    newest_first = {'key': lambda row: row['check_in'], 'reverse': True}
+    present = [row for row in roster['present'] if row['id'] not in changed]
+    recent = [row for row in roster['recent'] if row['id'] not in changed]
+    return {
+        'present': sorted(present + [row for row in rows if row['is_present']], **newest_first),
+        'recent': sorted(recent + rows, **newest_first)[:RECENT_ATTENDANCES_LIMIT],
+        'version': version,
+    }
+
+
+def get_roster():
+    """Кто сейчас на работе и последние записи; при промахе или устаревшем кэше читает БД"""
+    version = versions.attendance_version()
+    roster = cache.get(ROSTER_CACHE_KEY)
+    if roster is None or roster['version'] != version:
+        roster = _load_roster(version)
+        cache.set(ROSTER_CACHE_KEY, roster, settings.ATTENDANCE_ROSTER_CACHE_TIMEOUT)
+    return roster
+
+
+def refresh_roster(user_ids=None, shifts=None):
+    """
+    Сдвигает версии данных и обновляет кэш после фиксации текущей
+    транзакции; user_ids - чьи смены изменились (None - неизвестно).
+
+    shifts - измененные отметкой смены: в кэш подставляются только их
+    строки. Без shifts, при пустом кэше или кэше, устаревшем еще до этой
+    записи, кэш перечитывается из БД.
+    """
+    def refresh():
+        previous = cache.get(ROSTER_CACHE_KEY)
+        current = previous is not None and previous['version'] == versions.attendance_version()
+        version = versions.bump(user_ids)
+        if shifts and current:
+            roster = _apply_shifts(previous, [attendance_row(values) for values in _shift_values(shifts)], version)
+        else:
+            roster = _load_roster(version)
+        cache.set(ROSTER_CACHE_KEY, roster, settings.ATTENDANCE_ROSTER_CACHE_TIMEOUT)
+        presence.publish_roster(previous, roster)
+
+    transaction.on_commit(refresh)
@@ -0,0 +1,134 @@
+"""
+Ежедневные итоги посещаемости (DailyAttendanceSummary).
+
+Итоги содержат только закрытые смены и ведутся инкрементально: закрытие
+смены в check_in_out прибавляет ее к итогам дня, а правка записи в админке
+пересчитывает затронутые дни. Для заполнения и полного пересчета есть
+команда rebuild_attendance_summary.
+
+Каждая запись итогов за прошедшие дни сдвигает их версии (versions)
+после фиксации транзакции - по ним сбрасывается кэш отчетов. Пересчет
+итогов пересчитывает и битовые карты присутствия тех же дней (bitmaps).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, DateField, F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import bitmaps, versions
+from .archive import archive_cutoff
+from .models import ArchivedAttendance, Attendance, DailyAttendanceSummary
+
+
+def work_date(check_in):
+    """Рабочая дата смены: дата прихода в часовом поясе проекта"""
+    return timezone.localtime(check_in).date()
+
+
+def day_start(day):
+    """Начало дня в часовом поясе проекта"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def add_closed_shift(attendance):
+    """Прибавляет только что закрытую смену к итогам ее дня"""
+    seconds = attendance.worked_seconds or 0
+    day = work_date(attendance.check_in)
+    with transaction.atomic():
+        updated = DailyAttendanceSummary.objects.filter(
+            user_id=attendance.user_id, work_date=day
+        ).update(shifts=F('shifts') + 1, worked_seconds=F('worked_seconds') + seconds)
+        if not updated:
+            DailyAttendanceSummary.objects.create(
+                user_id=attendance.user_id, work_date=day, shifts=1, worked_seconds=seconds
+            )
+    # Обычно смена закрывается в день прихода, и прошедшие дни не меняются
+    if day < timezone.localdate():
+        transaction.on_commit(lambda: versions.bump_past_days(day, day, [attendance.user_id]))
+
+
+def _closed_shifts_of_day(attendances, day):
+    """
+    Итоги закрытых смен одного дня, сгруппированные по работнику:
+    (user_id, дата, смен, секунд).
+
+    Диапазон check_in идет по индексу, и дата не вычисляется для каждой
+    строки (в SQLite это вызов функции Python на строку).
+    """
+    return attendances.filter(
+        is_present=False,
+        check_in__gte=day_start(day),
+        check_in__lt=day_start(day + timedelta(days=1)),
+    ).values('user_id').annotate(
+        work_date=Value(day, output_field=DateField()),
+        shifts=Count('id'),
+        worked_seconds=Coalesce(Sum('worked_seconds'), 0),
+    ).values_list('user_id', 'work_date', 'shifts', 'worked_seconds').order_by()
+
+
+def rebuild_summary(start, end, user_ids=None):
+    """
+    Пересчитывает итоги за дни с start по end включительно из записей посещаемости.
+
+    user_ids ограничивает пересчет указанными работниками.
+    Возвращает количество записанных строк итогов.
+
+    Строки итогов пишутся в БД через INSERT ... SELECT по дню, без
+    загрузки в Python, поэтому полный пересчет за годы идет минутами, а не часами.
+    Дни до границы архива складываются из рабочей таблицы и архива.
+    """
+    attendances = Attendance.objects.all()
+    archived = ArchivedAttendance.objects.all()
+    summaries = DailyAttendanceSummary.objects.filter(work_date__gte=start, work_date__lte=end)
+    if user_ids is not None:
+        attendances = attendances.filter(user_id__in=user_ids)
+        archived = archived.filter(user_id__in=user_ids)
+        summaries = summaries.filter(user_id__in=user_ids)
+    cutoff = archive_cutoff()
+
+    opts = DailyAttendanceSummary._meta
+    insert = 'INSERT INTO {} ({}) '.format(
+        connection.ops.quote_name(opts.db_table),
+        ', '.join(
+            connection.ops.quote_name(opts.get_field(name).column)
+            for name in ('user', 'work_date', 'shifts', 'worked_seconds')
+        ),
+    )
+    total = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        summaries.delete()
+        day = start
+        while day <= end:
+            if day_start(day) < cutoff:
+                total += _merge_archived_day(attendances, archived, day)
+            else:
+                sql, params = _closed_shifts_of_day(attendances, day).query.sql_with_params()
+                cursor.execute(insert + sql, params)
+                total += cursor.rowcount
+            day += timedelta(days=1)
+        bitmaps.rebuild(start, end, user_ids)
+    transaction.on_commit(lambda: versions.bump_past_days(start, end, user_ids))
+    return total
+
+
+def _merge_archived_day(attendances, archived, day):
+    """Итоги дня до границы архива: смены из архива и оставшиеся в рабочей таблице"""
+    totals = {}
+    for shifts_of_day in (_closed_shifts_of_day(archived, day), _closed_shifts_of_day(attendances, day)):
+        for user_id, _, shifts, seconds in shifts_of_day:
+            total_shifts, total_seconds = totals.get(user_id, (0, 0))
+            totals[user_id] = (total_shifts + shifts, total_seconds + seconds)
+    DailyAttendanceSummary.objects.bulk_create([
+        DailyAttendanceSummary(user_id=user_id, work_date=day, shifts=shifts, worked_seconds=seconds)
+        for user_id, (shifts, seconds) in totals.items()
+    ], batch_size=1000)
+    return len(totals)
+
+
+def rebuild_days(user_days):
+    """Пересчитывает итоги для набора пар (user_id, дата), например после правки записей"""
+    for user_id, day in set(user_days):
+        rebuild_summary(day, day, user_ids=[user_id])
+
@@ -0,0 +1,147 @@
+"""
+Генератор синтетической посещаемости для нагрузочных проверок.
+
+Каждому работнику назначается график (дневной, вечерний или ночной),
+пунктуальность и выходные. По дням генерируются опоздания, ранние
+уходы, прогулы, ночные смены через полночь и незакрытые текущие смены.
+Генератор детерминирован при одинаковом seed.
+"""
+import random
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Attendance, User
+
+# (название, час начала, длительность в часах, доля работников)
+SCHEDULES = [
+    ('day', 8, 9, 0.7),
+    ('evening', 14, 9, 0.15),
+    ('night', 20, 12, 0.15),
+]
+POSITIONS = ['Рабочий', 'Бригадир', 'Технолог', 'Лаборант', 'Кладовщик', 'Оператор линии']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Волков', 'Соколов']
+FIRST_NAMES = ['Иван', 'Петр', 'Алексей', 'Сергей', 'Андрей', 'Дмитрий', 'Николай', 'Михаил']
+
+ABSENCE_RATE = 0.04
+EARLY_LEAVE_RATE = 0.03
+
+
+def create_workers(count, prefix='gen', password='worker123', batch_size=5000, joined=None):
+    """
+    Создает count работников с одним и тем же паролем, принятых на работу
+    в момент joined (по умолчанию сейчас); возвращает их id
+    """
+    offset = User.objects.filter(username__startswith=prefix).count()
+    password_hash = make_password(password)  # хэш считается один раз на всех
+    rng = random.Random(offset)
+    users = [
+        User(
+            username=f'{prefix}{offset + i:06d}',
+            password=password_hash,
+            full_name=f'{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)} ({offset + i})',
+            position=rng.choice(POSITIONS),
+            role='worker',
+            date_joined=joined or timezone.now(),
+        )
+        for i in range(count)
+    ]
+    User.objects.bulk_create(users, batch_size=batch_size)
+    # Логины дополнены нулями, поэтому новые работники - диапазон логинов
+    return list(User.objects.filter(
+        username__startswith=prefix, username__gte=f'{prefix}{offset:06d}'
+    ).order_by('id').values_list('id', flat=True))
+
+
+def _profile(rng):
+    """График работника: название, начало, длительность, доля опозданий, выходные дни недели"""
+    roll = rng.random()
+    for name, start_hour, hours, share in SCHEDULES:
+        if roll < share:
+            break
+        roll -= share
+    late_rate = rng.choice([0.02, 0.05, 0.1, 0.25])
+    days_off = {5, 6} if name == 'day' else set(rng.sample(range(7), 2))
+    return name, start_hour, hours, late_rate, days_off
+
+
+def _days(start, end):
+    """(день недели, начало дня в UTC) для каждого дня периода"""
+    days = []
+    day = start
+    while day <= end:
+        midnight = timezone.make_aware(datetime.combine(day, time.min))
+        days.append((day.weekday(), midnight.astimezone(dt_timezone.utc)))
+        day += timedelta(days=1)
+    return days
+
+
+def generate_shifts(user_ids, start, end, seed=1, now=None, skip_open=()):
+    """
+    Генерирует смены с start по end включительно как кортежи
+    (user_id, check_in, check_out, is_present, worked_seconds).
+
+    Смена, начавшаяся до now и не закончившаяся к нему, остается открытой,
+    кроме работников из skip_open - у них такая смена пропускается.
+    """
+    now = now or timezone.now()
+    days = _days(start, end)
+    for user_id in user_ids:
+        rng = random.Random(f'{seed}:{user_id}')
+        _, start_hour, hours, late_rate, days_off = _profile(rng)
+
+        for weekday, midnight in days:
+            if weekday in days_off or rng.random() < ABSENCE_RATE:
+                continue
+
+            planned_in = midnight + timedelta(hours=start_hour)
+            check_in = planned_in + timedelta(minutes=rng.randint(-15, 5))
+            if rng.random() < late_rate:
+                check_in = planned_in + timedelta(minutes=rng.randint(5, 90))
+            check_out = planned_in + timedelta(hours=hours, minutes=rng.randint(-5, 40))
+            if rng.random() < EARLY_LEAVE_RATE:
+                check_out -= timedelta(minutes=rng.randint(30, 180))
+
+            if check_in > now:
+                break
+            if check_out > now:
+                if user_id not in skip_open:
+                    yield user_id, check_in, None, True, None
+                break
+            yield user_id, check_in, check_out, False, Attendance.compute_worked_seconds(check_in, check_out)
+
+
+def bulk_insert(shifts, batch_size=5000):
+    """
+    Сохраняет смены пачками по batch_size, каждая пачка - одна транзакция.
+
+    Строки вставляются одним executemany без создания объектов модели:
+    на миллионах смен это в разы быстрее bulk_create.
+    """
+    opts = Attendance._meta
+    fields = [opts.get_field(name) for name in ('user', 'check_in', 'check_out', 'is_present', 'worked_seconds')]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(opts.db_table),
+        ', '.join(connection.ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+
+    # Значения уже нужных типов, адаптировать для БД нужно только даты
+    adapt = connection.ops.adapt_datetimefield_value
+
+    def prepare(shift):
+        user_id, check_in, check_out, is_present, worked_seconds = shift
+        return user_id, adapt(check_in), adapt(check_out), is_present, worked_seconds
+
+    total = 0
+    shifts = iter(shifts)
+    while True:
+        batch = [prepare(shift) for shift in islice(shifts, batch_size)]
+        if not batch:
+            return total
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+        total += len(batch)
@@ -0,0 +1,113 @@
+"""
+Иерархия дат для списка посещаемости в админке.
+
+Стандартный тег date_hierarchy строит годы, месяцы и дни через
+SELECT DISTINCT по усеченной дате - это полный проход по таблице (в SQLite
+еще и вызов функции Python на строку). Здесь границы берутся двумя
+запросами ORDER BY ... LIMIT 1, а каждый год, месяц или день проверяется
+запросом EXISTS по диапазону check_in - все по индексу.
+"""
+from datetime import date, timedelta
+
+from django import template
+from django.utils import formats, timezone
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+from ..summary import day_start
+
+register = template.Library()
+
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=31)).replace(day=1)
+
+
+def _has_rows(queryset, field_name, start, end):
+    return queryset.filter(**{
+        f'{field_name}__gte': day_start(start), f'{field_name}__lt': day_start(end),
+    }).exists()
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def indexed_date_hierarchy(cl):
+    """То же, что date_hierarchy, но по индексу поля даты"""
+    field_name = cl.date_hierarchy
+    year_field = f'{field_name}__year'
+    month_field = f'{field_name}__month'
+    day_field = f'{field_name}__day'
+    year_lookup = cl.params.get(year_field)
+    month_lookup = cl.params.get(month_field)
+    day_lookup = cl.params.get(day_field)
+    queryset = cl.queryset.order_by()
+
+    def link(filters):
+        return cl.get_query_string(filters, [f'{field_name}__'])
+
+    if year_lookup and month_lookup and day_lookup:
+        first = last = None
+    else:
+        # Границы списка уже отфильтрованы по выбранному году или месяцу
+        values = queryset.values_list(field_name, flat=True)
+        first = values.order_by(field_name).first()
+        last = values.order_by(f'-{field_name}').first()
+        if first is None:
+            return {'show': bool(year_lookup), 'back': {'link': link({}), 'title': _('All dates')}, 'choices': []}
+        first, last = timezone.localdate(first), timezone.localdate(last)
+
+    if not (year_lookup or month_lookup or day_lookup) and first.year == last.year:
+        year_lookup = first.year
+        if first.month == last.month:
+            month_lookup = first.month
+
+    if year_lookup and month_lookup and day_lookup:
+        day = date(int(year_lookup), int(month_lookup), int(day_lookup))
+        return {
+            'show': True,
+            'back': {
+                'link': link({year_field: year_lookup, month_field: month_lookup}),
+                'title': capfirst(formats.date_format(day, 'YEAR_MONTH_FORMAT')),
+            },
+            'choices': [{'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT'))}],
+        }
+    elif year_lookup and month_lookup:
+        month = date(int(year_lookup), int(month_lookup), 1)
+        days = [month + timedelta(days=offset) for offset in range((_next_month(month) - month).days)]
+        return {
+            'show': True,
+            'back': {'link': link({year_field: year_lookup}), 'title': str(year_lookup)},
+            'choices': [
+                {
+                    'link': link({year_field: year_lookup, month_field: month_lookup, day_field: day.day}),
+                    'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT')),
+                }
+                for day in days
+                if first <= day <= last and _has_rows(queryset, field_name, day, day + timedelta(days=1))
+            ],
+        }
+    elif year_lookup:
+        months = [date(int(year_lookup), number, 1) for number in range(1, 13)]
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [
+                {
+                    'link': link({year_field: year_lookup, month_field: month.month}),
+                    'title': capfirst(formats.date_format(month, 'YEAR_MONTH_FORMAT')),
+                }
+                for month in months
+                if first.replace(day=1) <= month <= last
+                and _has_rows(queryset, field_name, month, _next_month(month))
+            ],
+        }
+    else:
+        years = [date(year, 1, 1) for year in range(first.year, last.year + 1)]
+        return {
+            'show': True,
+            'back': None,
+            'choices': [
+                {'link': link({year_field: str(year.year)}), 'title': str(year.year)}
+                for year in years
+                if _has_rows(queryset, field_name, year, year.replace(year=year.year + 1))
+            ],
+        }
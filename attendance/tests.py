@@ -1,7 +1,12 @@
-from django.test import TestCase
+import io
+import json
+from datetime import datetime
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import authenticate
 from django.utils import timezone
-from .models import User, Attendance
+from .models import User, Attendance, DailyAttendanceSummary, PunchEvent
 
 
 class UserModelTest(TestCase):
@@ -126,3 +131,1939 @@ class RoleBasedAccessTest(TestCase):
         # Должны получить доступ (200) или быть перенаправлены на логин если не аутентифицированы
         # В данном случае проверяем что нет ошибки доступа
         self.assertIn(response.status_code, [200, 302])
+
+
+class ReportsAggregationTest(TestCase):
+    """Тесты для агрегации отчетов в базе данных"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.admin = User.objects.create_user(
+            username='report_admin',
+            full_name='Админ Отчетов',
+            position='Администратор',
+            role='admin'
+        )
+        self.worker = User.objects.create_user(
+            username='report_worker',
+            full_name='Рабочий Отчетов',
+            position='Рабочий',
+            role='worker'
+        )
+        check_in = timezone.now() - timezone.timedelta(days=2)
+        for i in range(3):
+            Attendance.objects.create(
+                user=self.worker,
+                check_in=check_in - timezone.timedelta(days=i),
+                check_out=check_in - timezone.timedelta(days=i) + timezone.timedelta(hours=8, minutes=15),
+                is_present=False
+            )
+        # Открытая смена не добавляет часов, но учитывается в днях
+        Attendance.objects.create(user=self.worker, check_in=timezone.now(), is_present=True)
+        call_command('rebuild_attendance_summary', stdout=io.StringIO())
+
+    def test_reports_totals_per_worker(self):
+        """Тест итогов по работнику"""
+        from django.test import Client
+        client = Client()
+        client.force_login(self.admin)
+
+        response = client.get('/reports/')
+
+        stats = response.context['users_stats']
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['user']['id'], self.worker.id)
+        self.assertEqual(stats[0]['total_days'], 4)
+        self.assertAlmostEqual(stats[0]['total_hours'], 24.75, places=2)
+
+    def test_reports_query_count_independent_of_rows(self):
+        """Тест что количество запросов не зависит от количества смен"""
+        from django.test import Client
+        client = Client()
+        client.force_login(self.admin)
+
+        # сессия, пользователь, версии (ETag и кэш отчета), итоги прошедших дней и сегодня,
+        # открытые смены, список работников
+        with self.assertNumQueries(8):
+            client.get('/reports/', {'user_id': self.worker.id})
+
+
+@override_settings(ATTENDANCE_PUNCH_LOG=False)
+class ReportCacheTest(TestCase):
+    """Тесты для кэша итогов отчетов за прошедшие дни"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import Client
+        cache.clear()
+        self.admin = User.objects.create_user(username='cache_admin', full_name='Админ', role='admin')
+        self.worker = User.objects.create_user(username='cache_worker', full_name='Рабочий', role='worker')
+        self.other = User.objects.create_user(username='cache_other', full_name='Другой', role='worker')
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.past = Attendance.objects.create(
+            user=self.worker,
+            check_in=timezone.now() - timezone.timedelta(days=3),
+            check_out=timezone.now() - timezone.timedelta(days=3) + timezone.timedelta(hours=8),
+            is_present=False,
+        )
+        call_command('rebuild_attendance_summary', stdout=io.StringIO())
+
+    def hours(self, **params):
+        stats = self.client.get('/reports/', params).context['users_stats']
+        return {stat['user']['id']: stat['total_hours'] for stat in stats}
+
+    def test_repeated_report_reads_past_days_from_cache(self):
+        """Тест что повторный отчет не пересчитывает прошедшие дни"""
+        self.hours()
+
+        # сессия, пользователь, версии (ETag и кэш отчета), итоги за сегодня, открытые смены, список работников
+        with self.assertNumQueries(7):
+            self.assertEqual(self.hours(), {self.worker.id: 8})
+
+    def test_admin_edit_invalidates_past_days(self):
+        """Тест что правка прошедшей смены в админке сбрасывает кэш"""
+        self.admin.is_staff = self.admin.is_superuser = True
+        self.admin.save()
+        self.assertEqual(self.hours(), {self.worker.id: 8})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/admin/attendance/attendance/{self.past.id}/delete/', {'post': 'yes'})
+
+        self.assertEqual(self.hours(), {})
+
+    def test_today_is_live_and_keeps_cache(self):
+        """Тест что сегодняшние смены считаются заново, не сбрасывая кэш прошедших дней"""
+        from .punches import check_in, check_out
+        self.hours()
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            check_in(self.worker.id, at=now - timezone.timedelta(minutes=30))
+            check_out(self.worker.id, at=now)
+
+        with self.assertNumQueries(7):
+            self.assertEqual(self.hours(), {self.worker.id: 8.5})
+
+    def test_overnight_shift_invalidates_its_day(self):
+        """Тест что закрытие смены, начатой в прошлый день, сбрасывает кэш этого дня"""
+        from .punches import check_in, check_out
+        check_in(self.worker.id, at=self.past.check_out + timezone.timedelta(hours=1))
+        self.assertEqual(self.hours(), {self.worker.id: 8})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            check_out(self.worker.id, at=self.past.check_out + timezone.timedelta(hours=3))
+
+        self.assertEqual(self.hours(), {self.worker.id: 10})
+
+    def test_other_worker_edit_keeps_worker_report(self):
+        """Тест что изменения другого работника не сбрасывают отчет по работнику"""
+        from .summary import rebuild_days, work_date
+        self.hours(user_id=self.worker.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild_days([(self.other.id, work_date(self.past.check_in))])
+
+        with self.assertNumQueries(7):
+            self.hours(user_id=self.worker.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild_days([(self.worker.id, work_date(self.past.check_in))])
+        with self.assertNumQueries(8):
+            self.hours(user_id=self.worker.id)
+
+    def test_worker_filter_is_normalized(self):
+        """Тест что "05" - тот же работник и тот же кэш, что "5", а нецифровой фильтр не учитывается"""
+        from .summary import rebuild_days, work_date
+        self.assertEqual(self.hours(user_id=self.worker.id), {self.worker.id: 8})
+
+        padded = f'0{self.worker.id}'
+        with self.assertNumQueries(7):
+            self.assertEqual(self.hours(user_id=padded), {self.worker.id: 8})
+        self.past.check_out += timezone.timedelta(hours=1)
+        self.past.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild_days([(self.worker.id, work_date(self.past.check_in))])
+        self.assertEqual(self.hours(user_id=padded), {self.worker.id: 9})
+
+        response = self.client.get('/reports/', {'user_id': 'abc'})
+        self.assertIsNone(response.context['user_id'])
+
+    def test_period_filters_are_cached_separately(self):
+        """Тест что отчеты за разные периоды не смешиваются"""
+        day = timezone.localdate(self.past.check_in)
+
+        self.assertEqual(self.hours(start_date=day.isoformat(), end_date=day.isoformat()), {self.worker.id: 8})
+        self.assertEqual(self.hours(start_date=(day + timezone.timedelta(days=1)).isoformat()), {})
+
+
+class OpenShiftConstraintTest(TestCase):
+    """Тесты для ограничения на открытые смены"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='constraint_worker',
+            full_name='Рабочий Ограничения',
+            position='Рабочий',
+            role='worker'
+        )
+
+    def test_only_one_open_shift_per_user(self):
+        """Тест что у работника может быть только одна открытая смена"""
+        from django.db import IntegrityError, transaction
+        Attendance.objects.create(user=self.user, check_in=timezone.now(), is_present=True)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Attendance.objects.create(user=self.user, check_in=timezone.now(), is_present=True)
+
+    def test_closed_shifts_are_not_limited(self):
+        """Тест что закрытых смен может быть сколько угодно"""
+        Attendance.objects.create(user=self.user, check_in=timezone.now(), is_present=True)
+        for i in range(3):
+            Attendance.objects.create(
+                user=self.user,
+                check_in=timezone.now() - timezone.timedelta(days=i + 1),
+                check_out=timezone.now() - timezone.timedelta(days=i + 1, hours=-8),
+                is_present=False
+            )
+        self.assertEqual(Attendance.objects.filter(user=self.user).count(), 4)
+
+
+class ReportsExportTest(TestCase):
+    """Тесты для потоковой выгрузки отчетов в CSV"""
+
+    def setUp(self):
+        from django.test import Client
+        self.admin = User.objects.create_user(
+            username='export_admin',
+            full_name='Админ Выгрузки',
+            position='Администратор',
+            role='admin'
+        )
+        self.worker = User.objects.create_user(
+            username='export_worker',
+            full_name='Рабочий Выгрузки',
+            position='Рабочий',
+            role='worker'
+        )
+        check_in = timezone.now() - timezone.timedelta(days=1)
+        Attendance.objects.create(
+            user=self.worker,
+            check_in=check_in,
+            check_out=check_in + timezone.timedelta(hours=8),
+            is_present=False
+        )
+        Attendance.objects.create(user=self.worker, check_in=timezone.now(), is_present=True)
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def test_export_streams_csv(self):
+        """Тест выгрузки CSV"""
+        import csv
+        import io
+        response = self.client.get('/reports/export/', {'user_id': self.worker.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(rows[0][0], 'ФИО')
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][5], '8.0')
+        self.assertEqual(rows[2][6], 'На работе')
+
+    def test_export_gzip(self):
+        """Тест выгрузки CSV, сжатой gzip"""
+        import gzip
+        response = self.client.get('/reports/export/', {'gzip': '1'})
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        content = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        self.assertIn('Рабочий Выгрузки', content)
+
+    def test_export_worker_denied(self):
+        """Тест запрета выгрузки для работника"""
+        self.client.force_login(self.worker)
+        response = self.client.get('/reports/export/')
+        self.assertEqual(response.status_code, 302)
+
+
+class UserDetailPaginationTest(TestCase):
+    """Тесты для постраничной истории посещаемости по курсору"""
+
+    def setUp(self):
+        from django.test import Client
+        self.admin = User.objects.create_user(
+            username='pages_admin',
+            full_name='Админ Страниц',
+            position='Администратор',
+            role='admin'
+        )
+        self.worker = User.objects.create_user(
+            username='pages_worker',
+            full_name='Рабочий Страниц',
+            position='Рабочий',
+            role='worker'
+        )
+        base = timezone.now() - timezone.timedelta(days=30)
+        for i in range(7):
+            # Пары записей с одинаковым временем прихода проверяют сортировку по id
+            check_in = base + timezone.timedelta(days=i // 2)
+            Attendance.objects.create(
+                user=self.worker,
+                check_in=check_in,
+                check_out=check_in + timezone.timedelta(hours=8),
+                is_present=False
+            )
+        self.expected = list(Attendance.objects.filter(user=self.worker).order_by('-check_in', 'id'))
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.url = f'/user/{self.worker.id}/'
+
+    def test_walk_forward_and_back(self):
+        """Тест обхода всех страниц вперед и назад"""
+        from .views import _encode_cursor
+        pages = []
+        params = {'page_size': 3}
+        while True:
+            page = self.client.get(self.url, params).context['page']
+            pages.append(page['items'])
+            if not page['next_cursor']:
+                break
+            params = {'page_size': 3, 'after': page['next_cursor']}
+
+        self.assertEqual([len(items) for items in pages], [3, 3, 1])
+        self.assertEqual([att for items in pages for att in items], self.expected)
+
+        page = self.client.get(self.url, {'page_size': 3, 'before': _encode_cursor(pages[-1][0])}).context['page']
+        self.assertEqual(page['items'], pages[1])
+        page = self.client.get(self.url, {'page_size': 3, 'before': page['prev_cursor']}).context['page']
+        self.assertEqual(page['items'], pages[0])
+        self.assertIsNone(page['prev_cursor'])
+
+    def test_page_size_is_limited(self):
+        """Тест ограничения размера страницы"""
+        from django.test import override_settings
+        with override_settings(ATTENDANCE_HISTORY_MAX_PAGE_SIZE=2):
+            page = self.client.get(self.url, {'page_size': 1000}).context['page']
+        self.assertEqual(len(page['items']), 2)
+
+    def test_invalid_cursor_shows_first_page(self):
+        """Тест что некорректный курсор показывает первую страницу"""
+        page = self.client.get(self.url, {'after': 'garbage'}).context['page']
+        self.assertEqual(page['items'][0], self.expected[0])
+
+
+class UserDetailStatsTest(TestCase):
+    """Тесты для статистики работника по месяцам"""
+
+    def setUp(self):
+        from django.test import Client
+        from .summary import day_start
+        from .views import _add_months
+        self.admin = User.objects.create_user(username='stats_admin', full_name='Админ', role='admin')
+        self.worker = User.objects.create_user(username='stats_worker', full_name='Рабочий', role='worker')
+        self.today = timezone.localdate()
+        self.last_month = _add_months(self.today.replace(day=1), -1)
+        # Две смены сегодня и одна в прошлом месяце
+        for day, hour in ((self.today, 1), (self.today, 10), (self.last_month, 9)):
+            check_in = day_start(day) + timezone.timedelta(hours=hour)
+            Attendance.objects.create(
+                user=self.worker, check_in=check_in, check_out=check_in + timezone.timedelta(hours=4), is_present=False,
+            )
+        call_command('rebuild_attendance_summary', stdout=io.StringIO())
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.url = f'/user/{self.worker.id}/'
+
+    def test_month_counts_distinct_days(self):
+        """Тест что дни месяца - различные рабочие дни, а часы - сумма смен"""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context['total_days'], 1)
+        self.assertEqual(response.context['total_hours'], 8)
+        self.assertIsNone(response.context['months'])
+
+    def test_open_shift_adds_its_day_once(self):
+        """Тест что открытая смена добавляет день, только если в ее день нет закрытых смен"""
+        from .summary import day_start
+        open_shift = Attendance.objects.create(
+            user=self.worker, check_in=day_start(self.today) + timezone.timedelta(hours=20), is_present=True,
+        )
+        self.assertEqual(self.client.get(self.url).context['total_days'], 1)
+
+        Attendance.objects.filter(user=self.worker, check_in__gte=day_start(self.today)).exclude(pk=open_shift.pk).delete()
+        call_command('rebuild_attendance_summary', stdout=io.StringIO())
+        self.assertEqual(self.client.get(self.url).context['total_days'], 1)
+        self.assertEqual(self.client.get(self.url).context['total_hours'], 0)
+
+    def test_months_breakdown(self):
+        """Тест помесячной разбивки за год"""
+        months = self.client.get(self.url, {'months': '1'}).context['months']
+
+        self.assertEqual(len(months), 12)
+        self.assertEqual(months[0], {'month': self.today.replace(day=1), 'total_hours': 8, 'total_days': 1})
+        self.assertEqual(months[1], {'month': self.last_month, 'total_hours': 4, 'total_days': 1})
+        self.assertEqual(sum(month['total_days'] for month in months[2:]), 0)
+
+    def test_query_count_independent_of_shifts(self):
+        """Тест что число запросов не зависит от числа смен"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .summary import day_start
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url, {'months': '1', 'page_size': 2})
+
+        for day in range(1, 200):
+            check_in = day_start(self.today - timezone.timedelta(days=day)) + timezone.timedelta(hours=8)
+            Attendance.objects.create(
+                user=self.worker, check_in=check_in, check_out=check_in + timezone.timedelta(hours=8), is_present=False,
+            )
+        call_command('rebuild_attendance_summary', stdout=io.StringIO())
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(self.url, {'months': '1', 'page_size': 2})
+
+        self.assertEqual(len(many), len(few))
+
+
+class DailyAttendanceSummaryTest(TestCase):
+    """Тесты для ежедневных итогов посещаемости"""
+
+    def setUp(self):
+        from django.test import Client
+        self.admin = User.objects.create_superuser(
+            username='summary_admin',
+            password='admin123',
+            full_name='Админ Итогов',
+            position='Администратор',
+            role='admin'
+        )
+        self.worker = User.objects.create_user(
+            username='summary_worker',
+            full_name='Рабочий Итогов',
+            position='Рабочий',
+            role='worker'
+        )
+        self.client = Client()
+
+    @override_settings(ATTENDANCE_PUNCH_LOG=False)
+    def test_check_out_adds_shift_to_summary(self):
+        """Тест что уход с работы добавляет смену в итоги дня"""
+        self.client.force_login(self.worker)
+        self.client.post('/check-in-out/', {'action': 'check_in'})
+        self.assertFalse(DailyAttendanceSummary.objects.exists())
+
+        self.client.post('/check-in-out/', {'action': 'check_out'})
+        self.client.post('/check-in-out/', {'action': 'check_in'})
+        self.client.post('/check-in-out/', {'action': 'check_out'})
+
+        summary = DailyAttendanceSummary.objects.get(user=self.worker)
+        self.assertEqual(summary.shifts, 2)
+        self.assertEqual(summary.work_date, timezone.localdate())
+
+    def test_admin_edit_rebuilds_both_days(self):
+        """Тест что правка в админке пересчитывает старый и новый день"""
+        check_in = timezone.now() - timezone.timedelta(days=3)
+        attendance = Attendance.objects.create(
+            user=self.worker,
+            check_in=check_in,
+            check_out=check_in + timezone.timedelta(hours=8),
+            is_present=False
+        )
+        call_command('rebuild_attendance_summary', stdout=io.StringIO())
+        self.assertEqual(DailyAttendanceSummary.objects.get().worked_seconds, 8 * 3600)
+
+        self.client.force_login(self.admin)
+        new_check_in = check_in + timezone.timedelta(days=1)
+        local_in = timezone.localtime(new_check_in)
+        local_out = timezone.localtime(new_check_in + timezone.timedelta(hours=6))
+        response = self.client.post(f'/admin/attendance/attendance/{attendance.id}/change/', {
+            'user': self.worker.id,
+            'check_in_0': local_in.strftime('%d.%m.%Y'),
+            'check_in_1': local_in.strftime('%H:%M:%S'),
+            'check_out_0': local_out.strftime('%d.%m.%Y'),
+            'check_out_1': local_out.strftime('%H:%M:%S'),
+        })
+        self.assertEqual(response.status_code, 302)
+
+        summary = DailyAttendanceSummary.objects.get()
+        self.assertEqual(summary.work_date, local_in.date())
+        self.assertEqual(summary.worked_seconds, 6 * 3600)
+
+    def test_rebuild_command_range(self):
+        """Тест пересчета итогов только за указанный период"""
+        today = timezone.localdate()
+        for days_ago in (1, 10):
+            check_in = timezone.now() - timezone.timedelta(days=days_ago)
+            Attendance.objects.create(
+                user=self.worker,
+                check_in=check_in,
+                check_out=check_in + timezone.timedelta(hours=1),
+                is_present=False
+            )
+        start = (today - timezone.timedelta(days=5)).isoformat()
+        call_command('rebuild_attendance_summary', start=start, end=today.isoformat(), stdout=io.StringIO())
+
+        self.assertEqual(DailyAttendanceSummary.objects.count(), 1)
+
+
+class DashboardRosterCacheTest(TestCase):
+    """Тесты для кэша "Сейчас на работе" на главной странице"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import Client
+        cache.clear()
+        self.admin = User.objects.create_user(
+            username='roster_admin',
+            full_name='Админ Табло',
+            position='Администратор',
+            role='admin'
+        )
+        self.worker = User.objects.create_user(
+            username='roster_worker',
+            full_name='Рабочий Табло',
+            position='Рабочий',
+            role='worker'
+        )
+        self.admin_client = Client()
+        self.admin_client.force_login(self.admin)
+        self.worker_client = Client()
+        self.worker_client.force_login(self.worker)
+
+    def test_steady_state_dashboard_skips_attendance_table(self):
+        """Тест что повторная загрузка главной не читает таблицу посещаемости"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.admin_client.get('/')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.admin_client.get('/')
+
+        self.assertEqual(response.status_code, 200)
+        table = Attendance._meta.db_table
+        self.assertFalse([q for q in queries.captured_queries if table in q['sql']])
+
+    @override_settings(ATTENDANCE_PUNCH_LOG=False)
+    def test_punches_update_cached_roster(self):
+        """Тест что приход и уход сразу обновляют кэш"""
+        self.admin_client.get('/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.worker_client.post('/check-in-out/', {'action': 'check_in'})
+        response = self.admin_client.get('/')
+        self.assertEqual(len(response.context['current_attendances']), 1)
+        self.assertContains(response, 'Рабочий Табло')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.worker_client.post('/check-in-out/', {'action': 'check_out'})
+        response = self.admin_client.get('/')
+        self.assertEqual(response.context['current_attendances'], [])
+        self.assertEqual(response.context['recent_attendances'][0]['status'], 'Ушел')
+
+    def test_punch_updates_roster_without_reload(self):
+        """Тест что отметка меняет в кэше только свою смену, не перечитывая состав"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .punches import check_in, check_out
+        from .roster import get_roster
+        now = timezone.now()
+        other = Attendance.objects.create(user=self.admin, check_in=now - timezone.timedelta(hours=1), is_present=True)
+        get_roster()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            attendance = check_in(self.worker.id)
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+        self.assertFalse([q for q in queries.captured_queries if Attendance._meta.db_table in q['sql']])
+        self.assertEqual([row['id'] for row in get_roster()['present']], [attendance.id, other.id])
+        self.assertEqual(get_roster()['present'][0]['user']['full_name'], 'Рабочий Табло')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            check_out(self.worker.id)
+        roster = get_roster()
+        self.assertEqual([row['id'] for row in roster['present']], [other.id])
+        self.assertEqual(roster['recent'][0]['id'], attendance.id)
+        self.assertEqual(roster['recent'][0]['status'], 'Ушел')
+
+    def test_dashboard_query_count(self):
+        """Тест что главная страница выполняет постоянное небольшое число запросов"""
+        now = timezone.now()
+        for user in User.objects.bulk_create(
+            User(username=f'dash_{i}', full_name=f'Рабочий {i}', role='worker') for i in range(20)
+        ):
+            Attendance.objects.create(user=user, check_in=now, is_present=True)
+        self.admin_client.get('/')
+        self.worker_client.get('/')
+
+        # Сессия, пользователь, версия данных для ETag и для кэша состава
+        with self.assertNumQueries(4):
+            self.admin_client.get('/')
+        # Сессия, пользователь, версия работника и записи за сегодня
+        with self.assertNumQueries(4):
+            self.worker_client.get('/')
+        # С журналом отметок - еще несвернутые отметки работника
+        with override_settings(ATTENDANCE_PUNCH_LOG=True), self.assertNumQueries(5):
+            self.worker_client.get('/')
+
+    def test_worker_sees_only_today(self):
+        """Тест что работник видит только сегодняшние записи"""
+        now = timezone.now()
+        Attendance.objects.create(
+            user=self.worker,
+            check_in=now - timezone.timedelta(days=1),
+            check_out=now - timezone.timedelta(days=1) + timezone.timedelta(hours=8),
+            is_present=False,
+        )
+        today = Attendance.objects.create(user=self.worker, check_in=now, is_present=True)
+
+        response = self.worker_client.get('/')
+
+        self.assertEqual([row['id'] for row in response.context['recent_attendances']], [today.id])
+        self.assertEqual(response.context['recent_attendances'][0]['status'], 'На работе')
+
+
+@override_settings(ATTENDANCE_PUNCH_LOG=False)
+class ConditionalGetTest(TestCase):
+    """Тесты для ETag / Last-Modified главной страницы и отчетов"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import Client
+        cache.clear()
+        self.admin = User.objects.create_user(username='etag_admin', full_name='Админ', role='admin')
+        self.worker = User.objects.create_user(username='etag_worker', full_name='Рабочий', role='worker')
+        self.other = User.objects.create_user(username='etag_other', full_name='Другой', role='worker')
+        self.admin_client = Client()
+        self.admin_client.force_login(self.admin)
+        self.worker_client = Client()
+        self.worker_client.force_login(self.worker)
+
+    def check_in(self, user):
+        from .punches import check_in
+        with self.captureOnCommitCallbacks(execute=True):
+            check_in(user.id)
+
+    def test_unchanged_page_skips_attendance_table_and_template(self):
+        """Тест что ответ 304 не читает таблицу посещаемости и не отрисовывает шаблон"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        for url in ('/', '/reports/'):
+            first = self.admin_client.get(url)
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.admin_client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.templates, [])
+            table = Attendance._meta.db_table
+            self.assertFalse([q for q in queries.captured_queries if table in q['sql']])
+
+    def test_if_modified_since(self):
+        """Тест что страница без изменений отвечает 304 и по Last-Modified"""
+        first = self.admin_client.get('/reports/')
+        self.assertTrue(first.has_header('ETag'))
+
+        response = self.admin_client.get('/reports/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_punch_changes_admin_pages(self):
+        """Тест что любая отметка меняет версию страниц администратора"""
+        dashboard = self.admin_client.get('/')
+        reports = self.admin_client.get('/reports/')
+
+        self.check_in(self.other)
+
+        response = self.admin_client.get('/', HTTP_IF_NONE_MATCH=dashboard['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Другой')
+        response = self.admin_client.get('/reports/', HTTP_IF_NONE_MATCH=reports['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_worker_version_is_per_user(self):
+        """Тест что отметки других работников не меняют главную работника"""
+        first = self.worker_client.get('/')
+
+        self.check_in(self.other)
+        response = self.worker_client.get('/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.check_in(self.worker)
+        response = self.worker_client.get('/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['recent_attendances'][0]['status'], 'На работе')
+
+    def test_admin_edit_changes_reports(self):
+        """Тест что правка в админке меняет версию отчетов"""
+        self.admin.is_staff = self.admin.is_superuser = True
+        self.admin.save()
+        attendance = Attendance.objects.create(user=self.worker, check_in=timezone.now(), is_present=True)
+        first = self.admin_client.get('/reports/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin_client.post(f'/admin/attendance/attendance/{attendance.id}/delete/', {'post': 'yes'})
+        self.assertFalse(Attendance.objects.filter(pk=attendance.pk).exists())
+
+        response = self.admin_client.get('/reports/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_pending_messages_render_full_page(self):
+        """Тест что страница с непоказанным сообщением отдается целиком"""
+        first = self.worker_client.get('/')
+
+        self.worker_client.post('/check-in-out/', {'action': 'unknown'})
+        response = self.worker_client.get('/', HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Неверное действие')
+
+    def test_login_changes_etag(self):
+        """Тест что после нового входа страница отдается заново (другой CSRF-токен)"""
+        from django.test import Client
+        first = self.worker_client.get('/')
+        client = Client()
+        client.force_login(self.worker)
+
+        response = client.get('/', HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_worker_reports_redirect(self):
+        """Тест что работник по-прежнему перенаправляется из отчетов"""
+        response = self.worker_client.get('/reports/')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_change_in_other_process_is_seen(self):
+        """Тест что отметка в другом процессе (со своим кэшем) меняет ETag и состав на главной"""
+        from django.core.cache import cache
+        from .versions import bump
+        first = self.admin_client.get('/')
+        # Другой процесс: запись и сдвиг версии в БД, кэш этого процесса не тронут
+        Attendance.objects.create(user=self.worker, check_in=timezone.now(), is_present=True)
+        roster = cache.get('attendance:roster')
+        bump([self.worker.id])
+        self.assertEqual(cache.get('attendance:roster'), roster)
+
+        response = self.admin_client.get('/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['user']['id'] for row in response.context['current_attendances']], [self.worker.id])
+
+    def test_shared_cache_check(self):
+        """Тест предупреждения о кэше в памяти процесса при нескольких процессах сервера"""
+        from .checks import check_shared_cache
+        with self.settings(ATTENDANCE_SERVER_PROCESSES=1):
+            self.assertEqual(check_shared_cache(None), [])
+        with self.settings(ATTENDANCE_SERVER_PROCESSES=4):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['attendance.W001'])
+        with self.settings(
+            ATTENDANCE_SERVER_PROCESSES=4,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        ):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class PresenceStreamTest(TestCase):
+    """Тесты для живого табло "Сейчас на работе" (SSE)"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.admin = User.objects.create_user(username='board_admin', full_name='Админ', role='admin')
+        self.worker = User.objects.create_user(
+            username='board_worker', full_name='Рабочий Табло', position='Рабочий', role='worker'
+        )
+
+    def check_in(self):
+        from .punches import check_in
+        with self.captureOnCommitCallbacks(execute=True):
+            return check_in(self.worker.id)
+
+    def check_out(self):
+        from .punches import check_out
+        with self.captureOnCommitCallbacks(execute=True):
+            return check_out(self.worker.id)
+
+    @staticmethod
+    def parse(message):
+        """(событие, данные) из сообщения text/event-stream"""
+        if isinstance(message, bytes):
+            message = message.decode()
+        fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+        return fields['event'], json.loads(fields['data'])
+
+    async def test_stream_sends_snapshot_then_changes(self):
+        """Тест что табло получает снимок, а затем приходы и уходы"""
+        from asgiref.sync import sync_to_async
+        attendance = await sync_to_async(self.check_in)()
+        await self.async_client.aforce_login(self.admin)
+
+        response = await self.async_client.get('/presence/stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = response.streaming_content
+        event, rows = self.parse(await anext(events))
+        self.assertEqual(event, 'snapshot')
+        self.assertEqual([(row['id'], row['full_name']) for row in rows], [(attendance.id, 'Рабочий Табло')])
+
+        await sync_to_async(self.check_out)()
+        self.assertEqual(self.parse(await anext(events)), ('presence', {'arrived': [], 'left': [attendance.id]}))
+
+        attendance = await sync_to_async(self.check_in)()
+        event, changes = self.parse(await anext(events))
+        self.assertEqual(changes['left'], [])
+        self.assertEqual([row['id'] for row in changes['arrived']], [attendance.id])
+        self.assertEqual(changes['arrived'][0]['url'], f'/user/{self.worker.id}/')
+
+        await events.aclose()
+
+    @override_settings(ATTENDANCE_PRESENCE_HEARTBEAT=0.01)
+    async def test_idle_stream_pings_and_unsubscribes(self):
+        """Тест что без изменений табло получает пинги, а после отключения отписывается"""
+        from .presence import broker
+        from .views import _presence_events
+        events = _presence_events()
+
+        await anext(events)
+        self.assertEqual(broker.subscriber_count(), 1)
+        self.assertEqual(await anext(events), ': ping\n\n')
+        await events.aclose()
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    @override_settings(ATTENDANCE_PUNCH_LOG=True)
+    async def test_logged_punch_reaches_board(self):
+        """Тест что отметка через журнал сразу доходит до подключенного табло"""
+        from asgiref.sync import sync_to_async
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get('/presence/stream/')
+        events = response.streaming_content
+        await anext(events)
+
+        def punch():
+            self.client.force_login(self.worker)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/check-in-out/', {'action': 'check_in'})
+        await sync_to_async(punch)()
+
+        event, changes = self.parse(await anext(events))
+        self.assertEqual([row['user_id'] for row in changes['arrived']], [self.worker.id])
+        await events.aclose()
+
+    @override_settings(ATTENDANCE_PRESENCE_HEARTBEAT=0.01)
+    async def test_change_from_other_process_resyncs(self):
+        """Тест что изменение мимо broker (другой процесс) табло получает снимком на пинге"""
+        from asgiref.sync import sync_to_async
+        from . import versions
+        from .views import _presence_events
+        events = _presence_events()
+        self.assertEqual(self.parse(await anext(events)), ('snapshot', []))
+
+        def other_process_check_in():
+            attendance = Attendance.objects.create(user=self.worker, check_in=timezone.now(), is_present=True)
+            versions.bump([self.worker.id])
+            return attendance
+        attendance = await sync_to_async(other_process_check_in)()
+
+        event, rows = self.parse(await anext(events))
+        self.assertEqual(event, 'snapshot')
+        self.assertEqual([row['id'] for row in rows], [attendance.id])
+        self.assertEqual(await anext(events), ': ping\n\n')
+        await events.aclose()
+
+    def test_board_is_off_under_wsgi(self):
+        """Тест что под WSGI табло не подключается: поток отвечает 204, скрипта на странице нет"""
+        self.client.force_login(self.admin)
+
+        self.assertEqual(self.client.get('/presence/stream/').status_code, 204)
+        self.assertNotContains(self.client.get('/'), 'EventSource(')
+
+    async def test_board_script_under_asgi(self):
+        """Тест что под ASGI главная администратора подключает табло"""
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get('/')
+        self.assertContains(response, 'EventSource(')
+
+    def test_worker_forbidden(self):
+        """Тест что работник не может подключить табло"""
+        self.client.force_login(self.worker)
+
+        response = self.client.get('/presence/stream/')
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_slow_board_resyncs(self):
+        """Тест что переполненная очередь табло сбрасывается на новый снимок"""
+        import asyncio
+        from .presence import RESYNC, SUBSCRIBER_QUEUE_SIZE, PresenceBroker
+
+        async def overflow():
+            broker = PresenceBroker()
+            queue = broker.subscribe()
+            for index in range(SUBSCRIBER_QUEUE_SIZE + 1):
+                broker.publish(f'event {index}')
+            await asyncio.sleep(0)
+            return [queue.get_nowait() for _ in range(queue.qsize())]
+
+        self.assertEqual(asyncio.run(overflow()), [RESYNC])
+
+
+class PunchTransitionTest(TestCase):
+    """Тесты для отметок прихода/ухода одной условной записью"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='punch_worker',
+            full_name='Рабочий Отметок',
+            position='Рабочий',
+            role='worker'
+        )
+
+    def test_double_check_in_keeps_one_open_shift(self):
+        """Тест что повторный приход не создает вторую смену"""
+        from . import punches
+        self.assertIsNotNone(punches.check_in(self.user.id))
+        self.assertIsNone(punches.check_in(self.user.id))
+        self.assertEqual(Attendance.objects.filter(user=self.user, is_present=True).count(), 1)
+
+    def test_check_out_closes_shift_in_one_query(self):
+        """Тест что уход закрывает смену одним запросом к таблице посещаемости"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from . import punches
+        punches.check_in(self.user.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            attendance = punches.check_out(self.user.id)
+
+        table = Attendance._meta.db_table
+        self.assertEqual(len([q for q in queries.captured_queries if table in q['sql']]), 1)
+        self.assertFalse(attendance.is_present)
+        self.assertIsNotNone(attendance.check_in)
+        attendance.refresh_from_db()
+        self.assertIsNotNone(attendance.check_out)
+        self.assertEqual(DailyAttendanceSummary.objects.get(user=self.user).shifts, 1)
+
+    def test_check_out_stores_worked_seconds(self):
+        """Тест что уход сохраняет отработанные секунды в записи"""
+        from . import punches
+        start = timezone.now() - timezone.timedelta(hours=9)
+        punches.check_in(self.user.id, at=start)
+
+        attendance = punches.check_out(self.user.id, at=start + timezone.timedelta(hours=8, seconds=0.4))
+
+        self.assertEqual(attendance.worked_seconds, 8 * 3600)
+        attendance.refresh_from_db()
+        self.assertEqual(attendance.worked_seconds, 8 * 3600)
+        self.assertEqual(attendance.get_work_duration(), 8.0)
+        self.assertEqual(DailyAttendanceSummary.objects.get(user=self.user).worked_seconds, 8 * 3600)
+
+    def test_check_out_without_open_shift(self):
+        """Тест что уход без открытой смены ничего не меняет"""
+        from . import punches
+        self.assertIsNone(punches.check_out(self.user.id))
+        self.assertFalse(DailyAttendanceSummary.objects.exists())
+
+
+class PunchBatchApiTest(TestCase):
+    """Тесты для пакетной загрузки отметок от турникетов"""
+
+    def setUp(self):
+        from django.test import Client
+        self.worker = User.objects.create_user(
+            username='turnstile_worker',
+            full_name='Рабочий Турникета',
+            position='Рабочий',
+            role='worker'
+        )
+        self.other = User.objects.create_user(
+            username='turnstile_other',
+            full_name='Другой Рабочий',
+            position='Рабочий',
+            role='worker'
+        )
+        self.client = Client()
+        self.start = timezone.now().replace(microsecond=0) - timezone.timedelta(hours=10)
+
+    def post(self, events, token='secret'):
+        import json
+        from django.test import override_settings
+        with override_settings(ATTENDANCE_TURNSTILE_TOKENS=['secret']):
+            return self.client.post(
+                '/api/punches/',
+                json.dumps({'events': events}),
+                content_type='application/json',
+                HTTP_AUTHORIZATION=f'Bearer {token}',
+            )
+
+    def event(self, user, hours, direction):
+        return {
+            'user_id': user.id,
+            'timestamp': (self.start + timezone.timedelta(hours=hours)).isoformat(),
+            'direction': direction,
+        }
+
+    def test_rejects_unknown_token(self):
+        """Тест что пакет без верного токена отклоняется"""
+        response = self.post([], token='wrong')
+        self.assertEqual(response.status_code, 401)
+
+    def test_pairs_events_with_open_shifts(self):
+        """Тест сопоставления приходов и уходов с открытыми сменами"""
+        Attendance.objects.create(user=self.other, check_in=self.start, is_present=True)
+
+        response = self.post([
+            self.event(self.worker, 8, 'out'),    # смена откроется событием ниже
+            self.event(self.worker, 0, 'in'),
+            self.event(self.worker, 0.01, 'in'),  # двойное прикладывание карты
+            self.event(self.other, 9, 'out'),     # закрывает смену из БД
+            self.event(self.other, 9.5, 'out'),
+            {'user_id': self.worker.id, 'timestamp': 'вчера', 'direction': 'in'},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        statuses = [result['status'] for result in response.json()['results']]
+        self.assertEqual(statuses, ['closed', 'created', 'duplicate', 'closed', 'no_open_shift', 'error'])
+        self.assertFalse(Attendance.objects.filter(is_present=True).exists())
+
+        shift = Attendance.objects.get(user=self.worker)
+        self.assertEqual(shift.check_out - shift.check_in, timezone.timedelta(hours=8))
+        self.assertEqual(
+            sorted(DailyAttendanceSummary.objects.values_list('worked_seconds', flat=True)),
+            [8 * 3600, 9 * 3600],
+        )
+
+    def test_reopens_shift_open_in_db(self):
+        """Тест что уход и новый приход закрывают смену из БД и открывают новую"""
+        open_shift = Attendance.objects.create(user=self.worker, check_in=self.start, is_present=True)
+
+        response = self.post([
+            self.event(self.worker, 2, 'out'),
+            self.event(self.worker, 3, 'in'),
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        statuses = [result['status'] for result in response.json()['results']]
+        self.assertEqual(statuses, ['closed', 'created'])
+        open_shift.refresh_from_db()
+        self.assertFalse(open_shift.is_present)
+        self.assertEqual(
+            Attendance.objects.get(user=self.worker, is_present=True).check_in,
+            self.start + timezone.timedelta(hours=3),
+        )
+
+    def test_batch_writes_in_constant_queries(self):
+        """Тест что число запросов не зависит от размера пакета"""
+        users = User.objects.bulk_create(
+            User(username=f'bulk_{i}', full_name=f'Рабочий {i}', position='Рабочий', role='worker')
+            for i in range(50)
+        )
+        events = [self.event(user, 0, 'in') for user in users] + [self.event(user, 8, 'out') for user in users]
+
+        # Запись смен и итогов и пересчет битовых карт присутствия их дней
+        with self.assertNumQueries(16):
+            response = self.post(events)
+        self.assertEqual(response.json()['summary'], {'created': 50, 'closed': 50})
+
+
+@override_settings(ATTENDANCE_KIOSK_TOKENS=['kiosk-secret'], ATTENDANCE_PUNCH_LOG=False)
+class KioskTest(TestCase):
+    """Тесты для терминала отметок по пропуску"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import Client
+        from .kiosk import badges
+        cache.clear()
+        badges.clear()
+        self.worker = User.objects.create_user(
+            username='kiosk_worker', full_name='Рабочий Киоска', role='worker', badge='1001'
+        )
+        self.kiosk = Client()
+        self.kiosk.post('/kiosk/', {'token': 'kiosk-secret'})
+
+    def punch(self, badge, action='check_in', client=None):
+        return (client or self.kiosk).post('/kiosk/punch/', {'badge': badge, 'action': action})
+
+    def test_activation(self):
+        """Тест активации устройства токеном"""
+        from django.test import Client
+        client = Client()
+
+        response = client.post('/kiosk/', {'token': 'wrong'})
+        self.assertContains(response, 'Неверный токен устройства')
+        self.assertEqual(self.punch('1001', client=client).status_code, 401)
+
+        response = client.post('/kiosk/', {'token': 'kiosk-secret'})
+        self.assertRedirects(response, '/kiosk/', fetch_redirect_response=False)
+        self.assertContains(client.get('/kiosk/'), 'Пропуск или PIN')
+
+    def test_revoked_token_deactivates_device(self):
+        """Тест что удаленный из настроек токен больше не принимается"""
+        with override_settings(ATTENDANCE_KIOSK_TOKENS=['other']):
+            self.assertEqual(self.punch('1001').status_code, 401)
+
+    def test_check_in_and_out_by_badge(self):
+        """Тест прихода и ухода по пропуску без входа работника"""
+        response = self.punch('1001')
+        self.assertEqual(response.json(), {'status': 'ok', 'action': 'check_in', 'full_name': 'Рабочий Киоска'})
+        self.assertEqual(self.punch('1001').json()['status'], 'duplicate')
+
+        self.assertEqual(self.punch('1001', 'check_out').json()['status'], 'ok')
+        self.assertFalse(Attendance.objects.get(user=self.worker).is_present)
+
+    def test_unknown_or_inactive_badge(self):
+        """Тест что неизвестный пропуск и пропуск неактивного работника отклоняются"""
+        from .versions import bump
+        self.assertEqual(self.punch('9999').status_code, 404)
+        self.assertEqual(self.punch('1001', 'sleep').status_code, 400)
+
+        User.objects.filter(pk=self.worker.pk).update(is_active=False)
+        bump()
+        self.assertEqual(self.punch('1001').status_code, 404)
+
+    @override_settings(ATTENDANCE_PUNCH_LOG=True)
+    def test_punch_is_one_write(self):
+        """Тест что отметка - поиск в памяти, проверка открытой смены и одна вставка в журнал"""
+        self.punch('1001')
+
+        # Эпоха версий, последнее событие работника в журнале и вставка (плюс точка сохранения)
+        with self.assertNumQueries(5):
+            response = self.punch('1001', 'check_out')
+
+        self.assertEqual(response.json()['status'], 'ok')
+        self.assertEqual(self.punch('1001', 'check_out').json()['status'], 'duplicate')
+        self.assertEqual(PunchEvent.objects.filter(user=self.worker).count(), 2)
+
+    def test_index_follows_user_edits(self):
+        """Тест что новый пропуск находится после правки пользователя"""
+        from .kiosk import badges
+        from .versions import bump
+        self.punch('1001')
+        User.objects.filter(pk=self.worker.pk).update(badge='2002')
+
+        # Неизвестный пропуск сразу после загрузки индекса не перечитывает его: только эпоха версий
+        with self.assertNumQueries(1):
+            self.assertIsNone(badges.lookup('2002'))
+        bump()
+        self.assertEqual(badges.lookup('2002')['id'], self.worker.id)
+        self.assertIsNone(badges.lookup('1001'))
+
+
+class AttendanceAdminChangelistTest(TestCase):
+    """Тесты для списка посещаемости в админке"""
+
+    def setUp(self):
+        from django.test import Client
+        self.admin = User.objects.create_superuser(username='changelist_admin', password='x', full_name='Админ')
+        self.worker = User.objects.create_user(username='changelist_worker', full_name='Иванов Иван', role='worker')
+        self.other = User.objects.create_user(username='changelist_other', full_name='Петров Петр', role='worker')
+        for user, day in ((self.worker, (2024, 3, 5)), (self.worker, (2025, 1, 10)), (self.other, (2025, 2, 20))):
+            check_in = timezone.make_aware(datetime(*day, 9))
+            Attendance.objects.create(
+                user=user, check_in=check_in, check_out=check_in + timezone.timedelta(hours=8), is_present=False
+            )
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.url = '/admin/attendance/attendance/'
+
+    def test_user_filter(self):
+        """Тест что фильтр по работнику показывает только его смены"""
+        response = self.client.get(self.url, {'user__id__exact': self.other.id})
+        self.assertEqual([row.user_id for row in response.context['cl'].result_list], [self.other.id])
+        self.assertContains(response, 'Петров Петр')
+
+        response = self.client.get(self.url, {'user__id__exact': 'x'})
+        self.assertRedirects(response, self.url + '?e=1', fetch_redirect_response=False)
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Тест что работники читаются вместе со сменами, а не запросом на строку"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(self.url)
+        for number in range(10):
+            user = User.objects.create_user(username=f'changelist_{number}', full_name=f'Работник {number}')
+            # В уже показанном дне: иначе иерархия дат проверит лишний год
+            check_in = timezone.make_aware(datetime(2025, 2, 20, 10))
+            Attendance.objects.create(user=user, check_in=check_in, is_present=True)
+
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(self.url)
+        self.assertEqual(len(after), len(before))
+
+    def test_count_is_estimated_above_limit(self):
+        """Тест что выше границы точного подсчета без фильтров берется оценка, а с фильтрами - граница"""
+        from unittest.mock import patch
+        for number in range(3):
+            Attendance.objects.create(user=self.worker, check_in=timezone.now(), is_present=False)
+
+        with patch('attendance.admin.EXACT_COUNT_LIMIT', 2):
+            self.assertEqual(self.client.get(self.url).context['cl'].result_count, 6)
+            response = self.client.get(self.url, {'is_present__exact': 0})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    def test_date_hierarchy_uses_existing_periods(self):
+        """Тест что иерархия дат показывает только годы, месяцы и дни со сменами"""
+        response = self.client.get(self.url)
+        self.assertContains(response, '?check_in__year=2024')
+        self.assertContains(response, '?check_in__year=2025')
+
+        response = self.client.get(self.url, {'check_in__year': 2025})
+        self.assertContains(response, 'check_in__month=1')
+        self.assertContains(response, 'check_in__month=2')
+        self.assertNotContains(response, 'check_in__month=3')
+
+        response = self.client.get(self.url, {'check_in__year': 2025, 'check_in__month': 1})
+        self.assertContains(response, 'check_in__day=10')
+        self.assertNotContains(response, 'check_in__day=11')
+
+    def test_autocomplete_finds_workers(self):
+        """Тест что поле фильтра находит работников через автодополнение админки"""
+        response = self.client.get('/admin/autocomplete/', {
+            'app_label': 'attendance', 'model_name': 'attendance', 'field_name': 'user', 'term': 'Иван',
+        })
+        self.assertEqual([row['id'] for row in response.json()['results']], [str(self.worker.id)])
+
+
+class TimesheetTest(TestCase):
+    """Тесты для табеля на массивах NumPy"""
+
+    def setUp(self):
+        from django.test import Client
+        from .synthetic import bulk_insert, create_workers, generate_shifts
+        self.admin = User.objects.create_user(username='report_timesheet_admin', full_name='Админ', role='admin')
+        self.end = timezone.localdate() - timezone.timedelta(days=1)
+        self.start = self.end - timezone.timedelta(days=44)
+        self.user_ids = create_workers(20, prefix='timesheet')
+        bulk_insert(generate_shifts(self.user_ids, self.start - timezone.timedelta(days=3), self.end))
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def reference(self, start, end, user_id=None):
+        """Табель построчно: цикл по сменам, как в отчетах"""
+        from datetime import time
+        from django.conf import settings
+        days = {}
+        shifts = Attendance.objects.filter(is_present=False).select_related('user')
+        if user_id:
+            shifts = shifts.filter(user_id=user_id)
+        for shift in shifts:
+            day = timezone.localtime(shift.check_in).date()
+            if not start <= day <= end:
+                continue
+            stat = days.setdefault((shift.user_id, day), {
+                'user': shift.user, 'shifts': 0, 'worked': 0, 'first_in': shift.check_in, 'last_out': shift.check_out,
+            })
+            stat['shifts'] += 1
+            stat['worked'] += Attendance.compute_worked_seconds(shift.check_in, shift.check_out)
+            stat['first_in'] = min(stat['first_in'], shift.check_in)
+            stat['last_out'] = max(stat['last_out'], shift.check_out)
+
+        rows = {}
+        for (worker_id, day), stat in days.items():
+            shift_start = timezone.make_aware(datetime.combine(day, time.fromisoformat(settings.ATTENDANCE_SHIFT_START)))
+            shift_end = timezone.make_aware(datetime.combine(day, time.fromisoformat(settings.ATTENDANCE_SHIFT_END)))
+            late = max(round((stat['first_in'] - shift_start).total_seconds()), 0)
+            early = max(round((shift_end - stat['last_out']).total_seconds()), 0)
+            row = rows.setdefault(worker_id, {
+                'user': {'id': worker_id, 'full_name': stat['user'].full_name, 'position': stat['user'].position},
+                'days': 0, 'shifts': 0, 'worked': 0, 'overtime': 0, 'late_days': 0, 'late': 0, 'early_days': 0, 'early': 0,
+            })
+            row['days'] += 1
+            row['shifts'] += stat['shifts']
+            row['worked'] += stat['worked']
+            row['overtime'] += max(stat['worked'] - settings.ATTENDANCE_WORKDAY_HOURS * 3600, 0)
+            row['late_days'] += late > 0
+            row['late'] += late
+            row['early_days'] += early > 0
+            row['early'] += early
+
+        return sorted([
+            {
+                'user': row['user'],
+                'days': row['days'],
+                'shifts': row['shifts'],
+                'total_hours': round(row['worked'] / 3600, 2),
+                'overtime_hours': round(row['overtime'] / 3600, 2),
+                'late_days': row['late_days'],
+                'late_minutes': round(row['late'] / 60),
+                'early_days': row['early_days'],
+                'early_minutes': round(row['early'] / 60),
+            }
+            for row in rows.values()
+        ], key=lambda row: (row['user']['full_name'], row['user']['id']))
+
+    def test_matches_reference(self):
+        """Тест что табель совпадает с построчным расчетом"""
+        from .timesheet import timesheet
+        rows = timesheet(self.start, self.end)
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(rows, self.reference(self.start, self.end))
+
+        worker_id = self.user_ids[3]
+        self.assertEqual(timesheet(self.start, self.end, worker_id), self.reference(self.start, self.end, worker_id))
+
+    @override_settings(ATTENDANCE_SHIFT_START='09:00', ATTENDANCE_SHIFT_END='18:00', ATTENDANCE_WORKDAY_HOURS=8)
+    def test_day_metrics(self):
+        """Тест опоздания, раннего ухода и переработки за день с двумя сменами"""
+        from .timesheet import timesheet
+        worker = User.objects.create_user(username='report_timesheet_worker', full_name='Рабочий', role='worker')
+        day = self.end
+
+        def at(hour, minute=0):
+            return timezone.make_aware(datetime.combine(day, datetime.min.time())) + timezone.timedelta(
+                hours=hour, minutes=minute
+            )
+        for check_in, check_out in ((at(9, 20), at(13)), (at(13, 30), at(19, 40))):
+            Attendance.objects.create(user=worker, check_in=check_in, check_out=check_out, is_present=False)
+        Attendance.objects.create(user=worker, check_in=at(20), check_out=at(17, 30) + timezone.timedelta(days=1), is_present=False)
+        # Открытая смена в табель не входит
+        Attendance.objects.create(user=worker, check_in=timezone.now(), is_present=True)
+
+        row, = timesheet(day, day, worker.id)
+        self.assertEqual((row['days'], row['shifts']), (1, 3))
+        self.assertEqual(row['late_minutes'], 20)
+        self.assertEqual((row['early_days'], row['early_minutes']), (0, 0))
+        self.assertEqual(row['total_hours'], round((220 + 370 + 21.5 * 60) / 60, 2))
+        self.assertEqual(row['overtime_hours'], round(row['total_hours'] - 8, 2))
+
+    def test_view(self):
+        """Тест страницы табеля: фильтры отчета и доступ только для админов"""
+        response = self.client.get('/reports/timesheet/', {
+            'start_date': self.start.isoformat(), 'end_date': self.end.isoformat(), 'user_id': self.user_ids[0],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['user']['id'] for row in response.context['rows']], [self.user_ids[0]])
+
+        worker = User.objects.get(id=self.user_ids[0])
+        self.client.force_login(worker)
+        self.assertRedirects(self.client.get('/reports/timesheet/'), '/')
+
+
+class AbsencesTest(TestCase):
+    """Тесты для прогулов по матрице присутствия"""
+
+    def setUp(self):
+        from django.test import Client
+        from .summary import day_start, rebuild_summary
+        from .synthetic import bulk_insert, create_workers, generate_shifts
+        self.admin = User.objects.create_user(username='absences_admin', full_name='Админ', role='admin')
+        self.end = timezone.localdate()
+        self.start = self.end - timezone.timedelta(days=40)
+        self.user_ids = create_workers(15, prefix='absent', joined=day_start(self.start))
+        bulk_insert(generate_shifts(self.user_ids, self.start, self.end))
+        rebuild_summary(self.start, self.end)
+        # Принят на работу в середине периода
+        User.objects.filter(id=self.user_ids[0]).update(date_joined=timezone.now() - timezone.timedelta(days=10))
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def reference(self, start, end):
+        """Прогулы циклом по работникам и дням"""
+        from django.conf import settings
+        rows = []
+        for worker in User.objects.filter(role='worker', is_active=True):
+            check_ins = worker.attendance_set.values_list('check_in', flat=True)
+            shift_days = {timezone.localtime(check_in).date() for check_in in check_ins}
+            dates = []
+            # Самый долгий прогул подряд: выходные серию не прерывают
+            run, longest, longest_start = [], 0, None
+            day = max(start, timezone.localtime(worker.date_joined).date())
+            while day <= min(end, timezone.localdate() - timezone.timedelta(days=1)):
+                if day.weekday() not in settings.ATTENDANCE_DAYS_OFF:
+                    run = run + [day] if day not in shift_days else []
+                    if day not in shift_days:
+                        dates.append(day)
+                    if len(run) > longest:
+                        longest, longest_start = len(run), run[0]
+                day += timezone.timedelta(days=1)
+            if dates:
+                rows.append({
+                    'user': {'id': worker.id, 'full_name': worker.full_name, 'position': worker.position},
+                    'absent_days': len(dates),
+                    'dates': dates,
+                    'longest_absence': longest,
+                    'longest_absence_start': longest_start,
+                })
+        return sorted(rows, key=lambda row: (row['user']['full_name'], row['user']['id']))
+
+    def test_matches_reference(self):
+        """Тест что прогулы совпадают с расчетом циклом по дням"""
+        from .absences import absences
+        rows = absences(self.start, self.end)
+        self.assertTrue(rows)
+        self.assertEqual(rows, self.reference(self.start, self.end))
+
+        worker_id = self.user_ids[0]
+        self.assertEqual(absences(self.start, self.end, worker_id), [
+            row for row in self.reference(self.start, self.end) if row['user']['id'] == worker_id
+        ])
+
+    def test_open_shift_day_is_not_absence(self):
+        """Тест что день открытой смены (еще нет в итогах) не прогул"""
+        from .absences import presence_matrix
+        from .punches import check_in
+        worker = User.objects.create_user(username='absences_night', full_name='Ночной', role='worker')
+        User.objects.filter(id=worker.id).update(date_joined=timezone.now() - timezone.timedelta(days=30))
+        yesterday = self.end - timezone.timedelta(days=1)
+        check_in(
+            worker.id,
+            at=timezone.make_aware(datetime.combine(yesterday, datetime.min.time())) + timezone.timedelta(hours=22),
+        )
+
+        user_ids, days, present, expected = presence_matrix(yesterday, self.end, worker.id)
+        self.assertEqual(user_ids.tolist(), [worker.id])
+        self.assertEqual(days, [yesterday])
+        self.assertTrue(present[0, 0])
+
+    def test_query_count_does_not_depend_on_workers(self):
+        """Тест что матрица строится одним запросом по картам присутствия, а не запросом на работника"""
+        from .absences import absences
+        # работники, карты присутствия, ФИО
+        with self.assertNumQueries(3):
+            absences(self.start, self.end)
+
+    def test_view(self):
+        """Тест страницы прогулов: период и доступ только для админов"""
+        response = self.client.get('/reports/absences/', {
+            'start_date': self.start.isoformat(), 'end_date': self.end.isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['rows'], self.reference(self.start, self.end))
+
+        self.client.force_login(User.objects.get(id=self.user_ids[0]))
+        self.assertRedirects(self.client.get('/reports/absences/'), '/')
+
+
+class PresenceBitmapTest(TestCase):
+    """Тесты для битовых карт присутствия"""
+
+    def setUp(self):
+        from .summary import day_start, rebuild_summary
+        from .synthetic import bulk_insert, create_workers, generate_shifts
+        self.end = timezone.localdate()
+        # Период захватывает два календарных года
+        self.start = self.end - timezone.timedelta(days=400)
+        self.user_ids = create_workers(6, prefix='bitmap', joined=day_start(self.start))
+        bulk_insert(generate_shifts(self.user_ids, self.start, self.end))
+        rebuild_summary(self.start, self.end)
+
+    def shift_days(self, user_id):
+        check_ins = Attendance.objects.filter(user_id=user_id).values_list('check_in', flat=True)
+        return {timezone.localdate(check_in) for check_in in check_ins}
+
+    def longest_absence_reference(self, user_id, start, end):
+        """Самый долгий прогул циклом по дням"""
+        from django.conf import settings
+        shift_days = self.shift_days(user_id)
+        best, best_start, run, run_start = 0, None, 0, None
+        day = start
+        while day <= end:
+            if day.weekday() not in settings.ATTENDANCE_DAYS_OFF:
+                if day in shift_days:
+                    run = 0
+                else:
+                    run, run_start = run + 1, day if run == 0 else run_start
+                    if run > best:
+                        best, best_start = run, run_start
+            day += timezone.timedelta(days=1)
+        return best, best_start
+
+    def test_matches_shifts(self):
+        """Тест что присутствие по картам совпадает с днями смен, в том числе через границу года"""
+        from .bitmaps import presence
+        users, matrix = presence(self.start, self.end, self.user_ids)
+        self.assertEqual(users.tolist(), sorted(self.user_ids))
+        for row, user_id in enumerate(users.tolist()):
+            self.assertEqual(
+                {self.start + timezone.timedelta(days=int(offset)) for offset in matrix[row].nonzero()[0]},
+                {day for day in self.shift_days(user_id) if self.start <= day <= self.end},
+            )
+
+    def test_matches_reference(self):
+        """Тест что дни присутствия, прогулы и общие дни совпадают с расчетом по сменам"""
+        from .bitmaps import days_present, longest_absence, present_on_all
+        for user_id in self.user_ids:
+            shift_days = self.shift_days(user_id)
+            self.assertEqual(
+                days_present(user_id, self.start, self.end),
+                len([day for day in shift_days if self.start <= day <= self.end]),
+            )
+            self.assertEqual(
+                longest_absence(user_id, self.start, self.end),
+                self.longest_absence_reference(user_id, self.start, self.end),
+            )
+
+        days = [self.start + timezone.timedelta(days=offset) for offset in (3, 90, 250, 380)]
+        expected = [user_id for user_id in self.user_ids if set(days) <= self.shift_days(user_id)]
+        self.assertEqual(present_on_all(days, self.user_ids), expected)
+
+    def test_no_bitmap_means_absent_every_workday(self):
+        """Тест что у работника без карт прогул - все рабочие дни периода"""
+        from .bitmaps import days_present, longest_absence, present_on_all
+        worker = User.objects.create_user(username='bitmap_absent', full_name='Прогульщик', role='worker')
+        monday = self.end - timezone.timedelta(days=self.end.weekday() + 14)
+
+        self.assertEqual(days_present(worker.id, monday, monday + timezone.timedelta(days=6)), 0)
+        with override_settings(ATTENDANCE_DAYS_OFF=[5, 6]):
+            self.assertEqual(longest_absence(worker.id, monday, monday + timezone.timedelta(days=9)), (8, monday))
+        self.assertEqual(present_on_all([monday], [worker.id]), [])
+        self.assertEqual(present_on_all([]), [])
+
+    def test_check_in_sets_bit_and_edit_clears_it(self):
+        """Тест что приход ставит бит дня, а пересчет после удаления смены снимает его"""
+        from .bitmaps import days_present
+        from .punches import check_in
+        from .summary import rebuild_days
+        worker = User.objects.create_user(username='bitmap_new', full_name='Новый', role='worker')
+        attendance = check_in(worker.id)
+        self.assertEqual(days_present(worker.id, self.end, self.end), 1)
+
+        attendance.delete()
+        rebuild_days([(worker.id, self.end)])
+        self.assertEqual(days_present(worker.id, self.end, self.end), 0)
+
+    def test_bitmap_error_is_not_reported_as_open_shift(self):
+        """Тест что ошибка записи карты не выдается за уже открытую смену и откатывает приход"""
+        from unittest.mock import patch
+        from django.db import DatabaseError
+        from .punches import check_in
+        worker = User.objects.create_user(username='bitmap_error', full_name='Ошибка', role='worker')
+        with patch('attendance.bitmaps.mark', side_effect=DatabaseError('disk I/O error')):
+            with self.assertRaises(DatabaseError):
+                check_in(worker.id)
+        self.assertFalse(Attendance.objects.filter(user=worker).exists())
+        self.assertIsNotNone(check_in(worker.id))
+
+    def test_command_rebuilds_cleared_bitmaps(self):
+        """Тест что команда заполняет карты заново по итогам и открытым сменам"""
+        from .bitmaps import presence
+        from .models import PresenceBitmap
+        users, matrix = presence(self.start, self.end)
+        PresenceBitmap.objects.all().delete()
+
+        out = io.StringIO()
+        call_command('rebuild_presence_bitmaps', stdout=out)
+        self.assertIn('Пересчитано карт присутствия', out.getvalue())
+        rebuilt_users, rebuilt = presence(self.start, self.end)
+        self.assertEqual(rebuilt_users.tolist(), users.tolist())
+        self.assertTrue((rebuilt == matrix).all())
+
+    def test_command_honours_explicit_end(self):
+        """Тест что явный --end без --start не расширяется до последнего дня данных"""
+        from .bitmaps import presence
+        from .models import PresenceBitmap
+        end = self.end - timezone.timedelta(days=30)
+        users, matrix = presence(self.start, self.end)
+        PresenceBitmap.objects.all().delete()
+
+        out = io.StringIO()
+        call_command('rebuild_presence_bitmaps', '--end', end.isoformat(), stdout=out)
+        self.assertIn(f'за {self.start} - {end}:', out.getvalue())
+        rebuilt_users, rebuilt = presence(self.start, self.end)
+        self.assertEqual(rebuilt_users.tolist(), users.tolist())
+        days = (end - self.start).days + 1
+        self.assertTrue((rebuilt[:, :days] == matrix[:, :days]).all())
+        self.assertFalse(rebuilt[:, days:].any())
+
+
+@override_settings(ATTENDANCE_PUNCH_LOG=True)
+class PunchLogTest(TestCase):
+    """Тесты для журнала отметок и его свертки в смены"""
+
+    def setUp(self):
+        from django.test import Client
+        self.admin = User.objects.create_user(
+            username='log_admin',
+            full_name='Админ Журнала',
+            position='Администратор',
+            role='admin'
+        )
+        self.worker = User.objects.create_user(
+            username='log_worker',
+            full_name='Рабочий Журнала',
+            position='Рабочий',
+            role='worker'
+        )
+        self.client = Client()
+        self.client.force_login(self.worker)
+
+    def test_punch_is_single_insert_into_log(self):
+        """Тест что отметка не пишет в таблицу посещаемости, а только вставляет событие в журнал"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/check-in-out/', {'action': 'check_in'})
+
+        table = Attendance._meta.db_table
+        self.assertFalse([
+            q for q in queries.captured_queries if table in q['sql'] and not q['sql'].startswith('SELECT')
+        ])
+        self.assertEqual(PunchEvent.objects.filter(user=self.worker).count(), 1)
+        self.assertFalse(Attendance.objects.exists())
+
+    def test_repeated_punch_is_rejected(self):
+        """Тест что повторный приход и уход без открытой смены не попадают в журнал"""
+        from . import punch_log
+        response = self.client.post('/check-in-out/', {'action': 'check_out'}, follow=True)
+        self.assertContains(response, 'Неверное действие')
+
+        self.client.post('/check-in-out/', {'action': 'check_in'})
+        response = self.client.post('/check-in-out/', {'action': 'check_in'}, follow=True)
+        self.assertContains(response, 'Неверное действие')
+        self.assertEqual(list(PunchEvent.objects.values_list('direction', flat=True)), ['in'])
+
+        # После свертки состояние берется из открытой смены
+        punch_log.compact_pending()
+        self.assertIsNone(punch_log.record_punch(self.worker.id, 'in'))
+        self.assertIsNotNone(punch_log.record_punch(self.worker.id, 'out'))
+
+    def test_compaction_folds_events_into_shifts(self):
+        """Тест свертки журнала: уход закрывает смену, открытую приходом"""
+        from . import punch_log
+        start = timezone.now() - timezone.timedelta(hours=8)
+        punch_log.record_punch(self.worker.id, 'in', at=start)
+        self.assertIsNone(punch_log.record_punch(self.worker.id, 'in', at=start + timezone.timedelta(seconds=1)))
+        punch_log.record_punch(self.worker.id, 'out', at=start + timezone.timedelta(hours=8))
+
+        call_command('compact_punches', stdout=io.StringIO())
+
+        shift = Attendance.objects.get(user=self.worker)
+        self.assertFalse(shift.is_present)
+        self.assertEqual(shift.check_out - shift.check_in, timezone.timedelta(hours=8))
+        self.assertEqual(DailyAttendanceSummary.objects.get(user=self.worker).shifts, 1)
+        self.assertFalse(punch_log.has_pending())
+        self.assertEqual(punch_log.compact(), 0)
+
+    def test_reads_do_not_compact(self):
+        """Тест что чтение не сворачивает журнал, а главная работника видит несвернутые отметки"""
+        from django.test import Client
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/check-in-out/', {'action': 'check_in'})
+
+        response = self.client.get('/')
+        self.assertEqual([row['status'] for row in response.context['recent_attendances']], ['На работе'])
+
+        admin_client = Client()
+        admin_client.force_login(self.admin)
+        admin_client.get(f'/user/{self.worker.id}/')
+        self.assertFalse(Attendance.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/check-in-out/', {'action': 'check_out'})
+        response = self.client.get('/')
+        self.assertEqual([row['status'] for row in response.context['recent_attendances']], ['Ушел'])
+
+    def test_compaction_reopens_compacted_shift(self):
+        """Тест что уход и новый приход между свертками сворачиваются поверх открытой смены"""
+        from . import punch_log
+        start = timezone.now() - timezone.timedelta(hours=8)
+        punch_log.record_punch(self.worker.id, 'in', at=start)
+        punch_log.compact_pending()
+        punch_log.record_punch(self.worker.id, 'out', at=start + timezone.timedelta(hours=4))
+        punch_log.record_punch(self.worker.id, 'in', at=start + timezone.timedelta(hours=5))
+
+        self.assertEqual(punch_log.compact_pending(), 2)
+        self.assertFalse(punch_log.has_pending())
+        self.assertEqual(
+            list(Attendance.objects.order_by('check_in').values_list('is_present', flat=True)), [False, True],
+        )
+
+    def test_compaction_error_keeps_punch_and_events(self):
+        """Тест что ошибка свертки в отметке пишется в лог, а отметка проходит и остается в журнале"""
+        from unittest.mock import patch
+        from django.db import IntegrityError
+        from . import punch_log
+
+        with patch('attendance.presence.broker.subscriber_count', return_value=1), \
+                patch('attendance.punch_log.apply_events', side_effect=IntegrityError('UNIQUE constraint failed')), \
+                self.assertLogs('attendance.punch_log', level='ERROR'):
+            response = self.client.post('/check-in-out/', {'action': 'check_in'})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(punch_log.has_pending())
+        self.assertEqual(punch_log.compact_pending(), 1)
+        self.assertTrue(Attendance.objects.filter(user=self.worker, is_present=True).exists())
+
+
+class GenerateAttendanceTest(TestCase):
+    """Тесты генератора синтетической посещаемости"""
+
+    def test_generated_shifts_are_consistent(self):
+        """Тест что смены согласованы с итогами и открыто не больше одной смены на работника"""
+        from django.db.models import Count, Sum
+        call_command('generate_attendance', workers=20, days=60, seed=7, stdout=io.StringIO())
+
+        self.assertEqual(User.objects.filter(role='worker').count(), 20)
+        self.assertFalse(
+            Attendance.objects.filter(is_present=True).values('user_id')
+            .annotate(shifts=Count('id')).filter(shifts__gt=1).exists()
+        )
+        for shift in Attendance.objects.filter(is_present=False)[:50]:
+            self.assertEqual(shift.worked_seconds, Attendance.compute_worked_seconds(shift.check_in, shift.check_out))
+
+        closed = Attendance.objects.filter(is_present=False)
+        totals = DailyAttendanceSummary.objects.aggregate(shifts=Sum('shifts'), seconds=Sum('worked_seconds'))
+        self.assertEqual(totals['shifts'], closed.count())
+        self.assertEqual(totals['seconds'], closed.aggregate(seconds=Sum('worked_seconds'))['seconds'])
+
+    def test_same_seed_same_shifts(self):
+        """Тест что при одинаковом seed генерируются одинаковые смены"""
+        from .synthetic import generate_shifts
+        end = timezone.localdate()
+        start = end - timezone.timedelta(days=30)
+        now = timezone.now()
+
+        first = list(generate_shifts([1, 2, 3], start, end, seed=5, now=now))
+        self.assertEqual(first, list(generate_shifts([1, 2, 3], start, end, seed=5, now=now)))
+        self.assertNotEqual(first, list(generate_shifts([1, 2, 3], start, end, seed=6, now=now)))
+
+    def test_replace_existing_workers(self):
+        """Тест повторной генерации для существующих работников без дублей"""
+        worker = User.objects.create_user(username='ivanov', full_name='Иванов', role='worker')
+        Attendance.objects.create(user=worker, check_in=timezone.now(), is_present=True)
+
+        call_command('generate_attendance', existing=True, replace=True, days=10, stdout=io.StringIO())
+        count = Attendance.objects.count()
+        call_command('generate_attendance', existing=True, replace=True, days=10, stdout=io.StringIO())
+
+        self.assertEqual(Attendance.objects.count(), count)
+        self.assertLessEqual(Attendance.objects.filter(is_present=True).count(), 1)
+
+
+class BenchmarkTest(TestCase):
+    """Тесты замеров представлений"""
+
+    def test_run_measures_every_view(self):
+        """Тест что замеры проходят по всем представлениям без ошибок"""
+        from . import benchmark
+        admin, user_ids = benchmark.seed(5, 10)
+
+        results = benchmark.run(admin, user_ids, repeat=2)
+
+        self.assertEqual(set(results), {name for name, *_ in benchmark.view_requests(admin, user_ids)})
+        for metrics in results.values():
+            self.assertGreater(metrics['queries'], 0)
+            self.assertLessEqual(metrics['p50_ms'], metrics['p95_ms'])
+
+    def test_query_growth_detects_n_plus_one(self):
+        """Тест что рост числа запросов с объемом данных находится"""
+        from .benchmark import query_growth
+        small = {'views': {'reports': {'queries': 6}, 'user_detail': {'queries': 7}}}
+        large = {'views': {'reports': {'queries': 106}, 'user_detail': {'queries': 7}}}
+
+        self.assertEqual(query_growth([small, large]), [('reports', 6, 106)])
+        self.assertEqual(query_growth([small, small]), [])
+
+
+class RequestTimingMiddlewareTest(TestCase):
+    """Тесты замеров времени запросов"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='timing_admin', full_name='Админ', role='admin')
+
+    def get_reports(self):
+        from django.test import Client
+        client = Client()
+        client.force_login(self.admin)
+        return client.get('/reports/')
+
+    @override_settings(ATTENDANCE_REQUEST_TIMING=True, ATTENDANCE_SLOW_REQUEST_MS=100000)
+    def test_server_timing_header(self):
+        """Тест заголовка Server-Timing с SQL, отрисовкой и кодом представления"""
+        response = self.get_reports()
+
+        timing = response['Server-Timing']
+        for metric in ('sql;dur=', 'queries"', 'render;dur=', 'view;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+
+    @override_settings(ATTENDANCE_REQUEST_TIMING=True, ATTENDANCE_SLOW_REQUEST_MS=0)
+    def test_slow_request_log(self):
+        """Тест строки лога медленного запроса с самыми долгими SQL"""
+        import json
+        with self.assertLogs('attendance_system.requests', level='WARNING') as logs:
+            self.get_reports()
+
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['path'], '/reports/')
+        self.assertGreater(entry['queries'], 0)
+        self.assertTrue(entry['worst_sql'])
+        self.assertLessEqual(len(entry['worst_sql']), 3)
+
+    @override_settings(ATTENDANCE_REQUEST_TIMING=False)
+    def test_disabled_by_default(self):
+        """Тест что выключенная middleware не добавляет заголовок"""
+        self.assertNotIn('Server-Timing', self.get_reports())
+
+
+class LockRetryTest(SimpleTestCase):
+    """Тесты повтора записи при занятой базе"""
+
+    def locked_function(self, failures, message='database is locked'):
+        from django.db import OperationalError
+        from .locking import retry_on_lock
+        calls = []
+
+        @retry_on_lock
+        def punch():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return 'ok'
+        return punch, calls
+
+    @override_settings(ATTENDANCE_LOCK_RETRIES=3, ATTENDANCE_LOCK_RETRY_DELAY=0)
+    def test_retries_until_success(self):
+        """Тест что отметка повторяется, пока база занята"""
+        punch, calls = self.locked_function(failures=2)
+        self.assertEqual(punch(), 'ok')
+        self.assertEqual(len(calls), 3)
+
+    @override_settings(ATTENDANCE_LOCK_RETRIES=2, ATTENDANCE_LOCK_RETRY_DELAY=0)
+    def test_gives_up_after_retries(self):
+        """Тест что после ATTENDANCE_LOCK_RETRIES повторов ошибка пробрасывается"""
+        from django.db import OperationalError
+        punch, calls = self.locked_function(failures=10)
+        with self.assertRaises(OperationalError):
+            punch()
+        self.assertEqual(len(calls), 3)
+
+    @override_settings(ATTENDANCE_LOCK_RETRIES=3, ATTENDANCE_LOCK_RETRY_DELAY=0)
+    def test_other_errors_are_not_retried(self):
+        """Тест что ошибки, не связанные с блокировкой, не повторяются"""
+        from django.db import OperationalError
+        punch, calls = self.locked_function(failures=1, message='no such table: attendance_attendance')
+        with self.assertRaises(OperationalError):
+            punch()
+        self.assertEqual(len(calls), 1)
+
+
+class SQLiteProductionProfileTest(TestCase):
+    """Тесты рабочего режима SQLite"""
+
+    def test_pragmas_on_connection(self):
+        """Тест что прагмы рабочего режима выставляются при подключении"""
+        from django.conf import settings
+        from django.db import connection
+        if settings.DATABASES['default'].get('OPTIONS') != settings.SQLITE_PRODUCTION_OPTIONS:
+            self.skipTest('рабочий режим SQLite выключен')
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)  # MEMORY
+        self.assertIsNone(connection.transaction_mode)
+
+
+class WriteTransactionTest(TransactionTestCase):
+    """Тесты транзакций путей записи в SQLite"""
+
+    def begins(self, block):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        if connection.vendor != 'sqlite':
+            self.skipTest('BEGIN IMMEDIATE есть только в SQLite')
+        with CaptureQueriesContext(connection) as queries, block():
+            pass
+        return [q['sql'] for q in queries.captured_queries if q['sql'].startswith('BEGIN')]
+
+    def test_only_write_paths_take_write_lock(self):
+        """Тест что BEGIN IMMEDIATE - только у write_transaction, остальные транзакции обычные"""
+        from django.db import connection, transaction
+        from .locking import write_transaction
+        self.assertEqual(self.begins(write_transaction), ['BEGIN IMMEDIATE'])
+        self.assertEqual(self.begins(transaction.atomic), ['BEGIN'])
+        self.assertIsNone(connection.transaction_mode)
+
+
+class AttendanceArchiveTest(TestCase):
+    """Тесты архива закрытых смен"""
+
+    def setUp(self):
+        from django.test import Client
+        from .summary import rebuild_summary
+        self.admin = User.objects.create_user(username='archive_admin', full_name='Админ', role='admin')
+        self.worker = User.objects.create_user(username='archive_worker', full_name='Рабочий', role='worker')
+        now = timezone.now()
+        for days_ago in (500, 450, 420, 10, 5, 1):
+            check_in = now - timezone.timedelta(days=days_ago)
+            Attendance.objects.create(
+                user=self.worker,
+                check_in=check_in,
+                check_out=check_in + timezone.timedelta(hours=8),
+                is_present=False,
+            )
+        Attendance.objects.create(user=self.worker, check_in=now, is_present=True)
+        rebuild_summary(timezone.localdate() - timezone.timedelta(days=501), timezone.localdate())
+
+        self.expected_ids = list(Attendance.objects.order_by('-check_in', 'id').values_list('id', flat=True))
+        self.summaries = list(DailyAttendanceSummary.objects.order_by('work_date').values_list(
+            'work_date', 'shifts', 'worked_seconds'
+        ))
+        call_command('archive_attendance', batch_size=2, stdout=io.StringIO())
+
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def archive_queries(self, queries):
+        from .models import ArchivedAttendance
+        return [q for q in queries.captured_queries if ArchivedAttendance._meta.db_table in q['sql']]
+
+    def test_old_closed_shifts_are_moved(self):
+        """Тест что в архив уходят только закрытые смены старше границы, с теми же id"""
+        from .models import ArchivedAttendance
+        self.assertEqual(
+            sorted(ArchivedAttendance.objects.values_list('id', flat=True)),
+            sorted(self.expected_ids[-3:]),
+        )
+        self.assertEqual(Attendance.objects.count(), 4)
+        self.assertTrue(Attendance.objects.filter(is_present=True).exists())
+
+    def test_history_pages_continue_into_archive(self):
+        """Тест что история работника листается в архив, а первая страница его не читает"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = f'/user/{self.worker.id}/'
+
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(url, {'page_size': 2}).context['page']
+        self.assertFalse(self.archive_queries(queries))
+
+        ids = [attendance.id for attendance in page['items']]
+        while page['next_cursor']:
+            page = self.client.get(url, {'page_size': 2, 'after': page['next_cursor']}).context['page']
+            ids += [attendance.id for attendance in page['items']]
+        self.assertEqual(ids, self.expected_ids)
+
+        page = self.client.get(url, {'page_size': 2, 'before': page['prev_cursor']}).context['page']
+        self.assertEqual([attendance.id for attendance in page['items']], self.expected_ids[4:6])
+
+    def test_export_reads_archive_only_for_old_periods(self):
+        """Тест что выгрузка читает архив, только если период до него доходит"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        recent = (timezone.localdate() - timezone.timedelta(days=30)).isoformat()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/reports/export/', {'start_date': recent})
+            lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertFalse(self.archive_queries(queries))
+        self.assertEqual(len(lines), 1 + 4)
+
+        response = self.client.get('/reports/export/')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 1 + 7)
+        check_ins = [datetime.strptime(line.split(',')[3], '%d.%m.%Y %H:%M') for line in lines[1:]]
+        self.assertEqual(check_ins, sorted(check_ins))
+
+    def test_rebuild_summary_includes_archive(self):
+        """Тест что пересчет итогов после архивации дает те же итоги"""
+        call_command('rebuild_attendance_summary', stdout=io.StringIO())
+        self.assertEqual(
+            list(DailyAttendanceSummary.objects.order_by('work_date').values_list(
+                'work_date', 'shifts', 'worked_seconds'
+            )),
+            self.summaries,
+        )
@@ -0,0 +1,162 @@
+"""
+Табель: часы, переработка, опоздания и ранние уходы по работникам и дням.
+
+Смены за период читаются в столбцы NumPy (работник, приход, уход
+в секундах эпохи): секунды считает БД, и строки запроса сразу идут
+в np.fromiter, без объектов datetime в Python. Все показатели считаются
+операциями над массивами, без цикла по сменам в Python:
+
+- день смены - день прихода: индекс в массиве начал дней периода
+  (searchsorted), начала дней берутся по календарю часового пояса проекта;
+- смены группируются по (работник, день) сортировкой ключа, суммы и
+  крайние значения групп - через reduceat;
+- опоздание - первый приход дня позже начала смены ATTENDANCE_SHIFT_START,
+  ранний уход - последний уход дня раньше ATTENDANCE_SHIFT_END,
+  переработка - отработанное за день сверх ATTENDANCE_WORKDAY_HOURS.
+
+Учитываются только закрытые смены; если период доходит до архива,
+смены читаются и из него.
+"""
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import FloatField, Func
+from django.utils import timezone
+
+from .archive import reaches_archive
+from .models import ArchivedAttendance, Attendance, User
+from .summary import day_start
+
+# Смен в одной пачке чтения
+TIMESHEET_BATCH_SIZE = 5000
+
+# Показатели дня работника (секунды) и итоги работника по ним
+DAY_FIELDS = ('worked_seconds', 'overtime_seconds', 'late_seconds', 'early_seconds')
+
+# Строка смены в load_shifts: работник, приход и уход в секундах эпохи
+SHIFT_DTYPE = np.dtype([('user_id', np.int64), ('check_in', np.float64), ('check_out', np.float64)])
+
+# Секунды эпохи для даты и времени. julianday в SQLite точен до миллисекунды
+EPOCH_SECONDS_SQL = {
+    'sqlite': '((julianday(%(expressions)s) - 2440587.5) * 86400.0)',
+    'postgresql': 'EXTRACT(EPOCH FROM %(expressions)s)::double precision',
+}
+
+
+class EpochSeconds(Func):
+    """Секунды эпохи (float) для поля даты и времени"""
+    output_field = FloatField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        extra_context.setdefault('template', EPOCH_SECONDS_SQL[connection.vendor])
+        return super().as_sql(compiler, connection, **extra_context)
+
+
+def _shift_bounds(day):
+    """Начало и конец смены по графику в день day"""
+    start = time.fromisoformat(settings.ATTENDANCE_SHIFT_START)
+    end = time.fromisoformat(settings.ATTENDANCE_SHIFT_END)
+    return (
+        timezone.make_aware(datetime.combine(day, start)),
+        timezone.make_aware(datetime.combine(day, end)),
+    )
+
+
+def load_shifts(start, end, user_id=None):
+    """
+    Закрытые смены, пришедшие с start по end (даты включительно), столбцами:
+    (id работников, приходы, уходы) - приходы и уходы в секундах эпохи
+    """
+    since, until = day_start(start), day_start(end + timedelta(days=1))
+    models = [Attendance, ArchivedAttendance] if reaches_archive(since) else [Attendance]
+    parts = []
+    for model in models:
+        shifts = model.objects.filter(is_present=False, check_out__isnull=False, check_in__gte=since, check_in__lt=until)
+        if user_id:
+            shifts = shifts.filter(user_id=user_id)
+        rows = shifts.order_by().annotate(
+            check_in_seconds=EpochSeconds('check_in'), check_out_seconds=EpochSeconds('check_out'),
+        ).values_list('user_id', 'check_in_seconds', 'check_out_seconds').iterator(chunk_size=TIMESHEET_BATCH_SIZE)
+        parts.append(np.fromiter(rows, dtype=SHIFT_DTYPE))
+    shifts = np.concatenate(parts)
+    return tuple(np.ascontiguousarray(shifts[field]) for field in SHIFT_DTYPE.names)
+
+
+def compute_timesheet(user_ids, check_ins, check_outs, start, end):
+    """
+    Показатели по (работник, день) для смен в столбцах load_shifts.
+
+    Возвращает словарь массивов одной длины - по строке на день работника
+    со сменами: 'user_id', 'day' (номер дня от start), 'shifts' и DAY_FIELDS.
+    """
+    days = (end - start).days + 1
+    starts = np.array([day_start(start + timedelta(days=offset)).timestamp() for offset in range(days + 1)])
+    bounds = np.array([
+        [bound.timestamp() for bound in _shift_bounds(start + timedelta(days=offset))] for offset in range(days)
+    ])
+
+    day = np.searchsorted(starts, check_ins, side='right') - 1
+    # Смены за пределами периода не учитываются
+    inside = (day >= 0) & (day < days)
+    if not inside.any():
+        return {field: np.empty(0, dtype=np.int64) for field in ('user_id', 'day', 'shifts', *DAY_FIELDS)}
+    user_ids, check_ins, check_outs, day = user_ids[inside], check_ins[inside], check_outs[inside], day[inside]
+    worked = np.maximum(np.rint(check_outs - check_ins), 0)
+
+    # Группы (работник, день) - отрезки отсортированного ключа
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    key = user_index * days + day
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    first = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    group_day = key[first] % days
+
+    worked_seconds = np.add.reduceat(worked[order], first)
+    first_in = np.minimum.reduceat(check_ins[order], first)
+    last_out = np.maximum.reduceat(check_outs[order], first)
+    return {
+        'user_id': users[key[first] // days],
+        'day': group_day,
+        'shifts': np.diff(np.r_[first, key.size]),
+        'worked_seconds': worked_seconds.astype(np.int64),
+        'overtime_seconds': np.maximum(worked_seconds - settings.ATTENDANCE_WORKDAY_HOURS * 3600, 0).astype(np.int64),
+        'late_seconds': np.maximum(np.rint(first_in - bounds[group_day, 0]), 0).astype(np.int64),
+        'early_seconds': np.maximum(np.rint(bounds[group_day, 1] - last_out), 0).astype(np.int64),
+    }
+
+
+def worker_totals(days):
+    """Итоги работников по строкам compute_timesheet: массивы по id работника"""
+    users, index = np.unique(days['user_id'], return_inverse=True)
+    totals = {'user_id': users, 'days': np.bincount(index, minlength=users.size)}
+    totals['shifts'] = np.bincount(index, weights=days['shifts'], minlength=users.size).astype(np.int64)
+    for field in DAY_FIELDS:
+        totals[field] = np.bincount(index, weights=days[field], minlength=users.size).astype(np.int64)
+    # Дни с опозданием и с ранним уходом
+    totals['late_days'] = np.bincount(index, weights=days['late_seconds'] > 0, minlength=users.size).astype(np.int64)
+    totals['early_days'] = np.bincount(index, weights=days['early_seconds'] > 0, minlength=users.size).astype(np.int64)
+    return totals
+
+
+def timesheet(start, end, user_id=None):
+    """Табель за период: строка на работника со сменами, по ФИО"""
+    days = compute_timesheet(*load_shifts(start, end, user_id), start, end)
+    totals = worker_totals(days)
+    users = {user['id']: user for user in User.objects.filter(
+        id__in=totals['user_id'].tolist()
+    ).values('id', 'full_name', 'position')}
+    rows = []
+    for index, worker_id in enumerate(totals['user_id'].tolist()):
+        rows.append({
+            'user': users[worker_id],
+            'days': int(totals['days'][index]),
+            'shifts': int(totals['shifts'][index]),
+            'total_hours': round(int(totals['worked_seconds'][index]) / 3600, 2),
+            'overtime_hours': round(int(totals['overtime_seconds'][index]) / 3600, 2),
+            'late_days': int(totals['late_days'][index]),
+            'late_minutes': round(int(totals['late_seconds'][index]) / 60),
+            'early_days': int(totals['early_days'][index]),
+            'early_minutes': round(int(totals['early_seconds'][index]) / 60),
+        })
+    return sorted(rows, key=lambda row: (row['user']['full_name'], row['user']['id']))
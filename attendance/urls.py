@@ -8,6 +8,13 @@ urlpatterns = [
     path('check-in-out/', views.check_in_out, name='check_in_out'),
     path('user/<int:user_id>/', views.user_detail, name='user_detail'),
     path('reports/', views.reports, name='reports'),
+    path('reports/export/', views.reports_export, name='reports_export'),
+    path('reports/timesheet/', views.timesheet_report, name='timesheet'),
+    path('reports/absences/', views.absences_report, name='absences'),
+    path('presence/stream/', views.presence_stream, name='presence_stream'),
+    path('api/punches/', views.punch_batch, name='punch_batch'),
+    path('kiosk/', views.kiosk, name='kiosk'),
+    path('kiosk/punch/', views.kiosk_punch, name='kiosk_punch'),
 
     # Аутентификация
     path('login/', auth_views.LoginView.as_view(
@@ -0,0 +1,118 @@
+"""
+Версии данных посещаемости для условных GET-запросов (ETag / Last-Modified).
+
+Версия - время последнего изменения в наносекундах, хранится в таблице
+DataVersion, общей для всех процессов сервера: изменение, сделанное
+в одном процессе, сразу видно остальным. Общая версия меняется при любой
+отметке и правке, версия работника - только при изменении его смен.
+Изменения, для которых неизвестно, чьи смены затронуты (архивация,
+генерация данных, правка пользователей), сдвигают эпоху - она входит
+во все версии.
+
+Версии сдвигает refresh_roster после фиксации транзакции, то есть на всех
+путях записи. Чтение версий - один запрос по первичному ключу и ничего
+не пишет: версии, которых еще нет в таблице, равны эпохе.
+
+Отдельно ведутся версии прошедших дней по месяцам - для кэша отчетов
+(report_cache). Их сдвигают записи ежедневных итогов за дни до сегодняшнего,
+поэтому отметки текущего дня кэш отчетов не сбрасывают.
+"""
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import DataVersion
+
+VERSION_KEY = 'attendance:version'
+EPOCH_KEY = 'attendance:version:epoch'
+USER_VERSION_KEY = 'attendance:version:user:{}'
+# Месяц (YYYY-MM) и работник; 'all' - изменения любого работника
+MONTH_VERSION_KEY = 'attendance:version:month:{}:{}'
+# Все прошедшие дни работника или 'all' - для отчетов без начала периода
+PAST_VERSION_KEY = 'attendance:version:past:{}'
+
+
+def _get_many(keys):
+    """Версии keys (с учетом эпохи) одним запросом"""
+    stored = dict(DataVersion.objects.filter(key__in={EPOCH_KEY, *keys}).values_list('key', 'value'))
+    epoch = stored.get(EPOCH_KEY, 0)
+    return [max(stored.get(key, 0), epoch) for key in keys]
+
+
+def _set_many(keys, version):
+    DataVersion.objects.bulk_create(
+        [DataVersion(key=key, value=version) for key in keys],
+        update_conflicts=True, unique_fields=['key'], update_fields=['value'],
+    )
+
+
+def _get(key):
+    return _get_many([key])[0]
+
+
+def attendance_version():
+    """Общая версия данных посещаемости"""
+    return _get(VERSION_KEY)
+
+
+def epoch():
+    """Эпоха: сдвигается изменениями, для которых неизвестны затронутые работники"""
+    return _get(EPOCH_KEY)
+
+
+def user_version(user_id):
+    """Версия смен работника"""
+    return _get(USER_VERSION_KEY.format(user_id))
+
+
+def bump(user_ids=None):
+    """Сдвигает общую версию и версии работников user_ids (None - всех); возвращает новую версию"""
+    keys = [VERSION_KEY]
+    if user_ids is None:
+        keys.append(EPOCH_KEY)
+    else:
+        keys += [USER_VERSION_KEY.format(user_id) for user_id in user_ids]
+    version = time.time_ns()
+    _set_many(keys, version)
+    return version
+
+
+def bump_users(user_ids):
+    """Сдвигает только версии работников user_ids: общие страницы не меняются"""
+    _set_many([USER_VERSION_KEY.format(user_id) for user_id in user_ids], time.time_ns())
+
+
+def _months(start, end):
+    """Месяцы (YYYY-MM) с start по end включительно"""
+    month = start.replace(day=1)
+    while month <= end:
+        yield f'{month:%Y-%m}'
+        month = (month + timedelta(days=31)).replace(day=1)
+
+
+def past_versions(start, end, user_id=None):
+    """Версии итогов прошедших дней с start (None - с первого дня) по end"""
+    scope = user_id or 'all'
+    if start is None:
+        keys = [PAST_VERSION_KEY.format(scope)]
+    else:
+        keys = [MONTH_VERSION_KEY.format(month, scope) for month in _months(start, end)]
+    return tuple(_get_many(keys))
+
+
+def bump_past_days(start, end, user_ids=None):
+    """
+    Сдвигает версии итогов дней с start по end, уже прошедших на сегодня;
+    user_ids - чьи итоги изменились (None - неизвестно, сдвигается эпоха)
+    """
+    end = min(end, timezone.localdate() - timedelta(days=1))
+    if start > end:
+        return
+    if user_ids is None:
+        _set_many([EPOCH_KEY], time.time_ns())
+        return
+    scopes = ('all', *user_ids)
+    keys = [PAST_VERSION_KEY.format(scope) for scope in scopes]
+    keys += [MONTH_VERSION_KEY.format(month, scope) for month in _months(start, end) for scope in scopes]
+    _set_many(keys, time.time_ns())
@@ -1,43 +1,349 @@
+import asyncio
+import csv
+import hashlib
+import heapq
+import hmac
+import json
+import zlib
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
 from django.utils import timezone
-from django.db.models import Q
-from datetime import datetime, timedelta
-from .models import Attendance, User
+from django.utils.dateparse import parse_date
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncMonth
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .models import ArchivedAttendance, Attendance, DailyAttendanceSummary, User
+from . import presence, punch_log, punches, report_cache, versions
+from .absences import absences
+from .archive import archive_cutoff, reaches_archive
+from .ingest import IngestError, ingest_events
+from .kiosk import badges as kiosk_badges
+from .roster import ROW_FIELDS, attendance_row, get_roster
+from .summary import day_start, work_date
+from .timesheet import timesheet
+
+
+def _parse_day(value):
+    """Дата из строки YYYY-MM-DD; для пустой или некорректной строки None"""
+    try:
+        return parse_date(value) if value else None
+    except ValueError:
+        return None
+
+
+def _parse_user_id(value):
+    """id работника из фильтра отчета; для пустой или нецифровой строки None"""
+    if not value or not value.isascii() or not value.isdigit():
+        return None
+    return int(value)
+
+
+def _filter_attendances(attendances, start_date=None, end_date=None, user_id=None):
+    """Применяет фильтры отчета (период и работник) к queryset посещаемости"""
+    # Период задается диапазоном по check_in, а не check_in__date,
+    # чтобы запрос мог использовать индекс по времени прихода
+    start = _parse_day(start_date)
+    end = _parse_day(end_date)
+    if start:
+        attendances = attendances.filter(check_in__gte=day_start(start))
+    if end:
+        attendances = attendances.filter(check_in__lt=day_start(end + timedelta(days=1)))
+    if user_id:
+        attendances = attendances.filter(user_id=user_id)
+    return attendances
+
+
+def _filter_summaries(summaries, start=None, end=None, user_id=None):
+    """Те же фильтры отчета для ежедневных итогов (период - даты)"""
+    if start:
+        summaries = summaries.filter(work_date__gte=start)
+    if end:
+        summaries = summaries.filter(work_date__lte=end)
+    if user_id:
+        summaries = summaries.filter(user_id=user_id)
+    return summaries
+
+
+def _users_stats_queryset(start=None, end=None, user_id=None):
+    """GROUP BY запрос по ежедневным итогам: закрытые смены и часы по работникам"""
+    summaries = _filter_summaries(DailyAttendanceSummary.objects.all(), start, end, user_id)
+    return summaries.values(
+        'user_id', 'user__full_name', 'user__position'
+    ).annotate(
+        total_days=Sum('shifts'),
+        total_seconds=Sum('worked_seconds'),
+    ).order_by('user__full_name', 'user_id')
+
+
+def _open_shifts_queryset(start_date=None, end_date=None, user_id=None):
+    """Открытые смены за период по работникам: их еще нет в ежедневных итогах"""
+    attendances = _filter_attendances(Attendance.objects.filter(is_present=True), start_date, end_date, user_id)
+    return attendances.values(
+        'user_id', 'user__full_name', 'user__position'
+    ).annotate(
+        total_days=Count('id'),
+    ).order_by()
+
+
+def _aggregate_users_stats(start_date=None, end_date=None, user_id=None):
+    """Итоги по работникам (дни и часы) из ежедневных итогов и открытых смен"""
+    start = _parse_day(start_date)
+    end = _parse_day(end_date)
+    today = timezone.localdate()
+    yesterday = today - timedelta(days=1)
+
+    # Итоги прошедших дней берутся из кэша, сегодняшние считаются заново
+    rows = []
+    past_end = min(end, yesterday) if end else yesterday
+    if not start or start <= past_end:
+        rows += report_cache.past_rows(
+            start, past_end, user_id, lambda: list(_users_stats_queryset(start, past_end, user_id))
+        )
+    if not end or end >= today:
+        rows += _users_stats_queryset(max(start, today) if start else today, end, user_id)
+
+    users_stats = {}
+    for row in rows:
+        stat = users_stats.setdefault(row['user_id'], {
+            'user': {
+                'id': row['user_id'],
+                'full_name': row['user__full_name'],
+                'position': row['user__position'],
+            },
+            'total_days': 0,
+            'total_seconds': 0,
+        })
+        stat['total_days'] += row['total_days']
+        stat['total_seconds'] += row['total_seconds']
+    for stat in users_stats.values():
+        stat['total_hours'] = round(stat.pop('total_seconds') / 3600, 2)
+
+    # Открытая смена учитывается в днях, но часов еще не добавляет
+    for row in _open_shifts_queryset(start_date, end_date, user_id):
+        stat = users_stats.setdefault(row['user_id'], {
+            'user': {
+                'id': row['user_id'],
+                'full_name': row['user__full_name'],
+                'position': row['user__position'],
+            },
+            'total_days': 0,
+            'total_hours': 0,
+        })
+        stat['total_days'] += row['total_days']
+
+    return sorted(users_stats.values(), key=lambda stat: (stat['user']['full_name'], stat['user']['id']))
+
+
+def _history_page_size(value):
+    """Размер страницы истории из запроса, ограниченный настройками"""
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return settings.ATTENDANCE_HISTORY_PAGE_SIZE
+    return max(1, min(page_size, settings.ATTENDANCE_HISTORY_MAX_PAGE_SIZE))
+
+
+CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _encode_cursor(attendance):
+    """Курсор страницы: время прихода в микросекундах и id записи"""
+    micros = (attendance.check_in - CURSOR_EPOCH) // timedelta(microseconds=1)
+    return f"{micros}_{attendance.id}"
+
+
+def _decode_cursor(cursor):
+    """Разбирает курсор в (check_in, id); для некорректного курсора возвращает None"""
+    try:
+        micros, pk = (int(part) for part in cursor.split('_'))
+        return CURSOR_EPOCH + timedelta(microseconds=micros), pk
+    except (ValueError, OverflowError):
+        return None
+
+
+def _keyset_page(attendances, after=None, before=None, page_size=50, archived=None):
+    """
+    Страница записей, отсортированных по (-check_in, id).
+
+    after - курсор последней записи предыдущей страницы (листаем к старым записям),
+    before - курсор первой записи следующей страницы (листаем к новым записям).
+    Стоимость страницы не зависит от ее глубины: запрос идет по индексу
+    (user, -check_in) от курсора и читает page_size + 1 строк. Порядок id
+    совпадает с порядком rowid внутри индекса, поэтому сортировка не нужна.
+
+    archived - те же записи в архиве; он читается, только если страница
+    доходит до границы архива, и сливается с рабочей таблицей по порядку.
+    """
+    after = _decode_cursor(after) if after else None
+    before = _decode_cursor(before) if before and not after else None
+    cutoff = archive_cutoff()
+
+    def newer(records):
+        check_in, pk = before
+        return records.filter(check_in__gte=check_in).filter(
+            Q(check_in__gt=check_in) | Q(check_in=check_in, id__lt=pk)
+        ).order_by('check_in', '-id')[:page_size + 1]
+
+    def older(records):
+        if after:
+            check_in, pk = after
+            records = records.filter(check_in__lte=check_in).filter(
+                Q(check_in__lt=check_in) | Q(check_in=check_in, id__gt=pk)
+            )
+        return records.order_by('-check_in', 'id')[:page_size + 1]
+
+    if before:
+        rows = list(newer(attendances))
+        if archived is not None and before[0] < cutoff:
+            rows = sorted(rows + list(newer(archived)), key=lambda row: (row.check_in, -row.id))
+            rows = rows[:page_size + 1]
+        has_more = len(rows) > page_size
+        items = rows[:page_size][::-1]
+        has_prev, has_next = has_more, True
+    else:
+        rows = list(older(attendances))
+        if archived is not None and (len(rows) <= page_size or rows[-1].check_in < cutoff):
+            rows = sorted(rows + list(older(archived)), key=lambda row: (row.check_in, -row.id), reverse=True)
+            rows = rows[:page_size + 1]
+        items = rows[:page_size]
+        has_prev, has_next = after is not None, len(rows) > page_size
+
+    return {
+        'items': items,
+        'page_size': page_size,
+        'prev_cursor': _encode_cursor(items[0]) if items and has_prev else None,
+        'next_cursor': _encode_cursor(items[-1]) if items and has_next else None,
+    }
+
+
+def _conditional(scope):
+    """
+    Условный GET (ETag / Last-Modified) по версиям данных посещаемости:
+    неизменившаяся страница отдается ответом 304 без чтения таблицы
+    посещаемости и отрисовки шаблона.
+
+    scope(request, ...) возвращает (версия в наносекундах, части ETag)
+    или None, если страницу нужно отдать целиком.
+    """
+    def page_version(request, *args, **kwargs):
+        if not hasattr(request, '_page_version'):
+            request._page_version = None
+            # Непоказанные сообщения выводятся только в полной странице
+            if request.method in ('GET', 'HEAD') and not len(messages.get_messages(request)):
+                request._page_version = scope(request, *args, **kwargs)
+        return request._page_version
+
+    def etag(request, *args, **kwargs):
+        page = page_version(request, *args, **kwargs)
+        if page is None:
+            return None
+        version, parts = page
+        # Страница содержит CSRF-токен, который меняется при входе вместе с ключом сессии
+        key = [version, request.session.session_key, *parts]
+        return hashlib.sha1('|'.join(map(str, key)).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        page = page_version(request, *args, **kwargs)
+        if page is None:
+            return None
+        return datetime.fromtimestamp(page[0] / 1e9, tz=dt_timezone.utc)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def _dashboard_scope(request):
+    """Версия главной: у администратора - общая, у работника - его смен за сегодня"""
+    if request.user.role == 'admin':
+        return versions.attendance_version(), [request.user.id, 'admin']
+    today = timezone.localdate()
+    # С началом дня меняется окно записей работника
+    day_version = int(day_start(today).timestamp()) * 10 ** 9
+    return max(versions.user_version(request.user.id), day_version), [request.user.id, today]
+
+
+def _reports_scope(request):
+    """Версия отчетов: общая; работников перенаправляет полный ответ"""
+    if request.user.role != 'admin':
+        return None
+    return versions.attendance_version(), [request.user.id]
+
+
+def _timesheet_scope(request):
+    """Версия табеля: как у отчетов, но период по умолчанию зависит от даты"""
+    page = _reports_scope(request)
+    return page and (page[0], [*page[1], timezone.localdate()])
 
 
 @login_required
+@_conditional(_dashboard_scope)
 def dashboard(request):
     """Главная страница с информацией о посещаемости"""
     current_time = timezone.now()
 
     if request.user.role == 'admin':
-        # Администраторы видят всех
-        current_attendances = Attendance.objects.filter(is_present=True).select_related('user')
-        recent_attendances = Attendance.objects.all().select_related('user')[:10]
+        # Администраторы видят всех; данные берутся из кэша, а таблицы
+        # отрисовываются заново только при смене версии данных
+        roster = get_roster()
+        current_attendances = roster['present']
+        recent_attendances = roster['recent']
+        roster_version = roster['version']
         show_other_users = True
     else:
-        # Работники видят только себя
-        current_attendances = Attendance.objects.filter(
-            user=request.user,
-            is_present=True
-        ).select_related('user')
-        recent_attendances = Attendance.objects.filter(
-            user=request.user
-        ).select_related('user')[:10]
+        # Работники видят только свои записи за сегодня, вместе с еще не свернутыми отметками
+        today = timezone.localdate(current_time)
+        current_attendances = []
+        recent_attendances = [
+            attendance_row(values)
+            for values in Attendance.objects.filter(
+                user=request.user,
+                check_in__gte=day_start(today),
+                check_in__lt=day_start(today + timedelta(days=1)),
+            ).order_by('-check_in').values(*ROW_FIELDS)
+        ]
+        if settings.ATTENDANCE_PUNCH_LOG:
+            recent_attendances = punch_log.fold_pending(recent_attendances, request.user)
+        roster_version = None
         show_other_users = False
 
     context = {
         'current_attendances': current_attendances,
         'recent_attendances': recent_attendances,
+        'roster_version': roster_version,
+        'roster_cache_timeout': settings.ATTENDANCE_ROSTER_CACHE_TIMEOUT,
         'current_time': current_time,
         'user_role': request.user.role,
         'show_other_users': show_other_users,
+        # Поток табло держит соединение открытым, а это по силам только ASGI-серверу
+        'live_board': isinstance(request, ASGIRequest),
     }
     return render(request, 'attendance/dashboard.html', context)
 
 
+def _punch(user_id, direction):
+    """
+    Отметка прихода ('in') или ухода ('out'): в журнал или сразу в смены
+    (ATTENDANCE_PUNCH_LOG). False - повторный приход или уход без открытой смены.
+    """
+    if not settings.ATTENDANCE_PUNCH_LOG:
+        return bool(punches.check_in(user_id) if direction == 'in' else punches.check_out(user_id))
+    if not punch_log.record_punch(user_id, direction):
+        return False
+    if presence.broker.subscriber_count():
+        # Живые табло ждут отметку сразу, а не до следующей свертки
+        punch_log.try_compact_pending()
+    return True
+
+
 @login_required
 def check_in_out(request):
     """Отметка прихода/ухода"""
@@ -45,37 +351,111 @@ def check_in_out(request):
         messages.error(request, 'Только работники могут отмечать посещаемость')
         return redirect('dashboard')
 
-    # Проверяем текущее состояние
-    current_attendance = Attendance.objects.filter(
-        user=request.user,
-        is_present=True
-    ).first()
-
     if request.method == 'POST':
         action = request.POST.get('action')
 
-        if action == 'check_in' and not current_attendance:
-            # Приход на работу
-            Attendance.objects.create(
-                user=request.user,
-                check_in=timezone.now(),
-                is_present=True
-            )
+        # Состояние не читается заранее: отметка - одна условная запись
+        # (или одна вставка в журнал), повторный приход или уход отклоняется
+        if action == 'check_in' and _punch(request.user.id, 'in'):
             messages.success(request, 'Вы отметили приход на работу')
-
-        elif action == 'check_out' and current_attendance:
-            # Уход с работы
-            current_attendance.check_out = timezone.now()
-            current_attendance.is_present = False
-            current_attendance.save()
+        elif action == 'check_out' and _punch(request.user.id, 'out'):
             messages.success(request, 'Вы отметили уход с работы')
-
         else:
             messages.error(request, 'Неверное действие')
 
     return redirect('dashboard')
 
 
+async def _presence_events():
+    """События табло: снимок состава, затем изменения и пустые строки-пинги"""
+    queue = presence.broker.subscribe()
+    try:
+        # Подписка идет до снимка, чтобы не потерять изменения между ними;
+        # повтор изменения, уже попавшего в снимок, табло пропускает
+        message = presence.RESYNC
+        while True:
+            if message is presence.RESYNC:
+                roster = await sync_to_async(get_roster)()
+                version = roster['version']
+                message = presence.format_event(
+                    'snapshot', [presence.board_row(row) for row in roster['present']], version
+                )
+            elif isinstance(message, tuple):
+                version, message = message
+            yield message
+            try:
+                message = await asyncio.wait_for(queue.get(), settings.ATTENDANCE_PRESENCE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Изменения других процессов (свертка журнала, другие процессы
+                # сервера) через broker не приходят: их выдает общая версия данных
+                if await sync_to_async(versions.attendance_version)() != version:
+                    message = presence.RESYNC
+                else:
+                    # Комментарий держит соединение через прокси и выявляет отключенные табло
+                    message = ': ping\n\n'
+    finally:
+        presence.broker.unsubscribe(queue)
+
+
+@login_required
+async def presence_stream(request):
+    """Живое табло "Сейчас на работе" (Server-Sent Events, только для админов, под ASGI)"""
+    user = await request.auser()
+    if user.role != 'admin':
+        return HttpResponseForbidden('Доступ запрещен')
+    if not isinstance(request, ASGIRequest):
+        # WSGI-сервер занял бы поток на все время соединения;
+        # на 204 EventSource не переподключается
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(_presence_events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен буферизовать поток
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+DETAIL_BREAKDOWN_MONTHS = 12
+
+
+def _add_months(month, count):
+    """Первое число месяца, отстоящего от month на count месяцев"""
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def _month_stats(user_id, first_month, open_day=None):
+    """
+    Итоги работника по месяцам с first_month по текущий, от ранних к поздним:
+    [{'month', 'total_hours', 'total_days'}].
+
+    Один GROUP BY по ежедневным итогам (не больше строки на день), поэтому
+    стоимость не зависит от числа смен. Дни - различные рабочие дни;
+    открытая смена добавляет день, если в ее день еще нет закрытых смен.
+    """
+    rows = DailyAttendanceSummary.objects.filter(
+        user_id=user_id, work_date__gte=first_month
+    ).annotate(
+        month=TruncMonth('work_date'),
+    ).values('month').annotate(
+        seconds=Sum('worked_seconds'),
+        days=Count('id'),
+        open_day_closed=Count('id', filter=Q(work_date=open_day)),
+    ).order_by()
+    by_month = {row['month']: row for row in rows}
+
+    months = []
+    month = first_month
+    last_month = timezone.localdate().replace(day=1)
+    while month <= last_month:
+        row = by_month.get(month, {'seconds': 0, 'days': 0, 'open_day_closed': 0})
+        days = row['days']
+        if open_day and open_day.replace(day=1) == month and not row['open_day_closed']:
+            days += 1
+        months.append({'month': month, 'total_hours': round(row['seconds'] / 3600, 2), 'total_days': days})
+        month = _add_months(month, 1)
+    return months
+
+
 @login_required
 def user_detail(request, user_id):
     """Детальная информация о пользователе (только для админов)"""
@@ -83,30 +463,43 @@ def user_detail(request, user_id):
         messages.error(request, 'Доступ запрещен')
         return redirect('dashboard')
 
-    user = get_object_or_404(User, id=user_id)
+    # Открытая смена читается вместе с работником, подзапросом по индексу открытых смен
+    user = get_object_or_404(User.objects.annotate(
+        open_check_in=Subquery(
+            Attendance.objects.filter(user=OuterRef('pk'), is_present=True).values('check_in')[:1]
+        ),
+    ), id=user_id)
 
-    # Получаем все записи посещаемости пользователя
-    attendances = Attendance.objects.filter(user=user).order_by('-check_in')
+    attendances = Attendance.objects.filter(user=user)
 
-    # Статистика за текущий месяц
-    now = timezone.now()
-    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    month_attendances = attendances.filter(check_in__gte=start_of_month)
+    # История посещаемости постранично, по курсору (check_in, id)
+    page = _keyset_page(
+        attendances,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=_history_page_size(request.GET.get('page_size')),
+        archived=ArchivedAttendance.objects.filter(user=user),
+    )
 
-    total_hours = sum(att.get_work_duration() or 0 for att in month_attendances)
-    total_days = month_attendances.count()
+    # Статистика за текущий месяц (и по желанию помесячно за год) - один запрос
+    show_months = request.GET.get('months') == '1'
+    first_month = _add_months(timezone.localdate().replace(day=1), 1 - DETAIL_BREAKDOWN_MONTHS if show_months else 0)
+    months = _month_stats(user.id, first_month, user.open_check_in and work_date(user.open_check_in))
 
     context = {
         'selected_user': user,
-        'attendances': attendances,
-        'total_hours': round(total_hours, 2),
-        'total_days': total_days,
+        'attendances': page['items'],
+        'page': page,
+        'total_hours': months[-1]['total_hours'],
+        'total_days': months[-1]['total_days'],
+        'months': months[::-1] if show_months else None,
         'user_role': request.user.role,
     }
     return render(request, 'attendance/user_detail.html', context)
 
 
 @login_required
+@_conditional(_reports_scope)
 def reports(request):
     """Отчеты (только для админов)"""
     if request.user.role != 'admin':
@@ -116,40 +509,255 @@ def reports(request):
     # Фильтры
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
-    user_id = request.GET.get('user_id')
-
-    attendances = Attendance.objects.select_related('user')
-
-    if start_date:
-        attendances = attendances.filter(check_in__date__gte=start_date)
-    if end_date:
-        attendances = attendances.filter(check_in__date__lte=end_date)
-    if user_id:
-        attendances = attendances.filter(user_id=user_id)
+    # Число, а не строка запроса: ключ кэша отчета и версии работника
+    # должны совпадать для "5" и "05"
+    user_id = _parse_user_id(request.GET.get('user_id'))
 
-    # Группировка по пользователям
-    users_stats = {}
-    for attendance in attendances:
-        user_id = attendance.user.id
-        if user_id not in users_stats:
-            users_stats[user_id] = {
-                'user': attendance.user,
-                'total_hours': 0,
-                'total_days': 0,
-                'attendances': []
-            }
-        users_stats[user_id]['attendances'].append(attendance)
-        users_stats[user_id]['total_days'] += 1
-        if attendance.get_work_duration():
-            users_stats[user_id]['total_hours'] += attendance.get_work_duration()
+    # Итоги по работникам считаются в БД по ежедневным итогам
+    users_stats = _aggregate_users_stats(start_date, end_date, user_id)
 
     users = User.objects.filter(role='worker')
 
     context = {
-        'users_stats': list(users_stats.values()),
+        'users_stats': users_stats,
         'users': users,
         'start_date': start_date,
         'end_date': end_date,
+        'user_id': user_id,
+        'user_role': request.user.role,
+    }
+    return render(request, 'attendance/reports.html', context)
+
+
+@login_required
+@_conditional(_timesheet_scope)
+def timesheet_report(request):
+    """Табель: часы, переработка, опоздания и ранние уходы (только для админов)"""
+    if request.user.role != 'admin':
+        messages.error(request, 'Доступ запрещен')
+        return redirect('dashboard')
+
+    # По умолчанию - текущий месяц по сегодняшний день
+    today = timezone.localdate()
+    start = _parse_day(request.GET.get('start_date')) or today.replace(day=1)
+    end = _parse_day(request.GET.get('end_date')) or today
+    user_id = _parse_user_id(request.GET.get('user_id'))
+    if start > end:
+        start, end = end, start
+
+    context = {
+        'rows': timesheet(start, end, user_id),
+        'users': User.objects.filter(role='worker'),
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'user_id': user_id,
+        'shift_start': settings.ATTENDANCE_SHIFT_START,
+        'shift_end': settings.ATTENDANCE_SHIFT_END,
+        'workday_hours': settings.ATTENDANCE_WORKDAY_HOURS,
         'user_role': request.user.role,
     }
-    return render(request, 'attendance/reports.html', context)
\ No newline at end of file
+    return render(request, 'attendance/timesheet.html', context)
+
+
+@login_required
+@_conditional(_timesheet_scope)
+def absences_report(request):
+    """Прогулы: рабочие дни без смен по работникам (только для админов)"""
+    if request.user.role != 'admin':
+        messages.error(request, 'Доступ запрещен')
+        return redirect('dashboard')
+
+    # По умолчанию - текущий месяц; сегодняшний день в прогулы не входит
+    today = timezone.localdate()
+    start = _parse_day(request.GET.get('start_date')) or today.replace(day=1)
+    end = _parse_day(request.GET.get('end_date')) or today
+    user_id = _parse_user_id(request.GET.get('user_id'))
+    if start > end:
+        start, end = end, start
+
+    context = {
+        'rows': absences(start, end, user_id),
+        'users': User.objects.filter(role='worker'),
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'user_id': user_id,
+        'user_role': request.user.role,
+    }
+    return render(request, 'attendance/absences.html', context)
+
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_HEADER = ['ФИО', 'Логин', 'Должность', 'Приход', 'Уход', 'Часы работы', 'Статус']
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает записанную строку вместо буферизации"""
+
+    def write(self, value):
+        return value
+
+
+def _export_lines(*sources):
+    """
+    Строки CSV для выгрузки; querysets (рабочая таблица и архив) читаются
+    порциями и сливаются по (check_in, id).
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_HEADER)
+
+    rows = [
+        attendances.values_list(
+            'user__full_name', 'user__username', 'user__position', 'check_in', 'check_out', 'is_present',
+            'worked_seconds', 'id',
+        ).order_by('check_in', 'id').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        for attendances in sources
+    ]
+    for full_name, username, position, check_in, check_out, is_present, worked_seconds, _ in heapq.merge(
+        *rows, key=lambda row: (row[3], row[7])
+    ):
+        hours = round(worked_seconds / 3600, 2) if worked_seconds is not None else ''
+        yield writer.writerow([
+            full_name,
+            username,
+            position,
+            timezone.localtime(check_in).strftime('%d.%m.%Y %H:%M'),
+            timezone.localtime(check_out).strftime('%d.%m.%Y %H:%M') if check_out else '',
+            hours,
+            'На работе' if is_present else 'Ушел',
+        ])
+
+
+def _export_chunks(lines, compress=False):
+    """Склеивает строки в блоки по EXPORT_CHUNK_SIZE и при необходимости сжимает gzip"""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: формат gzip
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) < EXPORT_CHUNK_SIZE:
+            continue
+        data = ''.join(batch).encode('utf-8')
+        batch = []
+        data = compressor.compress(data) if compressor else data
+        if data:
+            yield data
+
+    data = ''.join(batch).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+@login_required
+def reports_export(request):
+    """Потоковая выгрузка отчета в CSV (только для админов)"""
+    if request.user.role != 'admin':
+        messages.error(request, 'Доступ запрещен')
+        return redirect('dashboard')
+
+    # Те же фильтры, что и у страницы отчетов
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+    user_id = _parse_user_id(request.GET.get('user_id'))
+    compress = request.GET.get('gzip') == '1'
+
+    sources = [_filter_attendances(Attendance.objects.all(), start_date, end_date, user_id)]
+    start = _parse_day(start_date)
+    if reaches_archive(day_start(start) if start else None):
+        sources.append(_filter_attendances(ArchivedAttendance.objects.all(), start_date, end_date, user_id))
+
+    filename = 'attendance.csv.gz' if compress else 'attendance.csv'
+    response = StreamingHttpResponse(
+        _export_chunks(_export_lines(*sources), compress=compress),
+        content_type='application/gzip' if compress else 'text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _turnstile_authorized(request):
+    """Проверяет токен контроллера турникета из заголовка Authorization: Bearer <токен>"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    return any(hmac.compare_digest(token, allowed) for allowed in settings.ATTENDANCE_TURNSTILE_TOKENS)
+
+
+@csrf_exempt
+@require_POST
+def punch_batch(request):
+    """Пакетная загрузка отметок от контроллеров турникетов (JSON)"""
+    if not _turnstile_authorized(request):
+        return JsonResponse({'error': 'Неверный токен'}, status=401)
+
+    try:
+        payload = json.loads(request.body)
+    except (UnicodeDecodeError, ValueError):
+        return JsonResponse({'error': 'Тело запроса должно быть JSON'}, status=400)
+    events = payload.get('events') if isinstance(payload, dict) else None
+    if isinstance(events, list) and len(events) > settings.ATTENDANCE_INGEST_MAX_EVENTS:
+        return JsonResponse({'error': f'Не более {settings.ATTENDANCE_INGEST_MAX_EVENTS} событий в пакете'}, status=400)
+
+    try:
+        # Сначала в смены попадают отметки из журнала, чтобы пакет сопоставлялся с ними
+        punch_log.try_compact_pending()
+        results = ingest_events(events)
+    except IngestError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    except IntegrityError:
+        # Параллельная отметка открыла смену между чтением и записью пакета
+        return JsonResponse({'error': 'Конфликт с параллельной отметкой, повторите пакет'}, status=409)
+
+    return JsonResponse({
+        'results': results,
+        'summary': dict(Counter(result['status'] for result in results)),
+    })
+
+
+KIOSK_COOKIE = 'attendance_kiosk'
+KIOSK_COOKIE_SALT = 'attendance.kiosk'
+
+
+def _kiosk_token_valid(token):
+    return bool(token) and any(hmac.compare_digest(token, allowed) for allowed in settings.ATTENDANCE_KIOSK_TOKENS)
+
+
+def _kiosk_authorized(request):
+    """Устройство активировано как терминал: подписанная cookie с действующим токеном"""
+    return _kiosk_token_valid(request.get_signed_cookie(KIOSK_COOKIE, default=None, salt=KIOSK_COOKIE_SALT))
+
+
+def kiosk(request):
+    """Терминал отметок: активация устройства токеном и отметки по пропуску"""
+    error = None
+    if request.method == 'POST':
+        token = request.POST.get('token', '')
+        if _kiosk_token_valid(token):
+            response = redirect('kiosk')
+            response.set_signed_cookie(
+                KIOSK_COOKIE, token, salt=KIOSK_COOKIE_SALT, max_age=settings.ATTENDANCE_KIOSK_COOKIE_AGE,
+                httponly=True, samesite='Strict', secure=request.is_secure(),
+            )
+            return response
+        error = 'Неверный токен устройства'
+
+    return render(request, 'attendance/kiosk.html', {'authorized': _kiosk_authorized(request), 'error': error})
+
+
+@require_POST
+def kiosk_punch(request):
+    """
+    Отметка на терминале по пропуску (JSON). Без входа работника:
+    поиск пропуска в памяти процесса и одна запись.
+    """
+    if not _kiosk_authorized(request):
+        return JsonResponse({'error': 'Устройство не активировано'}, status=401)
+    action = request.POST.get('action')
+    if action not in ('check_in', 'check_out'):
+        return JsonResponse({'error': 'Неверное действие'}, status=400)
+    worker = kiosk_badges.lookup(request.POST.get('badge', '').strip())
+    if worker is None:
+        return JsonResponse({'error': 'Пропуск не найден'}, status=404)
+
+    status = 'ok' if _punch(worker['id'], 'in' if action == 'check_in' else 'out') else 'duplicate'
+    return JsonResponse({'status': status, 'action': action, 'full_name': worker['full_name']})
@@ -0,0 +1,15 @@
+"""
+ASGI config for attendance_system project.
+
+Нужен для живого табло (presence/stream/): под ASGI-сервером, например
+uvicorn attendance_system.asgi:application, соединения табло держит
+цикл событий, а не отдельные потоки.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings')
+
+application = get_asgi_application()
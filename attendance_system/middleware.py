@@ -0,0 +1,121 @@
+"""
+Замеры времени запросов: SQL, отрисовка шаблонов и код представления.
+
+RequestTimingMiddleware включается настройкой ATTENDANCE_REQUEST_TIMING.
+Для каждого запроса она добавляет заголовок Server-Timing (виден во
+вкладке Network браузера), а запросы дольше ATTENDANCE_SLOW_REQUEST_MS
+пишет в лог attendance_system.requests одной строкой JSON вместе с самыми
+долгими SQL-запросами.
+
+При выключенной настройке middleware отказывается от подключения
+(MiddlewareNotUsed), и Django не вызывает ее вовсе.
+"""
+import heapq
+import json
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger('attendance_system.requests')
+
+WORST_QUERIES = 3
+SQL_PREVIEW_LENGTH = 500
+
+_current = ContextVar('request_timing', default=None)
+
+
+class RequestMetrics:
+    """Счетчики одного запроса"""
+
+    def __init__(self):
+        self.queries = []  # (мс, sql)
+        self.sql_ms = 0.0
+        self.render_ms = 0.0
+        self.render_sql_ms = 0.0
+        self.render_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        """Обертка connection.execute_wrapper: время каждого SQL-запроса"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.queries.append((elapsed, sql))
+            self.sql_ms += elapsed
+            if self.render_depth:
+                self.render_sql_ms += elapsed
+
+
+_template_render = Template.render
+
+
+def _timed_render(self, context):
+    """Template.render со счетчиком времени; вложенные шаблоны учитываются во внешнем"""
+    metrics = _current.get()
+    if metrics is None or metrics.render_depth:
+        return _template_render(self, context)
+    metrics.render_depth += 1
+    started = time.perf_counter()
+    try:
+        return _template_render(self, context)
+    finally:
+        metrics.render_ms += (time.perf_counter() - started) * 1000
+        metrics.render_depth -= 1
+
+
+class RequestTimingMiddleware:
+    """Server-Timing и лог медленных запросов"""
+
+    def __init__(self, get_response):
+        if not settings.ATTENDANCE_REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        Template.render = _timed_render
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.record_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        # SQL во время отрисовки (ленивые queryset в шаблоне) относится к SQL
+        render_ms = metrics.render_ms - metrics.render_sql_ms
+        view_ms = max(total_ms - metrics.sql_ms - render_ms, 0)
+        response['Server-Timing'] = ', '.join([
+            f'sql;dur={metrics.sql_ms:.1f};desc="{len(metrics.queries)} queries"',
+            f'render;dur={render_ms:.1f}',
+            f'view;dur={view_ms:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+        if total_ms >= settings.ATTENDANCE_SLOW_REQUEST_MS:
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 1),
+                'sql_ms': round(metrics.sql_ms, 1),
+                'queries': len(metrics.queries),
+                'render_ms': round(render_ms, 1),
+                'view_ms': round(view_ms, 1),
+                'worst_sql': [
+                    {'ms': round(elapsed, 1), 'sql': sql[:SQL_PREVIEW_LENGTH]}
+                    for elapsed, sql in heapq.nlargest(WORST_QUERIES, metrics.queries, key=lambda item: item[0])
+                ],
+            }, ensure_ascii=False))
+        return response
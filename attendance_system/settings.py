@@ -2,6 +2,7 @@
 Django settings for attendance_system project.
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -27,6 +28,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'attendance_system.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,6 +66,46 @@ DATABASES = {
     }
 }
 
+# Рабочий режим SQLite для нескольких процессов сервера: журнал WAL (чтение
+# не ждет запись), ожидание блокировки до timeout секунд (busy_timeout)
+# вместо ошибки "database is locked". transaction_mode не задан: BEGIN
+# IMMEDIATE для всех соединений заставил бы каждый atomic(), в том числе
+# только читающий, ждать блокировку записи. Сразу берут ее лишь транзакции
+# путей записи (attendance.locking.write_transaction).
+# ATTENDANCE_SQLITE_PRODUCTION=0 - настройки SQLite по умолчанию.
+SQLITE_PRODUCTION_OPTIONS = {
+    'timeout': 20,
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA cache_size=-65536;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+}
+if os.environ.get('ATTENDANCE_SQLITE_PRODUCTION', '1') == '1':
+    DATABASES['default']['OPTIONS'] = SQLITE_PRODUCTION_OPTIONS
+
+# Сколько раз повторять отметку, если база занята дольше timeout,
+# и начальная пауза между попытками (секунды, удваивается)
+ATTENDANCE_LOCK_RETRIES = 5
+ATTENDANCE_LOCK_RETRY_DELAY = 0.05
+
+# Cache
+# По умолчанию кэш в памяти процесса. Версии данных для ETag и кэша отчетов
+# хранятся в БД и общие для всех процессов, поэтому ответы верны при любом
+# кэше. Но при нескольких процессах сервера подключите общий backend
+# (Redis, Memcached): иначе каждый процесс сам перечитывает кэш главной
+# страницы и отчетов после изменений в других (проверка attendance.W001).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Число процессов сервера (gunicorn и uvicorn читают ту же переменную)
+ATTENDANCE_SERVER_PROCESSES = int(os.environ.get('WEB_CONCURRENCY', '1'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -98,4 +140,55 @@ AUTH_USER_MODEL = 'attendance.User'
 # Login URL
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
-LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/'
+
+# Постраничная история посещаемости работника
+ATTENDANCE_HISTORY_PAGE_SIZE = 50
+ATTENDANCE_HISTORY_MAX_PAGE_SIZE = 500
+
+# Время жизни кэша "Сейчас на работе" (секунды); кэш обновляется при каждой
+# отметке, а таймаут ограничивает устаревание при гонках между процессами
+ATTENDANCE_ROSTER_CACHE_TIMEOUT = 300
+
+# Интервал пингов живого табло (секунды): держит соединение через прокси
+ATTENDANCE_PRESENCE_HEARTBEAT = 15
+
+# Закрытые смены старше стольких дней команда archive_attendance переносит
+# в архив; отчеты и история читают архив, только если период до него доходит
+ATTENDANCE_ARCHIVE_AFTER_DAYS = 400
+
+# График для табеля (reports/timesheet/): начало и конец смены (HH:MM)
+# и норма часов в день - отработанное сверх нормы считается переработкой
+ATTENDANCE_SHIFT_START = '09:00'
+ATTENDANCE_SHIFT_END = '18:00'
+ATTENDANCE_WORKDAY_HOURS = 8
+
+# Выходные дни недели (0 - понедельник): в них отсутствие не считается прогулом
+ATTENDANCE_DAYS_OFF = (5, 6)
+
+# Пакетная загрузка отметок от турникетов (api/punches/).
+# Токены контроллеров задаются через переменную окружения через запятую.
+ATTENDANCE_TURNSTILE_TOKENS = [
+    token for token in os.environ.get('ATTENDANCE_TURNSTILE_TOKENS', '').split(',') if token
+]
+ATTENDANCE_INGEST_MAX_EVENTS = 10000
+
+# Терминалы отметок по пропуску (kiosk/): токены устройств через запятую
+# и срок действия активации устройства (секунды)
+ATTENDANCE_KIOSK_TOKENS = [
+    token for token in os.environ.get('ATTENDANCE_KIOSK_TOKENS', '').split(',') if token
+]
+ATTENDANCE_KIOSK_COOKIE_AGE = 365 * 24 * 3600
+
+# Журнал отметок: при ATTENDANCE_PUNCH_LOG=1 отметки прихода/ухода пишутся
+# в журнал (PunchEvent) одной вставкой и переносятся в смены сверткой
+# manage.py compact_punches --loop (ее нужно держать запущенной); до свертки
+# отметку видит только главная работника. По умолчанию отметка сразу
+# меняет таблицу посещаемости.
+ATTENDANCE_PUNCH_LOG = os.environ.get('ATTENDANCE_PUNCH_LOG') == '1'
+
+# Замеры запросов: заголовок Server-Timing и лог медленных запросов
+# (attendance_system.requests). Выключено, пока не задана переменная
+# окружения ATTENDANCE_REQUEST_TIMING=1; выключенная middleware не вызывается.
+ATTENDANCE_REQUEST_TIMING = os.environ.get('ATTENDANCE_REQUEST_TIMING') == '1'
+ATTENDANCE_SLOW_REQUEST_MS = int(os.environ.get('ATTENDANCE_SLOW_REQUEST_MS', '500'))
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+Нагрузочная проверка отметок прихода/ухода при пересменке
+
+Создает временную файловую базу SQLite, затем N работников параллельно
+отмечают приход и уход. Каждый работник нажимает кнопку дважды (двойной
+клик), поэтому половина отметок конкурирует за одну и ту же смену.
+Скрипт проверяет, что не появилось дублей открытых смен, и печатает
+пропускную способность. Те же отметки повторяются из нескольких
+процессов, как у нескольких процессов gunicorn: ни одна отметка не должна
+упасть с "database is locked". Отдельно измеряются пакетная загрузка
+событий от турникетов и отметки через журнал с последующей сверткой.
+
+Запуск: python3 bench_punches.py [работников] [потоков] [процессов]
+"""
+import os
+import sys
+import json
+import multiprocessing
+import shutil
+import tempfile
+import time
+import django
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as dt_time, timedelta
+
+# Настройка Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings')
+django.setup()
+
+from django.db import OperationalError, connection, connections
+from django.db.models import Count
+from django.test.utils import setup_test_environment
+from django.utils import timezone
+
+from attendance import punch_log, punches
+from attendance.ingest import ingest_events
+from attendance.models import User, Attendance
+
+
+def run_punches(punch, user_ids, threads):
+    """Отметки каждого работника дважды параллельно; возвращает статистику"""
+    def worker(user_id):
+        try:
+            return 'ok' if punch(user_id) else 'rejected'
+        except OperationalError:
+            return 'locked'
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(worker, [user_id for user_id in user_ids for _ in range(2)]))
+    elapsed = time.perf_counter() - started
+    return {
+        'punches': len(results),
+        'applied': results.count('ok'),
+        'rejected_duplicates': results.count('rejected'),
+        'lock_errors': results.count('locked'),
+        'seconds': round(elapsed, 3),
+        'punches_per_second': round(len(results) / elapsed, 1),
+    }
+
+
+def _process_punch(task):
+    """Отметка в дочернем процессе; соединение с БД у каждого процесса свое"""
+    action, user_id = task
+    punch = punches.check_in if action == 'in' else punches.check_out
+    try:
+        return 'ok' if punch(user_id) else 'rejected'
+    except OperationalError:
+        return 'locked'
+
+
+def run_process_punches(action, user_ids, processes):
+    """Двойные отметки каждого работника из нескольких процессов; возвращает статистику"""
+    # Дочерние процессы не должны унаследовать открытое соединение
+    connections.close_all()
+    tasks = [(action, user_id) for user_id in user_ids for _ in range(2)]
+    started = time.perf_counter()
+    with multiprocessing.get_context('fork').Pool(processes) as pool:
+        results = pool.map(_process_punch, tasks, chunksize=8)
+    elapsed = time.perf_counter() - started
+    return {
+        'punches': len(results),
+        'applied': results.count('ok'),
+        'rejected_duplicates': results.count('rejected'),
+        'lock_errors': results.count('locked'),
+        'seconds': round(elapsed, 3),
+        'punches_per_second': round(len(results) / elapsed, 1),
+    }
+
+
+def run_bulk_ingest(user_ids, days=10, batch_size=1000):
+    """Пакетная загрузка событий прихода/ухода за несколько прошлых дней"""
+    today = timezone.localdate()
+    events = []
+    for day_offset in range(days, 0, -1):
+        check_in = timezone.make_aware(datetime.combine(today - timedelta(days=day_offset), dt_time(8)))
+        for user_id in user_ids:
+            events.append({'user_id': user_id, 'timestamp': check_in.isoformat(), 'direction': 'in'})
+            events.append({
+                'user_id': user_id,
+                'timestamp': (check_in + timedelta(hours=8)).isoformat(),
+                'direction': 'out',
+            })
+
+    started = time.perf_counter()
+    statuses = Counter()
+    for start in range(0, len(events), batch_size):
+        statuses.update(result['status'] for result in ingest_events(events[start:start + batch_size]))
+    elapsed = time.perf_counter() - started
+    return {
+        'events': len(events),
+        'batch_size': batch_size,
+        'statuses': dict(statuses),
+        'seconds': round(elapsed, 3),
+        'events_per_second': round(len(events) / elapsed, 1),
+    }
+
+
+def duplicate_open_shifts():
+    """Работники, у которых больше одной открытой смены"""
+    return Attendance.objects.filter(is_present=True).values('user_id').annotate(
+        shifts=Count('id')
+    ).filter(shifts__gt=1).count()
+
+
+def main():
+    workers_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    # Файловая база, чтобы потоки работали с одной БД через свои соединения
+    db_dir = tempfile.mkdtemp()
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(db_dir, 'bench.sqlite3')
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+
+    User.objects.bulk_create(
+        User(username=f'worker{i}', full_name=f'Работник {i}', position='Рабочий', role='worker')
+        for i in range(workers_count)
+    )
+    user_ids = list(User.objects.values_list('id', flat=True))
+
+    report = {'workers': workers_count, 'threads': threads, 'processes': processes}
+    report['check_in'] = run_punches(punches.check_in, user_ids, threads)
+    report['check_in']['open_shifts'] = Attendance.objects.filter(is_present=True).count()
+    report['check_in']['duplicate_open_shifts'] = duplicate_open_shifts()
+    report['check_out'] = run_punches(punches.check_out, user_ids, threads)
+    report['check_out']['open_shifts'] = Attendance.objects.filter(is_present=True).count()
+    report['check_out']['closed_shifts'] = Attendance.objects.filter(is_present=False).count()
+    report['process_check_in'] = run_process_punches('in', user_ids, processes)
+    report['process_check_in']['duplicate_open_shifts'] = duplicate_open_shifts()
+    report['process_check_out'] = run_process_punches('out', user_ids, processes)
+    report['process_check_out']['open_shifts'] = Attendance.objects.filter(is_present=True).count()
+    report['process_check_out']['closed_shifts'] = Attendance.objects.filter(is_present=False).count()
+    report['bulk_ingest'] = run_bulk_ingest(user_ids)
+    report['punch_log'] = run_punches(lambda user_id: punch_log.record_punch(user_id, 'in'), user_ids, threads)
+    started = time.perf_counter()
+    report['punch_log']['compacted'] = punch_log.compact_pending()
+    report['punch_log']['compaction_seconds'] = round(time.perf_counter() - started, 3)
+    report['punch_log']['duplicate_open_shifts'] = duplicate_open_shifts()
+
+    connection.creation.destroy_test_db(connection.settings_dict['NAME'], verbosity=0)
+    shutil.rmtree(db_dir, ignore_errors=True)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    # Ни одна отметка не должна упасть из-за блокировки, и каждый работник
+    # получает ровно одну смену в каждом заходе
+    lock_errors = sum(
+        report[phase]['lock_errors']
+        for phase in ('check_in', 'check_out', 'process_check_in', 'process_check_out', 'punch_log')
+    )
+    duplicates = (
+        report['check_in']['duplicate_open_shifts']
+        + report['process_check_in']['duplicate_open_shifts']
+        + report['punch_log']['duplicate_open_shifts']
+    )
+    failed = lock_errors or duplicates or (
+        report['check_in']['open_shifts'] != workers_count
+        or report['check_out']['closed_shifts'] != workers_count
+        or report['process_check_in']['applied'] != workers_count
+        or report['process_check_out']['closed_shifts'] != 2 * workers_count
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+Скрипт для проверки планов запросов SQLite (EXPLAIN QUERY PLAN)
+
+Создает временную базу в памяти, заполняет ее большим набором смен,
+выполняет запросы к представлениям attendance/views.py тестовым клиентом
+и печатает план для каждого SQL-запроса, который они выполнили, - вместе
+с запросами модулей, которые представления вызывают (состав табло,
+журнал отметок, табель, прогулы, выгрузка). Одинаковые запросы
+печатаются один раз.
+
+Запуск: python3 explain_queries.py [работников] [дней]
+"""
+import json
+import os
+import re
+import sys
+import django
+from datetime import timedelta
+
+# Настройка Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings')
+django.setup()
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+from django.utils import timezone
+
+from attendance import punch_log
+from attendance.benchmark import seed
+from attendance.kiosk import badges
+from attendance.models import ArchivedAttendance, Attendance, DailyAttendanceSummary, PunchEvent, User
+from attendance.views import _encode_cursor
+
+# Таблицы, которые растут со сменами: полный проход по ним - ошибка.
+# Таблицы по строке на работника (работники, битовые карты) отчеты
+# по всем работникам читают целиком.
+LARGE_TABLES = {
+    model._meta.db_table for model in (Attendance, ArchivedAttendance, DailyAttendanceSummary, PunchEvent)
+}
+STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+TOKEN = 'explain'
+
+
+def view_queries(admin, user_ids):
+    """
+    Запросы к представлениям: (название, функция). Функция выполняет
+    запрос тестовым клиентом - с middleware, сессией и шаблонами.
+    """
+    worker_id, punch_id, log_id, kiosk_id = (user_ids[len(user_ids) * share // 8] for share in (4, 5, 6, 7))
+    # Вход выполняется заранее, чтобы запросы сессии не попали в планы представлений
+    clients = {}
+    for user_id in (admin.id, worker_id, punch_id, log_id):
+        clients[user_id] = Client()
+        clients[user_id].force_login(User.objects.get(id=user_id))
+
+    today = timezone.localdate()
+    month = {'start_date': today.replace(day=1).isoformat(), 'end_date': today.isoformat()}
+    quarter = {'start_date': (today - timedelta(days=90)).isoformat(), 'end_date': today.isoformat()}
+    year = {'start_date': (today - timedelta(days=365)).isoformat(), 'end_date': today.isoformat()}
+    history = Attendance.objects.filter(user_id=worker_id).order_by('-check_in', 'id')
+    cursor = _encode_cursor(history[min(50, history.count() - 1)])
+    User.objects.filter(id=kiosk_id).update(badge='explain-badge')
+
+    def get(user_id, url, data=None):
+        def request():
+            response = clients[user_id].get(url, data)
+            # Выгрузка читает базу по мере отправки ответа
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return request
+
+    def punches(user_id):
+        return lambda: [
+            clients[user_id].post('/check-in-out/', {'action': action})
+            for action in ('check_out', 'check_in', 'check_out')
+        ]
+
+    def logged_punches():
+        with override_settings(ATTENDANCE_PUNCH_LOG=True):
+            punches(log_id)()
+
+    def batch():
+        now = timezone.now()
+        events = [
+            {'user_id': user_id, 'timestamp': (now + timedelta(seconds=offset)).isoformat(), 'direction': direction}
+            for user_id in user_ids[:20]
+            for offset, direction in ((0, 'out'), (1, 'in'))
+        ]
+        with override_settings(ATTENDANCE_TURNSTILE_TOKENS=[TOKEN]):
+            Client().post(
+                '/api/punches/', json.dumps({'events': events}),
+                content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {TOKEN}',
+            )
+
+    def kiosk():
+        terminal = Client()
+        with override_settings(ATTENDANCE_KIOSK_TOKENS=[TOKEN]):
+            terminal.post('/kiosk/', {'token': TOKEN})
+            terminal.post('/kiosk/punch/', {'badge': 'explain-badge', 'action': 'check_in'})
+
+    return [
+        ('dashboard (админ): состав на работе и записи за сегодня', get(admin.id, '/')),
+        ('dashboard (работник): записи за сегодня', get(worker_id, '/')),
+        ('user_detail: открытая смена, первая страница истории, итоги за месяц', get(admin.id, f'/user/{worker_id}/')),
+        ('user_detail: страница истории после курсора', get(admin.id, f'/user/{worker_id}/', {'after': cursor})),
+        ('user_detail: итоги по месяцам', get(admin.id, f'/user/{worker_id}/', {'months': '1'})),
+        ('reports: итоги за все время', get(admin.id, '/reports/')),
+        ('reports: итоги работника за месяц', get(admin.id, '/reports/', {**month, 'user_id': worker_id})),
+        ('reports_export: выгрузка за месяц', get(admin.id, '/reports/export/', month)),
+        ('timesheet: табель за квартал', get(admin.id, '/reports/timesheet/', quarter)),
+        ('absences: прогулы за год по битовым картам', get(admin.id, '/reports/absences/', year)),
+        ('check_in_out: приход и уход в смены', punches(punch_id)),
+        ('check_in_out: приход и уход в журнал отметок', logged_punches),
+        ('compact_punches: свертка журнала в смены', punch_log.compact_pending),
+        ('punch_batch: пакет отметок турникетов', batch),
+        ('kiosk_punch: отметка по пропуску', kiosk),
+    ]
+
+
+def captured(action):
+    """SQL-запросы (без транзакционных команд), которые выполнила action"""
+    cache.clear()
+    badges.clear()
+    with CaptureQueriesContext(connection) as queries:
+        action()
+    return [query['sql'] for query in queries.captured_queries if query['sql'].lstrip().upper().startswith(STATEMENTS)]
+
+
+def shape(sql):
+    """Запрос без значений параметров - для поиска одинаковых запросов"""
+    return re.sub(r"'[^']*'|X'[0-9a-fA-F]*'|\b\d+(\.\d+)?\b", '?', sql)
+
+
+def explain(sql):
+    """Возвращает строки EXPLAIN QUERY PLAN для запроса"""
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def is_full_scan(detail):
+    """Полный проход без индекса по таблице, которая растет со сменами"""
+    words = detail.split()
+    return len(words) > 1 and words[0] == 'SCAN' and words[1] in LARGE_TABLES and 'INDEX' not in detail
+
+
+def main():
+    workers_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 180
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+
+    print(f"Заполнение базы: {workers_count} работников × {days} дней")
+    admin, user_ids = seed(workers_count, days)
+    print(f"Записей посещаемости: {Attendance.objects.count()}\n")
+
+    full_scans = 0
+    seen = set()
+    for title, action in view_queries(admin, user_ids):
+        print(f"== {title}")
+        queries = [sql for sql in captured(action) if shape(sql) not in seen]
+        if not queries:
+            print("   те же запросы, что выше")
+        for sql in queries:
+            if shape(sql) in seen:
+                continue
+            seen.add(shape(sql))
+            print(f"   {sql[:150]}")
+            for detail in explain(sql):
+                marker = '  !! ' if is_full_scan(detail) else '     '
+                full_scans += is_full_scan(detail)
+                print(marker + detail)
+        print()
+
+    if full_scans:
+        print(f"Полных проходов по таблицам смен: {full_scans}")
+        sys.exit(1)
+    print("Полных проходов по таблицам смен нет")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,7 @@ from django.contrib.admin.sites import AdminSite
 from django.utils import timezone
 from attendance.models import Attendance
 from attendance.forms import CustomUserCreationForm, CustomAuthenticationForm
-from attendance.admin import CustomUserAdmin, AttendanceAdmin
+from attendance.admin import CustomUserAdmin, AttendanceAdmin, UserAutocompleteFilter
 
 User = get_user_model()
 
@@ -175,10 +175,10 @@ class MishaAdminTest(TestCase):
     def test_attendance_admin_list_filter(self):
         """Тест фильтров списка посещаемости"""
         list_filter = self.attendance_admin.list_filter
-        expected_filters = ['check_in', 'is_present', 'user']
-
-        for filter_field in expected_filters:
-            self.assertIn(filter_field, list_filter)
+        self.assertIn('is_present', list_filter)
+        # Работник выбирается автодополнением, даты - иерархией по check_in
+        self.assertIn(UserAutocompleteFilter, list_filter)
+        self.assertEqual(self.attendance_admin.date_hierarchy, 'check_in')
 
     def test_attendance_admin_search_fields(self):
         """Тест полей поиска посещаемости"""